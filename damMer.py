@@ -4,44 +4,29 @@
 dam=($(find . -type f -iname "*.fastq.gz" -and -iname "dam_*"))
 exp=($(find . -type f -iname "*.fastq.gz" -and -iname "experiment_*"))
 python3 ~/Desktop/damMer.py -e "${exp[@]}" -c "${dam[@]}"
+#Only_comparisons_of_a_design_file_(experiment,_control,_batch,_replicate):
+python3 ~/Desktop/damMer.py -D design.tsv -f <mail>
+#Batch-_&_replicate-matched_or_k_nearest_controls:
+python3 ~/Desktop/damMer.py -D design.tsv -x nearest -k 2 -f <mail>
+#Add_new_libraries_to_an_existing_project_(only_new_comparisons):
+python3 ~/Desktop/damMer.py -e "${exp[@]}" -c "${dam[@]}" -A -f <mail>
 '''
 
 import argparse
 import os
 import sys
 import logging
-import shutil
 import gzip
 import re
 import errno
-import subprocess
-import shlex
 import time
+import damMer_env
+import damMer_context
+import damMer_broker
+import damMer_plan
 from difflib import SequenceMatcher
 
-shItr = 1
-tmpl = """\
-#!/bin/bash
-#!
-#! Name of the job:
-#SBATCH -J {name}
-#SBATCH --mail-type=END
-#SBATCH -m cyclic:fcyclic
-#SBATCH -N 1
-#SBATCH -n 8
-#SBATCH -p IACT
-#SBATCH --mail-user={mail}
-
-JOBID=$SLURM_JOB_ID
-
-echo -e "JobID: $JOBID\\n======"
-echo "Time: `date`"
-echo "Running on master node: `hostname`"
-echo "Current directory: `pwd`"
-echo -e "\\nExecuting command:\\n==================\\n{SBATCH_CMD}\\n"
-
-eval {SBATCH_CMD}
-"""
+env = damMer_env.Resolver()
 
 ##-----------------##
 ##----Arguments----##
@@ -55,16 +40,41 @@ def parse_args():
         "-e", "--experiment",
         nargs = '*',
         type = str,
-        required = True,
+        default = [],
         help = "List of experimental '*.fastq.gz'-files for the Dam-fusion samples."
         )
     parser.add_argument(
         "-c", "--control",
         nargs = '*',
         type = str,
-        required = True,
+        default = [],
         help = "List of control '*.fastq.gz'-files for the Dam-only samples."
         )
+    parser.add_argument(
+        "-D", "--design",
+        type = str,
+        default = None,
+        help = "TSV-file with columns: experiment, control, batch, replicate."
+        )
+    parser.add_argument(
+        "-x", "--pairing",
+        type = str,
+        default = None,
+        choices = ["all", "design", "matched", "nearest"],
+        help = "Comparisons: all, design rows, same batch & replicate or k nearest controls " + \
+            "(default: 'design' with '--design', else 'all')."
+        )
+    parser.add_argument(
+        "-k", "--nearest",
+        type = int,
+        default = 1,
+        help = "Number of controls per experiment for '--pairing nearest'."
+        )
+    parser.add_argument(
+        "-A", "--add",
+        action = "store_true",
+        help = "Add samples to an existing project: only comparisons without a directory are run."
+        )
     parser.add_argument(
         "-d", "--defaults",
         type = str,
@@ -74,8 +84,8 @@ def parse_args():
     parser.add_argument(
         "-f", "--feedback",
         type = str,
-        required = True,
-        help = "Complete mail address to receive slurm feedback."
+        default = None,
+        help = "Complete mail address to receive slurm feedback (not needed for '--plan')."
         )
     parser.add_argument(
         "-i", "--index",
@@ -107,6 +117,80 @@ def parse_args():
         default = "./damidseq_pipeline_vR.1.pl",
         help = "Path to damidseq_pipeline executable."
         )
+    parser.add_argument(
+        "-j", "--inflight",
+        type = int,
+        default = 8,
+        help = "Maximal number of concurrent 'sbatch'-calls."
+        )
+    parser.add_argument(
+        "-E", "--envcache",
+        type = str,
+        default = damMer_env.cacheDefault,
+        help = "Cache of resolved tools & indices."
+        )
+    parser.add_argument(
+        "-y", "--policy",
+        type = str,
+        default = "auto",
+        choices = damMer_env.policies,
+        help = "Chosen vs. detected tool: 'auto' asks on a terminal only."
+        )
+    parser.add_argument(
+        "-T", "--scratch",
+        type = str,
+        nargs = '?',
+        const = '${TMPDIR:-/tmp}',
+        default = None,
+        help = "Run damidseq jobs in node-local scratch (default: '$TMPDIR')."
+        )
+    parser.add_argument(
+        "-R", "--resubmit",
+        type = int,
+        default = 2,
+        help = "Resubmissions of failed jobs with escalated memory or time."
+        )
+    parser.add_argument(
+        "-B", "--broker",
+        type = str,
+        default = os.environ.get('DAMMER_BROKER'),
+        help = "Shared submission broker directory (default: '$DAMMER_BROKER')."
+        )
+    parser.add_argument(
+        "-I", "--priority",
+        type = int,
+        default = 0,
+        help = "Priority of the project's jobs in the submission broker."
+        )
+    parser.add_argument(
+        "-Z", "--plan",
+        action = "store_true",
+        help = "Dry run: estimate jobs, core-hours, memory, scratch, storage & critical path."
+        )
+    parser.add_argument(
+        "-l", "--chrSize",
+        type = str,
+        default = None,
+        help = "List of chromosome sizes (genome size for '--plan')."
+        )
+    parser.add_argument(
+        "-S", "--slots",
+        type = int,
+        default = 0,
+        help = "Concurrently running jobs for the critical path of '--plan' (0: unlimited)."
+        )
+    parser.add_argument(
+        "-M", "--metrics",
+        type = str,
+        default = None,
+        help = "'*.metrics.jsonl'-file for timing & resource metrics."
+        )
+    parser.add_argument(
+        "-P", "--promfile",
+        type = str,
+        default = None,
+        help = "Prometheus textfile for the node exporter."
+        )
 
     arguments = parser.parse_args()
     return arguments
@@ -115,117 +199,28 @@ def parse_args():
 ##----Functions----##
 ##-----------------##
 
-def filing(allargs):
-    '''Generate ''*.log'-file & save arguments'''
-
-    global prefixq
-    prefix = os.path.basename(dir)
-    global logname
-    logname = dir + '/' + prefix + ".log"
-    sys.stdout.write("\t" + logname + "\n")
-    logging.basicConfig(
-        filename = logname,
-        level = logging.DEBUG,
-        format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
+def filing(ctx, allargs):
+    '''Generate ''*.log'-file of the project & save arguments'''
+
+    prefix = os.path.basename(ctx.dir)
+    ctx.logname = ctx.dir + '/' + prefix + ".log"
+    sys.stdout.write("\t" + ctx.logname + "\n")
+    handler = logging.FileHandler(ctx.logname)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    ctx.log.addHandler(handler)
+    ctx.log.setLevel(logging.DEBUG)
 
     for arg in vars(allargs):
-        logging.info('%s: %s', arg, getattr(allargs,arg))
+        ctx.log.info('%s: %s', arg, getattr(allargs,arg))
     return(prefix)
 
-def checkt(toolPath):
-    '''Checking paths of used tools.'''
+def checkt(toolPath, getVersion=False):
+    '''Checking paths of used tools (cached & non-interactive, cf. 'damMer_env.py').'''
+    return(env.tool(toolPath, getVersion))
 
-    tool = os.path.basename(toolPath)
-    logging.info('Checking: ' + tool)
-    sys.stdout.write('\t'+ tool + '\n')
-
-    if os.path.exists(toolPath):
-        tcho = toolPath
-    else:
-        tcho = ""
-
-    if shutil.which(tool):
-        tdet = shutil.which(tool)
-    else:
-        tdet = ""
-
-    #Tester
-    #sys.stdout.write('\nChosen dir: ' + tcho + '\n')
-    #sys.stdout.write('\nDetected dir: ' + tdet + '\n')
-
-    if tcho == tdet and tdet != "" and tcho != "":
-        ##Chosen_&_detected_dirs_exist_and_are_similar
-
-        logging.info(tool + ' checked: ' + tdet)
-        tuse = tdet
-        return tuse
-
-    elif tcho != tdet and tdet != "" and tcho != "":
-        ##Chosen_&_detected_dirs_exist_but_are_not_similar
-
-        logging.warning('"' + tcho + '" not default installation: "' + tdet + '"')
-        sys.stdout.write(tcho + '" not default installation: "' + tdet + '"\n')
-
-        while True:
-            desc = input('Use: [1 - ' + tcho + '] or [2 - ' + tdet + ']?\n')
-            if desc == "1" or desc == tcho:
-                tuse = tcho
-                break
-            elif desc == "2" or desc == tdet:
-                tuse = tdet
-                break
-            else:
-                sys.stdout.write('\nNot a valid choice.\n')
-                continue
-
-        logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho != tdet and tdet != "" and tcho == "":
-        ##Detected_but_not_chosen_dir_exist
-        logging.warning('"' + toolPath + \
-            '" not default installation: "' + tdet + '"')
-        sys.stdout.write(toolPath + \
-            '" not default installation: "' + tdet + '"\n')
-
-        logging.warning('Not found: ' + toolPath)
-        tuse = tdet
-        logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho != tdet and tdet == "" and tcho != "":
-        ##Chosen_but_not_detected_dir_exist
-        tuse = tcho
-        logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho =="" and tdet == "":
-        ##Neither_chosen_nor_detected_dir_exists
-        logging.error('Not found: ' + toolPath)
-        logging.error('Not found: ' + tool)
-        sys.exit('Error: Not found: ' + tool + \
-            '\nUse python3 bow2map.py --help.\n')
-
-def checki(indices):
-    '''Check path and validity of bowtie2-indices.'''
-
-    logging.info('Checking: ' + indices)
-    sys.stdout.write('\t' + indices + '\n')
-
-    #default = "/mnt/home1/brand/rk565/resources/bowtie2_BDGP6.ensembl/Ensembl_BDGP6_genome"
-    suffices=['.1.bt2', '.2.bt2', '.3.bt2', '.4.bt2', '.rev.1.bt2', '.rev.2.bt2']
-    for s in suffices:
-        index = indices + s
-        if not os.path.isfile(index):
-            logging.error('Index missing: ' + index)
-            sys.exit('Error: Index missing: ' + index + '\n')
-
-    logging.info(os.path.basename(indices) + '-indices validated.')
-    #sys.stdout.write(os.path.basename(indices) + '-indices validated.\n')
+def checki(indices, species=None):
+    '''Check path and validity of bowtie2-indices (cached, cf. 'damMer_env.py').'''
+    env.index(indices, species)
 
 def binary_tester(fqFile):
     '''Test binary status of fastq-file.'''
@@ -243,17 +238,17 @@ def binary_tester(fqFile):
 
     return False
 
-def checkf(fastq):
-    '''Check path and validity of fastq-file.'''
+def checkf(ctx, fastq):
+    '''Check path and validity of fastq-file (logged to the project log).'''
 
-    logging.info('Checking: ' + fastq)
+    ctx.log.info('Checking: ' + fastq)
     sys.stdout.write('\t'+ fastq + '\n')
 
     ##Check_path_of_fastq-file
     if os.path.isfile(fastq):
-        logging.info('File exists: ' + fastq)
+        ctx.log.info('File exists: ' + fastq)
     else:
-        logging.warning('File not found: ' + fastq)
+        ctx.log.warning('File not found: ' + fastq)
         sys.stderr.write('WARNING: File not found: ' + fastq + \
             '\nUse python3 bow2map.py --help.\n')
         return
@@ -261,7 +256,7 @@ def checkf(fastq):
     ##Check_whether_fastq_is_compressed
     ##---------------------------------
     binary = binary_tester(fastq)
-    logging.info(fastq + ' binary: ' + str(binary))
+    ctx.log.info(fastq + ' binary: ' + str(binary))
 
     ##Read_in_sample_of_first_200_lines
     ##---------------------------------
@@ -270,7 +265,7 @@ def checkf(fastq):
             with gzip.open(fastq, "r") as fq:
                 header = [next(fq) for i in range(200)]
         except StopIteration:
-            logging.warning('File has less than 200 lines.')
+            ctx.log.warning('File has less than 200 lines.')
             sys.stderr.write('WARNING: File has less than 200 lines.\n')
             return
 
@@ -280,7 +275,7 @@ def checkf(fastq):
             with open(fastq, "r") as fq:
                 header = [next(fq) for i in range(200)]
         except StopIteration:
-            logging.warning('File has less than 200 lines.')
+            ctx.log.warning('File has less than 200 lines.')
             sys.stderr.write('WARNING: File has less than 200 lines.\n')
             return
 
@@ -292,13 +287,13 @@ def checkf(fastq):
             j += 4
             continue
         else:
-            logging.warning('Read header not starting with "@". line: ' \
+            ctx.log.warning('Read header not starting with "@". line: ' \
                 + str(j) + ' in ' + fastq)
             sys.stderr.write('WARNING: Read header not starting with "@".\n \
-                See: ' + logname + '\n')
+                See: ' + ctx.logname + '\n')
             return
 
-    logging.info("All lines start with '@'.")
+    ctx.log.info("All lines start with '@'.")
 
     ##Check_sequence_for_DNA-bases_&_quality-scores
     ##---------------------------------------------
@@ -309,20 +304,20 @@ def checkf(fastq):
                 k += 4
                 continue
             else:
-                logging.warning('Length of sequence doesn\'t match quality \
+                ctx.log.warning('Length of sequence doesn\'t match quality \
                     value length. line: ' + str(k) + ' in ' + fastq)
                 sys.stderr.write('WARNING: Length of sequence doesn\'t match quality \
-                    value length.\nSee: ' + logname + '\n')
+                    value length.\nSee: ' + ctx.logname + '\n')
                 k += 4
                 continue
         else:
-            logging.warning('Sequence contains non-\'GACT\'-letters. \
+            ctx.log.warning('Sequence contains non-\'GACT\'-letters. \
                 line: ' + str(k) + ' in ' + fastq)
             sys.stderr.write('WARNING: Sequence contains non-\'GACT\'-letters.\n \
-                See: ' + logname + '\n')
+                See: ' + ctx.logname + '\n')
             k += 4
 
-    logging.info(fastq + ' validated.')
+    ctx.log.info(fastq + ' validated.')
     #sys.stdout.write(fastq + ' validated.\n')
 
     return(fastq)
@@ -355,69 +350,103 @@ def matcher(strings):
     sys.stdout.write("\tPrefix: " + match + "\n")
     return(match)
 
-def create_sh(cmd,mailAc):
-    '''Create submission script for current command.'''
-
-    global shItr
-    cmdName = re.compile('\..*').sub('', os.path.basename(cmd.split(" ")[0]))
-    fileName = dir + "/" + str(shItr) + "_" + cmdName + ".sh"
-    with open(fileName, 'w') as shOUT:
-        shOUT.write(tmpl.format(name=cmdName, SBATCH_CMD=cmd, mail=mailAc))
-    shItr += 1
-    return(fileName)
-
-def submit(cmdSH, dpdIDs=''):
+def designReader(path):
     '''
-    Submit the script for the current command.
-    dpdIDs should have format: 'afterok:<jobID1>:<jobID2>:etc.'
+    Read design file: experiment, control, batch & replicate per row
+    (tab-separated; optional header; empty, '-' or 'NA' for missing fields).
+    Returns rows & batch/replicate annotation per file.
     '''
 
-    Sub = "sbatch" + \
-        " --dependency=" + dpdIDs + \
-        " --partition=IACT" + \
-        " -m cyclic:fcyclic" + \
-        " " + cmdSH
-    #sys.stdout.write("\nSub command: " + str(shlex.split(Sub)) + "\n")
-    try:
-        prc = subprocess.Popen(
-            shlex.split(Sub),
-            shell = False,
-            stderr = subprocess.PIPE,
-            stdout = subprocess.PIPE
-            )
-    except Exception as e:
-        sys.exit("devscript_damMer.py aborted due to:\t" + type(e).__name__ + "\n")
+    rows = list()
+    annot = dict()
+    with open(path, 'r') as inFile:
+        for line in inFile:
+            if not line.strip() or line.startswith('#'):
+                continue
+            flds = [x.strip() for x in line.rstrip('\n').split('\t')]
+            flds = [None if x in ['', '-', 'NA'] else x for x in flds] + [None] * 4
+            e, c, b, r = flds[:4]
+            if e == 'experiment':
+                continue
+            if e is None and c is None:
+                sys.exit('Design row without files: ' + line)
+            rows.append((e, c))
+            for f in [e, c]:
+                if f is not None:
+                    annot[f] = (b, r)
+    return(rows, annot)
+
+def annotation(f, annot):
+    '''Batch & replicate of a file: design file or filename (e.g., '_rep2_').'''
+
+    if f in annot:
+        return(annot[f])
+    rep = re.compile('(?i)(?:^|[_.-])rep(\d+)(?=[_.-])').search(os.path.basename(f))
+    return((None, rep.group(1) if rep else None))
+
+def pairName(e, d):
+    '''Name of the subdirectory of a comparison: '<exp>-vs-<dam>'.'''
+
+    eb = re.compile('\..*\..*|\..*').sub('', os.path.basename(e))
+    db = re.compile('\..*\..*|\..*').sub('', os.path.basename(d))
+    return(eb + "-vs-" + db)
+
+def pairer(exps, ctrls, strategy, rows=None, annot=None, k=1, log=None):
+    '''
+    Experiment x control comparisons to run:
+    'all' - every experiment vs every control (N x M);
+    'design' - rows of the design file with both files;
+    'matched' - controls of the same batch & replicate;
+    'nearest' - the k controls of the same batch & closest replicate.
+    '''
 
-    jobID = str(prc.communicate()[0].decode("utf-8").split(" ")[3]).rstrip()
-    #sys.stdout.write("ID of current job: " + jobID + "\n")
-    return(jobID)
+    annot = annot if annot else dict()
+    if strategy == "all":
+        pairs = [(e, d) for e in exps for d in ctrls]
+    elif strategy == "design":
+        pairs = [(e, d) for e, d in rows if e in exps and d in ctrls]
+    else:
+        pairs = list()
+        for e in exps:
+            eb, er = annotation(e, annot)
+            if strategy == "matched":
+                pairs += [(e, d) for d in ctrls if annotation(d, annot) == (eb, er)]
+                continue
+            def distance(d):
+                db, dr = annotation(d, annot)
+                try:
+                    rd = abs(int(er) - int(dr))
+                except (TypeError, ValueError):
+                    rd = 0 if er == dr else 1
+                return((db != eb, rd))
+            pairs += [(e, d) for d in sorted(ctrls, key=distance)[:k]]
+
+    ##Unique_comparisons_in_order
+    pairs = list(dict.fromkeys(pairs))
+    for e in exps:
+        if not any(p[0] == e for p in pairs):
+            if log:
+                log.warning('No control paired with: ' + e)
+            sys.stderr.write('WARNING: No control paired with: ' + e + '\n')
+    return(pairs)
 
-def checkFin(jobIDs):
-    '''Check all provided jobIDs are no longer registered by slurm.'''
+def checkFin(ctx, jobIDs):
+    '''Wait until all provided jobIDs finished; failed jobs are resubmitted. Returns failed jobIDs.'''
 
     sys.stdout.write('\nWaiting for cluster.\n')
-    rest = True
-    while rest == True:
-        chk = subprocess.check_output(['squeue', '-h', '-o', '%i'])
-        chk = list(chk.decode("utf-8").strip().split())
-        if not set(jobIDs).intersection(chk):
-            rest = False
-            break
-        else:
-            time.sleep(1)
-            continue
+    done, failed = ctx.sup.wait(jobIDs)
     sys.stdout.write('Job(s) finished.\n')
+    return(failed)
 
-def checkQue(jobIDs):
-    '''Check if jobs are registered by slurm.'''
+def checkQue(ctx, jobIDs):
+    '''Check if jobs are registered by slurm; failed jobs are resubmitted (cf. 'damMer_retry.py').'''
 
     sys.stdout.write('\nWaiting for cluster.\n')
-    chk = subprocess.check_output(['squeue', '-h', '-o', '%i'])
-    chk = list(chk.decode("utf-8").strip().split())
-    if set(jobIDs).issubset(chk):
-        sys.stdout.write('Job(s) running.\n')
+    done, failed = ctx.sup.check(jobIDs)
+    if failed:
+        sys.stdout.write('Job(s) failed:\t' + ', '.join(ctx.sup.current(j) for j in failed) + '\n')
     else:
-        sys.exit("One or more job(s) not running.\n")
+        sys.stdout.write('Job(s) running.\n')
 
 ##---------------------##
 ##----Main_workflow----##
@@ -426,10 +455,26 @@ def checkQue(jobIDs):
 def main():
     args = parse_args()
 
-    ##Set_global_variable_'dir'
-    ##-------------------------
-    global dir
-    dir = os.path.dirname(os.path.abspath(args.experiment[0]))
+    ##Design_file:_experiments_&_controls_from_its_rows
+    ##-------------------------------------------------
+    rows = None
+    annot = None
+    if args.design:
+        rows, annot = designReader(args.design)
+        for e, d in rows:
+            if e is not None and e not in args.experiment:
+                args.experiment.append(e)
+            if d is not None and d not in args.control:
+                args.control.append(d)
+    if args.pairing == None:
+        args.pairing = "design" if args.design else "all"
+    if args.pairing == "design" and not args.design:
+        sys.exit("'--pairing design' requires '--design'.\n")
+    if not args.plan and not args.feedback:
+        sys.exit("'--feedback' required (unless '--plan').\n")
+    if not args.experiment or not args.control:
+        sys.exit("Experimental & control '*.fastq.gz'-files required: " + \
+            "'--experiment' & '--control' or '--design'.\n")
 
     ##Set_variable_for_index_directory
     ##--------------------------------
@@ -454,74 +499,119 @@ def main():
         else:
             sys.exit('Unsupported species: --defaults=[dm6/mm10].\n')
 
+    ##Dry_run:_plan_all_comparisons_without_writing_or_submitting
+    ##------------------------------------------------------------
+    if args.plan:
+        dir = os.path.dirname(os.path.abspath(args.experiment[0]))
+        exps = [f for f in args.experiment if os.path.isfile(f)]
+        ctrls = [f for f in args.control if os.path.isfile(f)]
+        pairs = [
+            (e, d) for e, d in pairer(exps, ctrls, args.pairing, rows, annot, args.nearest) \
+            if not (args.add and os.path.isdir(dir + "/" + pairName(e, d) + "/"))
+            ]
+        if not pairs:
+            sys.exit('No comparisons to run.\n')
+        damMer_plan.plan(pairs, args.chrSize, args.gatcfrag, args.defaults, args.slots)
+        sys.stdout.write('\nNothing submitted (--plan).\n')
+        return
+
+    ##Project_context:_directory,_scripts,_submission_&_metrics
+    ##---------------------------------------------------------
+    dir = os.path.dirname(os.path.abspath(args.experiment[0]))
+    ctx = damMer_context.Context(
+        dir, args.feedback, args.scratch,
+        ledger = dir + '/' + os.path.basename(dir) + ".jobs.jsonl",
+        retries = args.resubmit,
+        broker = damMer_broker.Broker(args.broker, os.path.basename(dir), args.priority) \
+            if args.broker else None
+        )
+    rec = ctx.rec
+
+    ##Initiate_metrics
+    ##----------------
+    if args.metrics == None:
+        args.metrics = dir + '/' + os.path.basename(dir) + ".metrics.jsonl"
+    rec.configure('damMer.py', args.metrics, args.promfile, os.path.basename(dir))
+    ctx.sub.configure(inflight=args.inflight)
+    env.configure(args.envcache, args.policy)
+
     ##Generate_&_initiate_logfile
     ##---------------------------
     sys.stdout.write('\n>Logfile\n')
-    preOut = filing(args)
+    preOut = filing(ctx, args)
 
     ##Checking_indices_&_executables
     ##------------------------------
-    sys.stdout.write('\n>Checking executables\n')
-    bowuse = checkt(args.bow2dir)
-    samuse = checkt(args.samdir)
-    damuse = checkt(args.damidseq)
-    sys.stdout.write('\n>Checking indices\n')
-    checki(args.index)
+    with rec.stage('checkExecutables'):
+        sys.stdout.write('\n>Checking executables\n')
+        bowuse = checkt(args.bow2dir, getVersion=True)
+        samuse = checkt(args.samdir, getVersion=True)
+        damuse = checkt(args.damidseq, getVersion=True)
+    with rec.stage('checkIndices'):
+        sys.stdout.write('\n>Checking indices\n')
+        checki(args.index, args.defaults)
 
     ##Checking_all_fastq-files
     ##------------------------
-    sys.stdout.write("\n>Checking '*.fastq.gz'-files\n")
-    exps = list()
-    for f in args.experiment:
-        fckd = checkf(f)
-        if fckd is not None:
-            exps.append(fckd)
-
-    expsPre = matcher(exps)
-    #expsPre = re.compile('_|\.').sub('', expsPre)
-
-    ctrls = list()
-    for c in args.control:
-        cckd = checkf(c)
-        if cckd is not None:
-            ctrls.append(cckd)
-
-    ctrlsPre = matcher(ctrls)
-    #ctrlsPre = re.compile('_|\.').sub('', ctrlsPre)
+    with rec.stage('checkFastq'):
+        sys.stdout.write("\n>Checking '*.fastq.gz'-files\n")
+        exps = list()
+        for f in args.experiment:
+            fckd = checkf(ctx, f)
+            if fckd is not None:
+                exps.append(fckd)
+
+        expsPre = matcher(exps)
+        #expsPre = re.compile('_|\.').sub('', expsPre)
+
+        ctrls = list()
+        for c in args.control:
+            cckd = checkf(ctx, c)
+            if cckd is not None:
+                ctrls.append(cckd)
+
+        ctrlsPre = matcher(ctrls)
+        #ctrlsPre = re.compile('_|\.').sub('', ctrlsPre)
 
     ##Create_WDs_&_copy_*.fastq.gz-files
     ##----------------------------------
-    sys.stdout.write('\n>Create directories & copy files\n')
-    dirs = list()
-    jobIDs = list()
-    for e in exps:
-        eb = os.path.basename(e)
-        eb = re.compile('\..*\..*|\..*').sub('', eb)
-
-        for d in ctrls:
-            db = os.path.basename(d)
-            db = re.compile('\..*\..*|\..*').sub('', db)
-
-            dirName = dir + "/" + eb + "-vs-" + db + "/"
-            sys.stdout.write('\t' + eb + '-vs-' + db + '/\n')
+    with rec.stage('submitCopy'):
+        sys.stdout.write('\n>Create directories & copy files\n')
+        dirs = list()
+        jobIDs = list()
+        pairs = pairer(exps, ctrls, args.pairing, rows, annot, args.nearest, ctx.log)
+        if not pairs:
+            sys.exit('No comparisons to run.\n')
+        ctx.log.info('Pairing (' + args.pairing + '): ' + str(len(pairs)) + ' of ' + \
+            str(len(exps) * len(ctrls)) + ' comparisons')
+        for e, d in pairs:
+            dirName = dir + "/" + pairName(e, d) + "/"
+            if args.add and os.path.isdir(dirName):
+                sys.stdout.write('\t' + pairName(e, d) + '/\t(exists)\n')
+                continue
+            sys.stdout.write('\t' + pairName(e, d) + '/\n')
             evalDir(dirName)
             dirs.append(dirName)
 
             ##Create_copy_script
             cpy = "cp" + \
-                " " + e + \
+                " " + os.path.abspath(e) + \
                 " " + dirName + \
-                "; cp " + d + \
+                "; cp " + os.path.abspath(d) + \
                 " " + dirName
-            cpSH = create_sh(cpy,args.feedback)
+            cpSH = ctx.script(cpy)
             #sys.stdout.write("\nList script: " + cpSH + "\n")
 
-            crnID = submit(cpSH)
+            crnID = ctx.submit(cpSH)
             jobIDs.append(crnID)
 
-    #jobIDs = [str(elem) for elem in jobIDs]
-    cpJobs = 'afterok:' + (':').join(jobIDs)
-    cpJobs = re.sub('\n', '', cpJobs)
+        if not dirs:
+            sys.exit('No new comparisons to run.\n')
+        jobIDs = ctx.sub.collect(jobIDs)
+        #jobIDs = [str(elem) for elem in jobIDs]
+        cpJobs = 'afterok:' + (':').join(jobIDs)
+        cpJobs = re.sub('\n', '', cpJobs)
+    cpIDs = jobIDs
 
     ##Tester-----------------------------------------------------
     #
@@ -532,56 +622,79 @@ def main():
 
     ##Wait_until_all_dirs_include_both_'*.fastq.gz'-files
     ##---------------------------------------------------
-    sys.stdout.write("\n>Check for presence of all '*.fastq.gz'-files\n")
-    rest = True
-    sys.stdout.write('\tWaiting for cluster.\n')
-    while rest == True:
-        cou = 0
-        for dirCurr in dirs:
-            if len(os.listdir(dirCurr))==2:
-                cou += 1
-                if not cou == len(dirs):
-                    continue
+    with rec.stage('waitCopy'):
+        sys.stdout.write("\n>Check for presence of all '*.fastq.gz'-files\n")
+        rest = True
+        sys.stdout.write('\tWaiting for cluster.\n')
+        ##Resubmit_failed_copy_jobs_&_drop_pairs_failing_beyond_budget
+        done, failed = ctx.sup.wait(cpIDs)
+        for dirCurr, cpID in list(zip(dirs, cpIDs)):
+            if cpID in failed:
+                sys.stdout.write('\tCopy failed:\t' + dirCurr + '\n')
+                dirs.remove(dirCurr)
+        if not dirs:
+            sys.exit('All copy jobs failed.\n')
+        cpJobs = 'afterok:' + (':').join(ctx.sup.current(j) for j in done)
+        while rest == True:
+            cou = 0
+            for dirCurr in dirs:
+                if len(os.listdir(dirCurr))==2:
+                    cou += 1
+                    if not cou == len(dirs):
+                        continue
+                    else:
+                        rest = False
+                        break
                 else:
-                    rest = False
+                    time.sleep(1)
                     break
-            else:
-                time.sleep(1)
-                break
-    sys.stdout.write('\tAll files copied.\n')
+        sys.stdout.write('\tAll files copied.\n')
 
     ##Run_damid_for_all_combinations
     ##------------------------------
-    sys.stdout.write("\t>Initialize damidseq_pipeline_vR.1 in all directories\n")
-    jobIDs = list()
-    for cwd in dirs:
-        os.chdir(cwd)
-        sys.stdout.write('\t' + cwd + '\n')
-        fs = [f for f in os.listdir(cwd) if os.path.isfile(os.path.join(cwd, f))]
-        dam = [f for f in fs if re.search(ctrlsPre, f)]
-        #sys.stdout.write('dam: '+str(dam)+'\n')
-        exp = [f for f in fs if re.search(expsPre, f)]
-        #sys.stdout.write('exp: '+str(exp)+'\n')
-
-        ##'damid'_command
-        dsq = damuse + \
-            " --bins=300" + \
-            " --gatc_frag_file=" + args.gatcfrag + \
-            " --bowtie2_genome_dir=" + args.index + \
-            " --samtools_path=" + os.path.dirname(samuse) + "/" + \
-            " --bowtie2_path=" + os.path.dirname(bowuse) + "/" + \
-            " --dam=" + cwd + dam[0] + \
-            " " + cwd + exp[0]
-        dsqSH = create_sh(dsq,args.feedback)
-        #sys.stdout.write("\nList script:\t" + dsqSH + "\n")
-
-        jobID = submit(dsqSH, dpdIDs=cpJobs)
-        jobIDs.append(jobID)
+    with rec.stage('submitDamidseq'):
+        sys.stdout.write("\t>Initialize damidseq_pipeline_vR.1 in all directories\n")
+        jobIDs = list()
+        for cwd in dirs:
+            sys.stdout.write('\t' + cwd + '\n')
+            fs = [f for f in os.listdir(cwd) if os.path.isfile(os.path.join(cwd, f))]
+            dam = [f for f in fs if re.search(ctrlsPre, f)]
+            #sys.stdout.write('dam: '+str(dam)+'\n')
+            exp = [f for f in fs if re.search(expsPre, f)]
+            #sys.stdout.write('exp: '+str(exp)+'\n')
+
+            ##'damid'_command_(staged_'*.fastq.gz'-files_by_name_in_scratch)
+            src = '' if args.scratch else cwd
+            dsq = damuse + \
+                " --bins=300" + \
+                " --gatc_frag_file=" + args.gatcfrag + \
+                " --bowtie2_genome_dir=" + args.index + \
+                " --samtools_path=" + os.path.dirname(samuse) + "/" + \
+                " --bowtie2_path=" + os.path.dirname(bowuse) + "/" + \
+                " --dam=" + src + dam[0] + \
+                " " + src + exp[0]
+            dsqSH = ctx.script(dsq, stage=[cwd + dam[0], cwd + exp[0]])
+            #sys.stdout.write("\nList script:\t" + dsqSH + "\n")
+
+            jobID = ctx.submit(dsqSH, dpdIDs=cpJobs, cwd=cwd)
+            jobIDs.append(jobID)
+        jobIDs = ctx.sub.collect(jobIDs)
 
     ##Ensure_all_jobs_are_running
     ##---------------------------
-    sys.stdout.write('\n>Check all jobs are registered by slurm\n')
-    checkQue(jobIDs)
+    with rec.stage('checkQue'):
+        sys.stdout.write('\n>Check all jobs are registered by slurm\n')
+        checkQue(ctx, jobIDs)
+
+    ##Wait_for_the_broker_to_release_all_held_jobs
+    ##--------------------------------------------
+    if ctx.broker:
+        ctx.broker.drain()
+
+    ##Export_metrics_of_finished_copy_jobs
+    ##------------------------------------
+    rec.harvest(cpIDs)
+    rec.close()
 
 if __name__ == '__main__':
     main()
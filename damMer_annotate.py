@@ -0,0 +1,276 @@
+#!/usr/local/bin/python3
+'''
+#Annotate_all_'*.reproPeak'-files_of_a_'*_peaks'-folder:
+python3 damMer_annotate.py -p *_peaks/*.reproPeak -t BDGP6.bm.TssBiomart.ProteinCoding.bed
+'''
+
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+import damMer_io
+
+TSScols = [
+    'tssChr',
+    'tssStart',
+    'tssEnd',
+    'tssID',
+    'nd',
+    'tssStrand',
+    'ensembl_gene_id',
+    'external_gene_name',
+    'gene_biotype'
+    ]
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Annotate '*.reproPeak'-/'*.mergePeak'-files with TSSs."
+        )
+
+    parser.add_argument(
+        "-p", "--peaks",
+        nargs = '*',
+        type = str,
+        required = True,
+        help = "List of '*.reproPeak'- or '*.mergePeak'-files."
+        )
+    parser.add_argument(
+        "-t", "--tss",
+        type = str,
+        required = True,
+        help = "Bed-formatted TSSs (see 'create_annotations.Rmd')."
+        )
+    parser.add_argument(
+        "-m", "--mode",
+        type = str,
+        default = "nearest",
+        choices = ["nearest", "overlap", "window"],
+        help = "Report nearest TSS, overlapping TSSs or TSSs within '--window'."
+        )
+    parser.add_argument(
+        "-w", "--window",
+        type = int,
+        default = 1000,
+        help = "Distance in bp up- & downstream of peaks for '--mode window'."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def tssReader(file):
+    '''Read bed-formatted TSSs as generated in 'create_annotations.Rmd'.'''
+
+    try:
+        df = pd.read_csv(
+            file,
+            sep = '\t',
+            header = None,
+            usecols = range(len(TSScols)),
+            names = TSScols,
+            dtype = {
+                'tssChr': str,
+                'tssStart': np.int64,
+                'tssEnd': np.int64
+                }
+            )
+    except pd.errors.EmptyDataError:
+        sys.exit("\nEmpty file:\t" + file + "\n")
+
+    df['tssChr'] = damMer_io.chromosomes(df['tssChr'])
+    return(df)
+
+def indexer(tss):
+    '''
+    Build sorted TSS-coordinates per chromosome once.
+    Returns {chr: (sorted tssStart, row positions in 'tss')}.
+    '''
+
+    index = dict()
+    for chrom, grp in tss.groupby('tssChr', sort=False, observed=True):
+        order = np.argsort(grp['tssStart'].to_numpy(), kind='mergesort')
+        index[chrom] = (
+            grp['tssStart'].to_numpy()[order],
+            grp.index.to_numpy()[order]
+            )
+    return(index)
+
+def nearest(index, peaks):
+    '''
+    Closest TSS for every peak (cf. 'bedtools closest -d -t first').
+    Distance is 0 for TSSs within the peak.
+    '''
+
+    hit = np.full(len(peaks), -1, dtype=np.int64)
+    dist = np.full(len(peaks), -1, dtype=np.int64)
+
+    for chrom, pos in peaks.groupby('chr', sort=False, observed=True).indices.items():
+        if chrom not in index:
+            continue
+        tssPos, tssRow = index[chrom]
+        s = peaks['start'].to_numpy()[pos]
+        e = peaks['end'].to_numpy()[pos]
+
+        ##Candidates_up-_&_downstream_of_peak_start
+        ##-----------------------------------------
+        right = np.searchsorted(tssPos, s, side='left')
+        left = right - 1
+        rValid = right < len(tssPos)
+        lValid = left >= 0
+
+        rPos = tssPos[np.minimum(right, len(tssPos) - 1)]
+        lPos = tssPos[np.maximum(left, 0)]
+        rDist = np.where(rPos < e, 0, rPos - e + 1)
+        lDist = s - lPos
+        rDist = np.where(rValid, rDist, np.iinfo(np.int64).max)
+        lDist = np.where(lValid, lDist, np.iinfo(np.int64).max)
+
+        ##Ties_resolved_towards_first_TSS
+        useLeft = lDist <= rDist
+        hit[pos] = np.where(
+            useLeft,
+            tssRow[np.maximum(left, 0)],
+            tssRow[np.minimum(right, len(tssPos) - 1)]
+            )
+        dist[pos] = np.where(useLeft, lDist, rDist)
+
+    return(hit, dist)
+
+def windower(index, peaks, window=0):
+    '''
+    All TSSs within 'window' bp of every peak.
+    'window=0' reports TSSs overlapping the peak.
+    '''
+
+    peakHits = list()
+    tssHits = list()
+    distHits = list()
+
+    for chrom, pos in peaks.groupby('chr', sort=False, observed=True).indices.items():
+        if chrom not in index:
+            continue
+        tssPos, tssRow = index[chrom]
+        s = peaks['start'].to_numpy()[pos]
+        e = peaks['end'].to_numpy()[pos]
+
+        lo = np.searchsorted(tssPos, s - window, side='left')
+        hi = np.searchsorted(tssPos, e + window, side='left')
+        cnt = hi - lo
+
+        ##Expand_hits_without_python_loops
+        ##--------------------------------
+        pk = np.repeat(np.arange(len(pos)), cnt)
+        offs = np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        ts = lo[pk] + offs
+
+        t = tssPos[ts]
+        d = np.where(
+            t < s[pk],
+            s[pk] - t,
+            np.where(t >= e[pk], t - e[pk] + 1, 0)
+            )
+        peakHits.append(pos[pk])
+        tssHits.append(tssRow[ts])
+        distHits.append(d)
+
+    if not peakHits:
+        empty = np.zeros(0, dtype=np.int64)
+        return(empty, empty, empty)
+
+    peakHits = np.concatenate(peakHits)
+    tssHits = np.concatenate(tssHits)
+    distHits = np.concatenate(distHits)
+    order = np.lexsort((distHits, peakHits))
+    return(peakHits[order], tssHits[order], distHits[order])
+
+def annotater(index, tss, peaks, mode="nearest", window=1000):
+    '''Join peaks & TSSs (cf. 'annotater()' in 'annotate_peaks.Rmd').'''
+
+    if mode == "nearest":
+        pkRow = np.arange(len(peaks))
+        tssRow, dist = nearest(index, peaks)
+    else:
+        pkRow, tssRow, dist = windower(
+            index,
+            peaks,
+            window if mode == "window" else 0
+            )
+
+    left = peaks.iloc[pkRow].reset_index(drop=True)
+    right = (
+        tss
+        .reindex(tssRow)
+        .reset_index(drop=True)
+        .astype({'tssChr': object})
+        .fillna({
+            c: '.' if c not in ['tssStart', 'tssEnd'] else -1 \
+            for c in TSScols
+            })
+        )
+    right['tssStart'] = right['tssStart'].astype(np.int64)
+    right['tssEnd'] = right['tssEnd'].astype(np.int64)
+
+    anno = pd.concat([left, right], axis=1).assign(distance = dist)
+    return(anno.sort_values(by=['chr', 'start'], kind='mergesort'))
+
+def writer(df, out):
+    '''Write out annotated peaks.'''
+
+    try:
+        df.to_csv(
+            path_or_buf = out,
+            sep = '\t',
+            header = False,
+            index = False
+            )
+    except IOError as e:
+        sys.exit("Error: cannot write file\n\tError message: {0}\n".format(e))
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    ##Index_TSSs_once
+    ##---------------
+    sys.stdout.write('\n>Index TSSs\n')
+    tss = tssReader(args.tss)
+    index = indexer(tss)
+    sys.stdout.write(
+        '\tTSSs:\t' + str(len(tss)) + '\n' + \
+        '\tChromosomes:\t' + str(len(index)) + '\n'
+        )
+
+    ##Annotate_all_peak_files
+    ##-----------------------
+    sys.stdout.write('\n>Annotate peaks - ' + args.mode + '\n')
+    for pk in args.peaks:
+        if not os.path.isfile(pk):
+            sys.stderr.write('WARNING: File not found: ' + pk + '\n')
+            continue
+
+        peaks = damMer_io.peaks(pk, cols=['chr', 'start', 'end', 'name'], empty=None)
+        anno = annotater(index, tss, peaks, args.mode, args.window)
+        out = pk + '.' + args.mode
+        writer(anno, out)
+        sys.stdout.write(
+            '\t' + os.path.basename(out) + \
+            '\t' + str(len(peaks)) + ' peaks' + \
+            '\t' + str(len(anno)) + ' annotations\n'
+            )
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,565 @@
+#!/usr/local/bin/python3
+'''
+#Benchmark_all_python_stages_on_synthetic_dm6-data_at_10%_genome_size:
+python3 damMer_bench.py -d dm6 -x 0.1 -j bench_dm6.json
+#Compare_against_earlier_report:
+python3 damMer_bench.py -d dm6 -x 0.1 -j bench_new.json -B bench_dm6.json
+'''
+
+import argparse
+import os
+import sys
+import re
+import json
+import gzip
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+import statistics
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+##Chromosome_sizes_&_approximate_mean_GATC-fragment_length
+CHROMS = {
+    'dm6': {
+        '2L': 23513712, '2R': 25286936, '3L': 28110227, '3R': 32079331,
+        '4': 1348131, 'X': 23542271, 'Y': 3667352
+        },
+    'mm10': {
+        '1': 195471971, '2': 182113224, '3': 160039680, '4': 156508116,
+        '5': 151834684, '6': 149736546, '7': 145441459, '8': 129401213,
+        '9': 124595110, '10': 130694993, '11': 122082543, '12': 120129022,
+        '13': 120421639, '14': 124902244, '15': 104043685, '16': 98207768,
+        '17': 94987271, '18': 90702639, '19': 61431566, 'X': 171031299,
+        'Y': 91744698
+        }
+    }
+GATCmean = {'dm6': 400, 'mm10': 380}
+PEAKS = {'dm6': 5000, 'mm10': 30000}
+STAGES = ('validation', 'renaming', 'peaks', 'normalization', 'averaging')
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Stage-level benchmarks of the damMer scripts on synthetic data."
+        )
+
+    parser.add_argument(
+        "-d", "--defaults",
+        type = str,
+        default = "dm6",
+        choices = list(CHROMS.keys()),
+        help = "Species to simulate."
+        )
+    parser.add_argument(
+        "-x", "--scale",
+        type = float,
+        default = 1.0,
+        help = "Fraction of the genome size to simulate."
+        )
+    parser.add_argument(
+        "-e", "--experiment",
+        type = int,
+        default = 3,
+        help = "Number of Dam-fusion samples."
+        )
+    parser.add_argument(
+        "-c", "--control",
+        type = int,
+        default = 2,
+        help = "Number of Dam-only samples."
+        )
+    parser.add_argument(
+        "-r", "--reads",
+        type = int,
+        default = 100000,
+        help = "Reads per simulated '*.fastq.gz'-file."
+        )
+    parser.add_argument(
+        "-s", "--stages",
+        nargs = '*',
+        type = str,
+        default = list(STAGES),
+        choices = list(STAGES),
+        help = "Stages to benchmark."
+        )
+    parser.add_argument(
+        "-t", "--repeats",
+        type = int,
+        default = 3,
+        help = "Repeats per stage."
+        )
+    parser.add_argument(
+        "-n", "--quantile",
+        type = str,
+        default = None,
+        help = "Path to 'quantile_norm_bedgraph.pl' (normalization stage)."
+        )
+    parser.add_argument(
+        "-a", "--average",
+        type = str,
+        default = None,
+        help = "Path to 'average_tracks.pl' (averaging stage)."
+        )
+    parser.add_argument(
+        "-w", "--workdir",
+        type = str,
+        default = None,
+        help = "Directory for synthetic data (default: temporary directory)."
+        )
+    parser.add_argument(
+        "-k", "--keep",
+        action = 'store_true',
+        help = "Keep synthetic data."
+        )
+    parser.add_argument(
+        "-j", "--json",
+        type = str,
+        default = "damMer_bench.json",
+        help = "Machine-readable report."
+        )
+    parser.add_argument(
+        "-B", "--baseline",
+        type = str,
+        default = None,
+        help = "Earlier report to compare against."
+        )
+    parser.add_argument(
+        "-l", "--tolerance",
+        type = float,
+        default = 0.2,
+        help = "Relative slowdown reported as regression."
+        )
+    parser.add_argument(
+        "--seed",
+        type = int,
+        default = 0,
+        help = "Random seed for the generators."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##------------------##
+##----Generators----##
+##------------------##
+
+def chromSizes(species, scale):
+    '''Scaled chromosome sizes.'''
+    return({c: max(int(s * scale), 1000) for c, s in CHROMS[species].items()})
+
+def chromWriter(chroms, out):
+    '''Write '*.chrom.sizes'-file.'''
+
+    with open(out, 'w') as outFile:
+        for c, s in chroms.items():
+            outFile.write(c + '\t' + str(s) + '\n')
+    return(out)
+
+def fragments(chroms, species, seed):
+    '''Random GATC-fragment boundaries per chromosome.'''
+
+    rng = np.random.default_rng(seed)
+    frags = list()
+    for c, s in chroms.items():
+        n = int(s / GATCmean[species] * 1.2) + 10
+        pos = np.cumsum(rng.geometric(1 / GATCmean[species], size=n))
+        pos = pos[pos < s]
+        pos = np.concatenate([[1], pos])
+        frags.append(pd.DataFrame({
+            'chr': c,
+            'start': pos[:-1],
+            'end': pos[1:]
+            }))
+    return(pd.concat(frags, ignore_index=True))
+
+def gffGen(frags, out):
+    '''Write '*.GATC.gff'-file as generated by 'gatc.track.maker.pl'.'''
+
+    (
+        frags
+        .assign(source = '.', type = '.', score = '.', strand = '+', frame = '.', name = '.')
+        .loc[:, ['chr', 'source', 'type', 'start', 'end', 'score', 'strand', 'frame', 'name']]
+        .to_csv(out, sep='\t', header=False, index=False)
+        )
+    return(out)
+
+def fastqGen(out, reads, seed, length=50):
+    '''Write gzipped '*.fastq.gz'-file with random GATC-anchored reads.'''
+
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    seqs = bases[rng.integers(0, 4, size=(reads, length))]
+    seqs[:, :4] = np.frombuffer(b'GATC', dtype=np.uint8)
+    qual = b'I' * length
+    with gzip.open(out, 'wb', compresslevel=1) as fq:
+        for i in range(reads):
+            fq.write(
+                b'@read' + str(i).encode() + b'\n' + \
+                seqs[i].tobytes() + b'\n+\n' + qual + b'\n'
+                )
+    return(out)
+
+def bedgraphGen(frags, out, seed, dam=False):
+    '''Write '*.gatc.bedgraph'-file with log2-ratios per GATC-fragment.'''
+
+    rng = np.random.default_rng(seed)
+    score = rng.normal(0.0 if dam else 0.2, 1.0, size=len(frags))
+    (
+        frags
+        .assign(chr = 'chr' + frags['chr'])
+        .assign(score = np.round(score, 4))
+        .to_csv(out, sep='\t', header=False, index=False)
+        )
+    return(out)
+
+def broadPeakGen(chroms, out, n, seed):
+    '''Write MACS2 '*.broadPeak'-file.'''
+
+    rng = np.random.default_rng(seed)
+    names = list(chroms.keys())
+    sizes = np.array([chroms[c] for c in names], dtype=np.float64)
+    chrIdx = rng.choice(len(names), size=n, p=sizes / sizes.sum())
+    width = rng.integers(200, 5000, size=n)
+    start = (rng.random(n) * (sizes[chrIdx] - width)).astype(np.int64)
+    start = np.maximum(start, 0)
+    qval = rng.exponential(50, size=n)
+    df = pd.DataFrame({
+        'chr': ['chr' + names[i] for i in chrIdx],
+        'start': start,
+        'end': start + width,
+        'name': ['peak_' + str(i + 1) for i in range(n)],
+        'score': np.minimum((qval * 10).astype(int), 1000),
+        'strand': '.',
+        'fc': np.round(1 + rng.exponential(2, size=n), 5),
+        'neglog10pval': np.round(qval + rng.exponential(5, size=n), 5),
+        'neglog10qval': np.round(qval, 5)
+        })
+    df.to_csv(out, sep='\t', header=False, index=False)
+    return(out)
+
+def pairGen(dirName, exp, dam, bG, seed):
+    '''Pair directory as left by 'damidseq_pipeline_vR.1.pl' before renaming.'''
+
+    os.makedirs(dirName, exist_ok=True)
+    with open(os.path.join(dirName, 'slurm-' + str(seed) + '.out'), 'w') as sl:
+        sl.write(
+            '*** Reading data files ***\n' + \
+            'Dam\t' + os.path.join(dirName, dam + '.fastq.gz') + '\n' + \
+            'Exp\t' + os.path.join(dirName, exp + '.fastq.gz') + '\n' + \
+            '  Using Dam as Dam control.\n' + \
+            'All done.\n'
+            )
+    for f in ['Dam-ext300.bam', 'Exp-ext300.bam', 'pipeline-' + str(seed) + '.log']:
+        open(os.path.join(dirName, f), 'w').close()
+    shutil.copy2(bG, os.path.join(dirName, 'Dam-DamOnly.gatc.bedgraph'))
+    shutil.copy2(bG, os.path.join(dirName, 'Exp-vs-Dam.gatc.bedgraph'))
+
+def generator(args, work):
+    '''Generate the complete synthetic project.'''
+
+    chroms = chromSizes(args.defaults, args.scale)
+    data = {'chroms': chromWriter(chroms, os.path.join(work, args.defaults + '.chrom.sizes'))}
+
+    sys.stdout.write('\tGATC-fragments\n')
+    frags = fragments(chroms, args.defaults, args.seed)
+    data['gff'] = gffGen(frags, os.path.join(work, args.defaults + '.GATC.gff'))
+    data['fragments'] = len(frags)
+
+    sys.stdout.write("\t'*.fastq.gz'-files\n")
+    fqDir = os.path.join(work, 'fastq')
+    os.makedirs(fqDir, exist_ok=True)
+    exps = ['Exp_' + str(i + 1) for i in range(args.experiment)]
+    dams = ['Dam_' + str(i + 1) for i in range(args.control)]
+    data['fastq'] = [
+        fastqGen(os.path.join(fqDir, s + '.fastq.gz'), args.reads, args.seed + i) \
+        for i, s in enumerate(exps + dams)
+        ]
+
+    sys.stdout.write("\t'*.gatc.bedgraph'-files\n")
+    trDir = os.path.join(work, 'tracks')
+    os.makedirs(trDir, exist_ok=True)
+    data['bedgraph'] = [
+        bedgraphGen(frags, os.path.join(trDir, e + '-vs-' + d + '.gatc.bedgraph'), \
+            args.seed + 100 + i * len(dams) + j) \
+        for i, e in enumerate(exps) for j, d in enumerate(dams)
+        ]
+
+    sys.stdout.write("\t'*.broadPeak'-files\n")
+    pkDir = os.path.join(work, 'peaks')
+    os.makedirs(pkDir, exist_ok=True)
+    data['broadPeak'] = [
+        broadPeakGen(chroms, os.path.join(pkDir, os.path.basename(b).split('.')[0] + '_peaks.broadPeak'), \
+            PEAKS[args.defaults], args.seed + 200 + i) \
+        for i, b in enumerate(data['bedgraph'])
+        ]
+
+    data['exps'] = exps
+    data['dams'] = dams
+    return(data)
+
+##--------------##
+##----Stages----##
+##--------------##
+
+def stageValidation(work, data, args):
+    ''''checkf()' of 'damMer.py' on all '*.fastq.gz'-files.'''
+
+    import damMer
+    import damMer_context
+    ctx = damMer_context.Context(work)
+    ctx.logname = os.path.join(work, 'bench.log')
+    for fq in data['fastq']:
+        damMer.checkf(ctx, fq)
+
+def stageRenaming(work, data, args):
+    '''
+    'renamer()' of 'damMer_tracks.py' on freshly generated pair directories.
+    Only the renaming itself is timed.
+    '''
+
+    import damMer_tracks
+    pairs = list()
+    for i, e in enumerate(data['exps']):
+        for j, d in enumerate(data['dams']):
+            pDir = os.path.join(work, 'pairs', e + '-vs-' + d)
+            shutil.rmtree(pDir, ignore_errors=True)
+            pairGen(pDir, e, d, data['bedgraph'][i * len(data['dams']) + j], i * 10 + j)
+            pairs.append(pDir)
+
+    tic = time.perf_counter()
+    for pDir in pairs:
+        damMer_tracks.renamer(pDir, 'Dam', 'Exp')
+    return(time.perf_counter() - tic)
+
+def stagePeaks(work, data, args):
+    ''''populater()', 'sorter()' & 'merger()' of 'damMer_peaks.py'.'''
+
+    import damMer_peaks
+    pkDir = os.path.join(work, 'bench_peaks')
+    shutil.rmtree(pkDir, ignore_errors=True)
+    os.makedirs(pkDir)
+    for bP in data['broadPeak']:
+        shutil.copy2(bP, pkDir)
+
+    tic = time.perf_counter()
+    damMer_peaks.populater(pkDir)
+    damMer_peaks.sorter(pkDir)
+    damMer_peaks.merger(pkDir, 'bench')
+    return(time.perf_counter() - tic)
+
+def perler(script, files, cwd):
+    '''Run perl-based track stage locally.'''
+
+    subprocess.run(
+        ['perl', script] + files,
+        cwd = cwd,
+        check = True,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL
+        )
+
+def stageNormalization(work, data, args):
+    '''Quantile normalization of all '*.gatc.bedgraph'-files.'''
+
+    if args.quantile is None:
+        raise RuntimeError("'--quantile' not provided.")
+    trDir = os.path.join(work, 'bench_tracks')
+    shutil.rmtree(trDir, ignore_errors=True)
+    os.makedirs(trDir)
+    for bG in data['bedgraph']:
+        shutil.copy2(bG, trDir)
+
+    tic = time.perf_counter()
+    perler(
+        os.path.abspath(args.quantile),
+        sorted(f for f in os.listdir(trDir) if re.search('\.gatc\.bedgraph$', f)),
+        trDir
+        )
+    return(time.perf_counter() - tic)
+
+def stageAveraging(work, data, args):
+    '''Averaging of all '*.quant.norm.bedgraph'-files.'''
+
+    if args.average is None:
+        raise RuntimeError("'--average' not provided.")
+    trDir = os.path.join(work, 'bench_tracks')
+    qGFs = sorted(f for f in os.listdir(trDir) if re.search('quant\.norm\.bedgraph$', f)) \
+        if os.path.isdir(trDir) else []
+    if not qGFs:
+        raise RuntimeError("No '*.quant.norm.bedgraph'-files; run 'normalization' first.")
+
+    tic = time.perf_counter()
+    perler(os.path.abspath(args.average), qGFs, trDir)
+    return(time.perf_counter() - tic)
+
+RUNNERS = {
+    'validation': stageValidation,
+    'renaming': stageRenaming,
+    'peaks': stagePeaks,
+    'normalization': stageNormalization,
+    'averaging': stageAveraging
+    }
+
+def profiler(stage, work, data, args, traced=False):
+    '''
+    Run one stage in a fresh process & record time & memory.
+    Stages may return their own timed section to exclude fixture setup.
+    With 'traced', only the peak of python allocations is recorded, as
+    'tracemalloc' slows down every allocation.
+    '''
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.stdout = open(os.devnull, 'w')
+    if traced:
+        tracemalloc.start()
+        RUNNERS[stage](work, data, args)
+        pyPeak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return({'pymalloc_peak_b': pyPeak})
+
+    cpu = time.process_time()
+    tic = time.perf_counter()
+    timed = RUNNERS[stage](work, data, args)
+    wall = time.perf_counter() - tic
+    cpu = time.process_time() - cpu
+
+    return({
+        'wall_s': timed if timed is not None else wall,
+        'cpu_s': cpu,
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_maxrss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        })
+
+def bencher(stage, work, data, args):
+    '''Repeat one stage untraced & summarize; one extra traced run for python allocations.'''
+
+    runs = list()
+    ctx = multiprocessing.get_context('spawn')
+    for i in range(args.repeats + 1):
+        with ctx.Pool(1) as pool:
+            try:
+                runs.append(pool.apply(profiler, (stage, work, data, args, i == args.repeats)))
+            except Exception as e:
+                return({'status': 'error', 'error': type(e).__name__ + ': ' + str(e)})
+    traced = runs.pop()
+
+    summary = {'status': 'ok', 'repeats': runs}
+    for key in runs[0]:
+        vals = [r[key] for r in runs]
+        summary[key] = statistics.median(vals)
+    summary['wall_s_min'] = min(r['wall_s'] for r in runs)
+    summary['pymalloc_peak_b'] = traced['pymalloc_peak_b']
+    return(summary)
+
+def comparer(report, baseline, tolerance):
+    '''Relative change of median wall time & peak memory against baseline.'''
+
+    regress = list()
+    for stage, res in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage, {})
+        if res.get('status') != 'ok' or old.get('status') != 'ok':
+            continue
+        for key in ['wall_s', 'maxrss_kb']:
+            rel = (res[key] - old[key]) / old[key] if old[key] else 0.0
+            res[key + '_change'] = rel
+            flag = rel > tolerance
+            if flag:
+                regress.append(stage + ':' + key)
+            sys.stdout.write(
+                '\t' + stage + '\t' + key + '\t' + \
+                '{0:.4g} -> {1:.4g}\t{2:+.1%}'.format(old[key], res[key], rel) + \
+                ('\tREGRESSION' if flag else '') + '\n'
+                )
+    return(regress)
+
+def gitRev():
+    '''Commit of the benchmarked scripts, if available.'''
+
+    try:
+        return(subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd = os.path.dirname(os.path.abspath(__file__)),
+            stderr = subprocess.DEVNULL
+            ).decode('utf-8').strip())
+    except Exception:
+        return(None)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    work = args.workdir if args.workdir else tempfile.mkdtemp(prefix='damMer_bench_')
+    os.makedirs(work, exist_ok=True)
+    work = os.path.abspath(work)
+
+    ##Generate_synthetic_data
+    ##-----------------------
+    sys.stdout.write('\n>Generate synthetic ' + args.defaults + '-data in ' + work + '\n')
+    data = generator(args, work)
+    sys.stdout.write('\tGATC-fragments:\t' + str(data['fragments']) + '\n')
+
+    ##Benchmark_stages
+    ##----------------
+    sys.stdout.write('\n>Benchmark stages\n')
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+        'commit': gitRev(),
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'species': args.defaults,
+        'scale': args.scale,
+        'fragments': data['fragments'],
+        'experiments': args.experiment,
+        'controls': args.control,
+        'reads': args.reads,
+        'peaks_per_file': PEAKS[args.defaults],
+        'stages': dict()
+        }
+    for stage in [s for s in STAGES if s in args.stages]:
+        res = bencher(stage, work, data, args)
+        report['stages'][stage] = res
+        if res['status'] == 'ok':
+            sys.stdout.write(
+                '\t' + stage + '\t' + \
+                'wall: {0:.3f}s\tcpu: {1:.3f}s\tmaxRSS: {2} kB\n'.format(
+                    res['wall_s'], res['cpu_s'], int(res['maxrss_kb'])
+                    )
+                )
+        else:
+            sys.stdout.write('\t' + stage + '\tskipped: ' + res['error'] + '\n')
+
+    ##Compare_against_baseline
+    ##------------------------
+    if args.baseline:
+        sys.stdout.write('\n>Compare against ' + args.baseline + '\n')
+        with open(args.baseline, 'r') as inFile:
+            baseline = json.load(inFile)
+        report['baseline'] = args.baseline
+        report['regressions'] = comparer(report, baseline, args.tolerance)
+
+    with open(args.json, 'w') as outFile:
+        json.dump(report, outFile, indent=2)
+    sys.stdout.write('\n>Report\n\t' + args.json + '\n')
+
+    if not args.keep and not args.workdir:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if report.get('regressions'):
+        sys.exit('\nRegressions:\t' + ', '.join(report['regressions']) + '\n')
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+#!/usr/local/bin/python3
+'''
+#Compress_&_index_'*.bedgraph'-/'*Peak'-files_(BGZF_&_tabix-index):
+python3 damMer_bgzf.py *_tracks/*.bedgraph *_peaks/*.mergePeak
+#Query_a_region:
+python3 damMer_bgzf.py -r 2L:100000-200000 Cph_tracks/Cph_tracks.quant.norm.av.bedgraph.gz
+'''
+
+import argparse
+import os
+import sys
+import re
+import io
+import gzip
+import zlib
+import struct
+import numpy as np
+import pandas as pd
+
+blockSize = 65280
+eofBlock = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+metaBin = 37450
+levels = ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1))
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="BGZF-compression, tabix-indexing & region queries of BED-like files."
+        )
+
+    parser.add_argument(
+        "files",
+        nargs = '+',
+        type = str,
+        help = "List of '*.bedgraph'-/'*Peak'-files (or '*.gz'-files with '--region')."
+        )
+    parser.add_argument(
+        "-r", "--region",
+        type = str,
+        default = None,
+        help = "Print records overlapping 'chr:start-end' instead of compressing."
+        )
+    parser.add_argument(
+        "-k", "--keep",
+        action = "store_true",
+        help = "Keep uncompressed input files."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def opener(file):
+    '''Open plain or gzip-/BGZF-compressed text files.'''
+    if file.endswith('.gz'):
+        return(gzip.open(file, 'rt'))
+    return(open(file, 'r'))
+
+def reg2bin(beg, end):
+    '''Smallest bin fully containing [beg, end) (vectorized 'hts_reg2bin').'''
+
+    end = end - 1
+    bins = np.zeros(len(beg), dtype=np.int64)
+    done = np.zeros(len(beg), dtype=bool)
+    for shift, off in levels:
+        m = ~done & ((beg >> shift) == (end >> shift))
+        bins[m] = off + (beg[m] >> shift)
+        done |= m
+    return(bins)
+
+def reg2bins(beg, end):
+    '''All bins overlapping [beg, end).'''
+
+    end = end - 1
+    bins = [0]
+    for shift, off in reversed(levels):
+        bins.extend(range(off + (beg >> shift), off + (end >> shift) + 1))
+    return(bins)
+
+class Writer(object):
+    '''
+    BGZF-writer with an in-memory tabix-index ('*.tbi', BED-preset).
+    Records need to be grouped by chromosome & sorted by start.
+    '''
+
+    def __init__(self, path, index=True):
+        self.path = path
+        self.handle = open(path, 'wb')
+        self.coff = 0
+        self.buf = bytearray()
+        self.index = index
+        self.skip = 0
+        self.names = list()
+        self.refs = dict()
+
+    def _block(self, data):
+        '''Compress & write one BGZF-block.'''
+
+        cmp = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = cmp.compress(bytes(data)) + cmp.flush()
+        self.handle.write(
+            struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25) + \
+            cdata + \
+            struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+            )
+        self.coff += len(cdata) + 26
+
+    def _flush(self):
+        '''Write all buffered data; returns uncompressed & compressed block starts.'''
+
+        ustarts = list()
+        coffs = list()
+        for i in range(0, len(self.buf), blockSize):
+            ustarts.append(i)
+            coffs.append(self.coff)
+            self._block(self.buf[i:i + blockSize])
+        ustarts.append(len(self.buf))
+        coffs.append(self.coff)
+        self.buf = bytearray()
+        return(np.array(ustarts, dtype=np.int64), np.array(coffs, dtype=np.uint64))
+
+    def header(self, text):
+        '''Header lines (e.g., track line) which are skipped by the index.'''
+
+        self.buf += text.encode()
+        self.skip += text.count('\n')
+
+    def records(self, data, chroms, begs, ends):
+        '''Write tab-separated records & update the index.'''
+
+        base = len(self.buf)
+        self.buf += data
+        ustarts, coffs = self._flush()
+        if not self.index or len(begs) == 0:
+            return
+
+        ##Virtual_offsets_of_line_starts_&_ends
+        ##-------------------------------------
+        nl = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10) + 1 + base
+        lEnd = nl
+        lBeg = np.concatenate([[base], nl[:-1]])
+        def voff(u):
+            b = np.searchsorted(ustarts, u, side='right') - 1
+            return((coffs[b] << np.uint64(16)) | (u - ustarts[b]).astype(np.uint64))
+        vBeg = voff(lBeg)
+        vEnd = voff(lEnd)
+
+        ##Per_chromosome_bins_&_linear_index
+        ##----------------------------------
+        chroms = np.asarray(chroms)
+        cut = np.flatnonzero(chroms[1:] != chroms[:-1]) + 1
+        for lo, hi in zip(np.concatenate([[0], cut]), np.concatenate([cut, [len(chroms)]])):
+            self._indexer(str(chroms[lo]), begs[lo:hi], ends[lo:hi], vBeg[lo:hi], vEnd[lo:hi])
+
+    def _indexer(self, chrom, beg, end, vb, ve):
+        '''Add one run of records of a chromosome to the index.'''
+
+        if chrom not in self.refs:
+            self.names.append(chrom)
+            self.refs[chrom] = {
+                'bins': dict(),
+                'lin': np.zeros(0, dtype=np.uint64),
+                'meta': [vb[0], ve[-1], 0]
+                }
+        ref = self.refs[chrom]
+        ref['meta'][1] = ve[-1]
+        ref['meta'][2] += len(beg)
+
+        ##Chunks_of_consecutive_records_within_the_same_bin
+        ##--------------------------------------------------
+        bins = reg2bin(beg, np.maximum(end, beg + 1))
+        run = np.concatenate([[0], np.flatnonzero(np.diff(bins) != 0) + 1])
+        runEnd = np.concatenate([run[1:], [len(bins)]]) - 1
+        for b, cb, ce in zip(bins[run].tolist(), vb[run].tolist(), ve[runEnd].tolist()):
+            chunks = ref['bins'].setdefault(b, list())
+            if chunks and (chunks[-1][1] >> 16) == (cb >> 16):
+                chunks[-1][1] = ce
+            else:
+                chunks.append([cb, ce])
+
+        ##Linear_index:_smallest_offset_per_16kb-window
+        ##---------------------------------------------
+        w0 = beg >> 14
+        w1 = (np.maximum(end, beg + 1) - 1) >> 14
+        reps = (w1 - w0 + 1).astype(np.int64)
+        win = np.repeat(w0, reps) + (np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps))
+        off = np.repeat(vb, reps)
+        n = int(win.max()) + 1
+        lin = np.full(max(n, len(ref['lin'])), np.iinfo(np.uint64).max, dtype=np.uint64)
+        lin[:len(ref['lin'])] = ref['lin']
+        np.minimum.at(lin, win, off)
+        ref['lin'] = lin
+
+    def frame(self, df, float_format=None):
+        '''Write a DataFrame (chr, start, end, ...) without header.'''
+
+        data = df.to_csv(sep='\t', header=False, index=False, float_format=float_format).encode()
+        self.records(
+            data,
+            df.iloc[:, 0].astype(str).to_numpy(),
+            np.floor(pd.to_numeric(df.iloc[:, 1]).to_numpy()).astype(np.int64),
+            np.floor(pd.to_numeric(df.iloc[:, 2]).to_numpy()).astype(np.int64)
+            )
+
+    def close(self):
+        '''Write remaining data, BGZF-EOF & '*.tbi'-index.'''
+
+        if self.buf:
+            self._flush()
+        self.handle.write(eofBlock)
+        self.handle.close()
+        if self.index:
+            tabixer(self.path + '.tbi', self.names, self.refs, self.skip)
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+def tabixer(path, names, refs, skip):
+    '''Write the '*.tbi'-index (BED-preset: 0-based, columns 1-3, meta '#').'''
+
+    nm = b''.join(n.encode() + b'\0' for n in names)
+    out = bytearray()
+    out += struct.pack('<4si', b'TBI\1', len(names))
+    out += struct.pack('<7i', 0x10000, 1, 2, 3, ord('#'), skip, len(nm))
+    out += nm
+    for n in names:
+        ref = refs[n]
+        out += struct.pack('<i', len(ref['bins']) + 1)
+        for b, chunks in ref['bins'].items():
+            out += struct.pack('<Ii', b, len(chunks))
+            for cb, ce in chunks:
+                out += struct.pack('<QQ', cb, ce)
+        out += struct.pack('<IiQQQQ', metaBin, 2, int(ref['meta'][0]), int(ref['meta'][1]), ref['meta'][2], 0)
+
+        ##Empty_windows_inherit_the_previous_offset
+        ##-----------------------------------------
+        lin = ref['lin'].copy()
+        idx = np.where(lin != np.iinfo(np.uint64).max, np.arange(len(lin)), -1)
+        np.maximum.accumulate(idx, out=idx)
+        lin = np.where(idx >= 0, lin[np.maximum(idx, 0)], 0).astype(np.uint64)
+        out += struct.pack('<i', len(lin))
+        out += lin.astype('<u8').tobytes()
+    out += struct.pack('<Q', 0)
+
+    w = Writer(path, index=False)
+    w.buf += out
+    w.close()
+
+class Reader(object):
+    '''Random access to BGZF-files via virtual offsets.'''
+
+    def __init__(self, path):
+        self.handle = open(path, 'rb')
+        self.coff = None
+        self.next = 0
+        self.data = b''
+        self.pos = 0
+
+    def _load(self, coff):
+        '''Decompress the block starting at compressed offset 'coff'.'''
+
+        self.handle.seek(coff)
+        head = self.handle.read(18)
+        if len(head) < 18:
+            self.coff, self.next, self.data, self.pos = coff, coff, b'', 0
+            return(False)
+        bsize = struct.unpack('<H', head[16:18])[0] + 1
+        cdata = self.handle.read(bsize - 26)
+        self.handle.read(8)
+        self.coff = coff
+        self.next = coff + bsize
+        self.data = zlib.decompress(cdata, -15)
+        self.pos = 0
+        return(True)
+
+    def seek(self, voff):
+        coff, within = voff >> 16, voff & 0xffff
+        if coff != self.coff:
+            self._load(coff)
+        self.pos = within
+
+    def tell(self):
+        if self.pos >= len(self.data) and self.data:
+            return(self.next << 16)
+        return((self.coff << 16) | self.pos)
+
+    def readline(self):
+        line = b''
+        while True:
+            if self.pos >= len(self.data):
+                if not self._load(self.next):
+                    return(line)
+                if not self.data:
+                    return(line)
+            i = self.data.find(b'\n', self.pos)
+            if i < 0:
+                line += self.data[self.pos:]
+                self.pos = len(self.data)
+            else:
+                line += self.data[self.pos:i + 1]
+                self.pos = i + 1
+                return(line)
+
+    def close(self):
+        self.handle.close()
+
+def loadIndex(path):
+    '''Parse a '*.tbi'-index into chromosome -> (bins, linear index).'''
+
+    with gzip.open(path, 'rb') as inFile:
+        raw = inFile.read()
+    magic, nRef = struct.unpack_from('<4si', raw, 0)
+    if magic != b'TBI\1':
+        sys.exit("\nNo tabix-index:\t" + path + "\n")
+    fmt, cSeq, cBeg, cEnd, meta, skip, lNm = struct.unpack_from('<7i', raw, 8)
+    p = 36
+    names = [n.decode() for n in raw[p:p + lNm].split(b'\0')[:nRef]]
+    p += lNm
+
+    idx = dict()
+    for n in names:
+        nBin = struct.unpack_from('<i', raw, p)[0]
+        p += 4
+        bins = dict()
+        for _ in range(nBin):
+            b, nChunk = struct.unpack_from('<Ii', raw, p)
+            p += 8
+            chunks = np.frombuffer(raw, dtype='<u8', count=2 * nChunk, offset=p).reshape(-1, 2)
+            p += 16 * nChunk
+            if b != metaBin:
+                bins[b] = chunks
+        nIntv = struct.unpack_from('<i', raw, p)[0]
+        p += 4
+        lin = np.frombuffer(raw, dtype='<u8', count=nIntv, offset=p)
+        p += 8 * nIntv
+        idx[n] = (bins, lin)
+    return(idx)
+
+def fetch(path, chrom, start, end, idx=None):
+    '''Yield tab-split records of 'path' overlapping [start, end) on 'chrom'.'''
+
+    if idx is None:
+        idx = loadIndex(path + '.tbi')
+    if chrom not in idx:
+        return
+    bins, lin = idx[chrom]
+
+    minOff = 0
+    if len(lin):
+        minOff = int(lin[min(start >> 14, len(lin) - 1)])
+    chunks = sorted(
+        (int(cb), int(ce)) for b in reg2bins(start, end) if b in bins \
+        for cb, ce in bins[b] if ce > minOff
+        )
+
+    ##Merge_overlapping_chunks
+    ##------------------------
+    merged = list()
+    for cb, ce in chunks:
+        if merged and cb <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], ce)
+        else:
+            merged.append([cb, ce])
+
+    rd = Reader(path)
+    try:
+        for cb, ce in merged:
+            rd.seek(max(cb, minOff))
+            while rd.tell() < ce:
+                line = rd.readline()
+                if not line:
+                    break
+                rec = line.decode().rstrip('\n').split('\t')
+                if rec[0] != chrom:
+                    continue
+                b, e = int(float(rec[1])), int(float(rec[2]))
+                if b < end and max(e, b + 1) > start:
+                    yield(rec)
+    finally:
+        rd.close()
+
+def compress(file, keep=False):
+    '''BGZF-compress & index a plain BED-like file; returns '*.gz'-path.'''
+
+    out = file + '.gz'
+    with open(file, 'rb') as inFile, Writer(out) as w:
+        ##Header_lines
+        ##------------
+        while True:
+            pos = inFile.tell()
+            line = inFile.readline()
+            if re.match(b'^(track|browser|#)', line):
+                w.header(line.decode())
+            else:
+                inFile.seek(pos)
+                break
+
+        ##Line-aligned_chunks
+        ##-------------------
+        rest = b''
+        while True:
+            blk = inFile.read(1 << 24)
+            data = rest + blk
+            if not blk:
+                rest = b''
+            else:
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+            if data:
+                df = pd.read_csv(
+                    io.BytesIO(data),
+                    sep = '\t',
+                    header = None,
+                    usecols = [0, 1, 2],
+                    dtype = {0: str, 1: np.float64, 2: np.float64}
+                    )
+                w.records(
+                    data,
+                    df[0].to_numpy(),
+                    np.floor(df[1].to_numpy()).astype(np.int64),
+                    np.floor(df[2].to_numpy()).astype(np.int64)
+                    )
+            if not blk:
+                break
+
+    if not keep:
+        os.remove(file)
+    return(out)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if args.region:
+        m = re.match('^([^:]+):([0-9,]+)-([0-9,]+)$', args.region)
+        if not m:
+            sys.exit("\nRegion needs format 'chr:start-end'.\n")
+        chrom = m.group(1)
+        start = int(m.group(2).replace(',', ''))
+        end = int(m.group(3).replace(',', ''))
+        for f in args.files:
+            for rec in fetch(f, chrom, start, end):
+                sys.stdout.write('\t'.join(rec) + '\n')
+        return
+
+    sys.stdout.write('\n>Compress & index\n')
+    for f in args.files:
+        out = compress(f, args.keep)
+        sys.stdout.write('\t' + out + '\n')
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+#!/usr/local/bin/python3
+'''
+#Caps_of_a_shared_broker_directory_(once,_on_a_shared_filesystem):
+python3 damMer_broker.py -b /shared/damMer_broker --usercap 64 --projectcap 32
+#Held_&_in-flight_jobs_of_all_projects:
+python3 damMer_broker.py -b /shared/damMer_broker --status
+#Release_own_held_jobs_without_a_running_damMer-process:
+python3 damMer_broker.py -b /shared/damMer_broker --serve
+#Within_'damMer.py'_&_'damMer_tracks.py'_('--broker'):
+brk = damMer_broker.Broker('/shared/damMer_broker', 'Cph', priority=1)
+ctx = damMer_context.Context('/path/to/Cph', 'me@uni.ac.uk', broker=brk)
+'''
+
+import argparse
+import os
+import sys
+import json
+import time
+import fcntl
+import getpass
+import threading
+import subprocess
+
+caps = {'user': 64, 'project': 32, 'total': 0}
+stale = 900                     #Seconds_without_a_pass_before_held_jobs_of_a_user_are_ignored
+waiting = ['Dependency', 'DependencyNeverSatisfied', 'BeginTime']
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Shared submission broker: per-user & per-project caps on in-flight slurm jobs."
+        )
+
+    parser.add_argument(
+        "-b", "--broker",
+        type = str,
+        default = os.environ.get('DAMMER_BROKER'),
+        help = "Broker directory on a shared filesystem (default: '$DAMMER_BROKER')."
+        )
+    parser.add_argument(
+        "-u", "--usercap",
+        type = int,
+        default = None,
+        help = "In-flight jobs per user (0: unlimited)."
+        )
+    parser.add_argument(
+        "-p", "--projectcap",
+        type = int,
+        default = None,
+        help = "In-flight jobs per project (0: unlimited)."
+        )
+    parser.add_argument(
+        "-t", "--total",
+        type = int,
+        default = None,
+        help = "In-flight jobs of all users (0: unlimited)."
+        )
+    parser.add_argument(
+        "-s", "--status",
+        action = "store_true",
+        help = "Held & in-flight jobs per user & project."
+        )
+    parser.add_argument(
+        "-S", "--serve",
+        action = "store_true",
+        help = "Release own held jobs until none are left."
+        )
+    parser.add_argument(
+        "-w", "--poll",
+        type = int,
+        default = 30,
+        help = "Seconds between passes of '--serve'."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def squeue(jobIDs):
+    '''State & reason per queued job (None if 'squeue' fails).'''
+
+    if not jobIDs:
+        return(dict())
+    try:
+        out = subprocess.check_output(
+            ['squeue', '-h', '-j', ','.join(jobIDs), '-o', '%i|%T|%r'],
+            stderr = subprocess.DEVNULL
+            ).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+    states = dict()
+    for l in out.strip().split('\n'):
+        f = l.split('|')
+        if len(f) == 3:
+            states.setdefault(f[0].split('_')[0], (f[1], f[2]))
+    return(states)
+
+def inflight(job, q):
+    '''Released job running or waiting for resources (not for dependencies).'''
+
+    if job['state'] != 'released' or job['jobID'] not in q:
+        return(False)
+    st, reason = q[job['jobID']]
+    return(not (st == 'PENDING' and reason in waiting))
+
+def allocate(jobs, q, conf, live):
+    '''
+    Held jobs to release in fair-share order: highest priority first, then
+    the project with fewest in-flight jobs, then submission order; jobs are
+    taken while the user, project & total caps allow.
+    '''
+
+    cnt = {'user': dict(), 'project': dict(), 'total': 0}
+    for j in jobs.values():
+        if inflight(j, q):
+            cnt['user'][j['user']] = cnt['user'].get(j['user'], 0) + 1
+            cnt['project'][j['project']] = cnt['project'].get(j['project'], 0) + 1
+            cnt['total'] += 1
+    free = lambda kind, n: not conf[kind] or n < conf[kind]
+
+    queues = dict()
+    for j in sorted(jobs.values(), key=lambda j: j['seq']):
+        if j['state'] == 'held' and j['user'] in live:
+            queues.setdefault(j['project'], list()).append(j)
+
+    out = list()
+    while queues and free('total', cnt['total']):
+        open_ = [
+            p for p, js in queues.items() \
+            if free('project', cnt['project'].get(p, 0)) and free('user', cnt['user'].get(js[0]['user'], 0))
+            ]
+        if not open_:
+            break
+        p = min(open_, key=lambda p: (
+            -queues[p][0]['priority'], cnt['project'].get(p, 0), queues[p][0]['seq']
+            ))
+        j = queues[p].pop(0)
+        if not queues[p]:
+            del queues[p]
+        out.append(j)
+        cnt['user'][j['user']] = cnt['user'].get(j['user'], 0) + 1
+        cnt['project'][p] = cnt['project'].get(p, 0) + 1
+        cnt['total'] += 1
+    return(out)
+
+class Broker(object):
+    '''
+    Submission broker shared by all damMer-processes through a directory on
+    a shared filesystem ('state.json' & 'caps.json', guarded by 'lock').
+    Jobs are submitted held ('sbatch --hold') & registered with user,
+    project & priority; while a process has held jobs, a background thread
+    releases them ('scontrol release') as in-flight jobs finish. Only own
+    jobs can be released, so every user's processes release their jobs in
+    the fair-share order of all projects.
+    '''
+
+    def __init__(self, path, project, priority=0, poll=30, user=None):
+        self.path = os.path.abspath(path)
+        self.project = project
+        self.priority = priority
+        self.poll = poll
+        self.user = user if user else getpass.getuser()
+        self.thread = None
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def locked(self):
+        '''Exclusive lock of the broker directory (context manager).'''
+        return(Lock(os.path.join(self.path, 'lock')))
+
+    def caps(self):
+        conf = dict(caps)
+        try:
+            with open(os.path.join(self.path, 'caps.json'), 'r') as inFile:
+                conf.update(json.load(inFile))
+        except (OSError, ValueError):
+            pass
+        return(conf)
+
+    def load(self):
+        try:
+            with open(os.path.join(self.path, 'state.json'), 'r') as inFile:
+                return(json.load(inFile))
+        except (OSError, ValueError):
+            return({'seq': 0, 'jobs': dict(), 'beats': dict()})
+
+    def save(self, state, name='state.json'):
+        '''Write 'state.json' (or 'caps.json') atomically.'''
+
+        tmp = os.path.join(self.path, name + '.' + str(os.getpid()))
+        with open(tmp, 'w') as outFile:
+            json.dump(state, outFile)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def register(self, jobID):
+        '''Register a held job & start releasing.'''
+
+        with self.locked():
+            state = self.load()
+            state['seq'] += 1
+            state['jobs'][str(jobID)] = {
+                'jobID': str(jobID),
+                'user': self.user,
+                'project': self.project,
+                'priority': self.priority,
+                'seq': state['seq'],
+                'state': 'held'
+                }
+            state['beats'][self.user] = time.time()
+            self.save(state)
+        self.start()
+
+    def pump(self):
+        '''
+        One pass: drop finished jobs, release own held jobs within the caps.
+        Returns the number of own held jobs left (None if 'squeue' fails).
+        '''
+
+        with self.locked():
+            state = self.load()
+            jobs = state['jobs']
+            q = squeue(list(jobs))
+            if q is None:
+                return(None)
+            for j in list(jobs):
+                if j not in q:
+                    del jobs[j]
+            now = time.time()
+            state['beats'][self.user] = now
+            live = set(u for u, t in state['beats'].items() if now - t < stale)
+
+            rel = [j['jobID'] for j in allocate(jobs, q, self.caps(), live) if j['user'] == self.user]
+            if rel:
+                try:
+                    subprocess.check_call(
+                        ['scontrol', 'release', ','.join(rel)],
+                        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL
+                        )
+                    for j in rel:
+                        jobs[j]['state'] = 'released'
+                except (OSError, subprocess.CalledProcessError):
+                    sys.stderr.write("WARNING: 'scontrol release' failed.\n")
+            self.save(state)
+        return(len([j for j in jobs.values() if j['user'] == self.user and j['state'] == 'held']))
+
+    def start(self):
+        '''Release own held jobs in a background thread (once).'''
+
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.serve, daemon=True)
+            self.thread.start()
+
+    def serve(self):
+        '''Pass until no own held jobs are left.'''
+
+        while True:
+            left = self.pump()
+            if left == 0:
+                return
+            time.sleep(self.poll)
+
+    def drain(self):
+        '''Block until all own held jobs are released.'''
+
+        if self.thread is not None:
+            sys.stdout.write('\n>Waiting for the broker to release held jobs\n')
+            self.serve()
+
+    def status(self, out=sys.stdout):
+        '''Held & in-flight jobs per user & project.'''
+
+        with self.locked():
+            state = self.load()
+        q = squeue(list(state['jobs'])) or dict()
+        rows = dict()
+        for j in state['jobs'].values():
+            r = rows.setdefault((j['user'], j['project']), [0, 0, j['priority']])
+            if j['state'] == 'held':
+                r[0] += 1
+            elif inflight(j, q):
+                r[1] += 1
+        out.write('\tuser\tproject\tpriority\theld\tin-flight\n')
+        for (u, p), r in sorted(rows.items()):
+            out.write('\t' + '\t'.join([u, p, str(r[2]), str(r[0]), str(r[1])]) + '\n')
+
+class Lock(object):
+    '''
+    Exclusive POSIX lock ('lockf') on a file (context manager). POSIX locks
+    belong to the process, so threads of one process are serialized by a
+    thread lock first.
+    '''
+
+    threads = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = None
+
+    def __enter__(self):
+        Lock.threads.acquire()
+        try:
+            ##Write-open:_NFS_emulates_'flock'_by_POSIX_locks_(exclusive_needs_write_access)
+            self.fh = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                os.fchmod(self.fh, 0o666)
+            except OSError:
+                pass
+            fcntl.lockf(self.fh, fcntl.LOCK_EX)
+        except BaseException:
+            if self.fh is not None:
+                os.close(self.fh)
+            Lock.threads.release()
+            raise
+        return(self)
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.lockf(self.fh, fcntl.LOCK_UN)
+            os.close(self.fh)
+        finally:
+            self.fh = None
+            Lock.threads.release()
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if not args.broker:
+        sys.exit("\nNo broker directory: '--broker' or '$DAMMER_BROKER'.\n")
+    brk = Broker(args.broker, None, poll=args.poll)
+
+    ##Caps
+    ##----
+    new = {k: v for k, v in [('user', args.usercap), ('project', args.projectcap), ('total', args.total)] \
+        if v is not None}
+    if new:
+        with brk.locked():
+            conf = brk.caps()
+            conf.update(new)
+            brk.save(conf, 'caps.json')
+    sys.stdout.write('\n>Caps\n')
+    for k, v in sorted(brk.caps().items()):
+        sys.stdout.write('\t' + k + ':\t' + (str(v) if v else 'unlimited') + '\n')
+
+    if args.serve:
+        sys.stdout.write('\n>Release held jobs of ' + brk.user + '\n')
+        brk.serve()
+    if args.status or args.serve:
+        sys.stdout.write('\n>Status\n')
+        brk.status()
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/local/bin/python3
+'''
+#Broad_peaks_of_a_GATC-fragment_log2_ratio_track_('*_peaks.broadPeak'):
+python3 damMer_callpeak.py -t Cph-vs-Dam.gatc.bedgraph -n Cph-vs-Dam
+#Dam-only_coverage_track_(log2_over_its_genome-wide_mean):
+python3 damMer_callpeak.py -t Dam.DamOnly.gatc.bedgraph -n Dam --coverage
+'''
+
+import argparse
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+import damMer_io
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Permutation-based broad peaks on GATC-fragment tracks ('*.broadPeak')."
+        )
+
+    parser.add_argument(
+        "-t", "--track",
+        type = str,
+        required = True,
+        help = "'*.gatc.bedgraph'-file of log2 ratios."
+        )
+    parser.add_argument(
+        "-n", "--name",
+        type = str,
+        required = True,
+        help = "Prefix of the '<name>_peaks.broadPeak'-output (cf. MACS2 '--name')."
+        )
+    parser.add_argument(
+        "-c", "--coverage",
+        action = "store_true",
+        help = "Track of Dam-only coverage: scored as log2 over its genome-wide mean."
+        )
+    parser.add_argument(
+        "-q", "--qvalue",
+        type = float,
+        default = 0.05,
+        help = "FDR cutoff of reported peaks."
+        )
+    parser.add_argument(
+        "-g", "--gap",
+        type = int,
+        default = 1,
+        help = "Fragments below threshold bridged within a broad peak."
+        )
+    parser.add_argument(
+        "-m", "--minfrags",
+        type = int,
+        default = 2,
+        help = "Minimal number of GATC-fragments per peak."
+        )
+    parser.add_argument(
+        "-p", "--permutations",
+        type = int,
+        default = 20,
+        help = "Permutations of the fragment scores for the null distribution."
+        )
+    parser.add_argument(
+        "-s", "--seed",
+        type = int,
+        default = 0,
+        help = "Seed of the permutations."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def loader(track, coverage=False):
+    '''
+    Fragment scores of all chromosomes in one array (centred on the
+    genome-wide median) with chromosome index, start & end per fragment.
+    '''
+
+    df = damMer_io.bedgraph(track)
+    df = df[np.isfinite(df['score'])]
+    chr = df['chr'].cat.remove_unused_categories()
+    chroms = list(chr.cat.categories)
+    df = df.assign(cid = chr.cat.codes).sort_values(['cid', 'start'], kind='stable')
+
+    score = df['score'].to_numpy(dtype=np.float64)
+    if coverage:
+        mean = score.mean()
+        pc = 0.1 * mean if mean > 0 else 1.0
+        score = np.log2((np.clip(score, 0, None) + pc) / (mean + pc))
+    score = score - np.median(score)
+    return(
+        chroms, df['cid'].to_numpy(), df['start'].to_numpy(), df['end'].to_numpy(), score
+        )
+
+def runs(score, cid, gap=1, minfrags=2):
+    '''
+    Runs of fragments above zero within chromosomes, bridging up to 'gap'
+    fragments below; returns start & end index ([s, e)) & summed score.
+    '''
+
+    mask = (score > 0).astype(np.int8)
+    d = np.diff(np.concatenate([[0], mask, [0]]))
+    s = np.flatnonzero(d == 1)
+    e = np.flatnonzero(d == -1)
+    ##Split_runs_at_chromosome_boundaries
+    brk = np.flatnonzero(np.diff(cid) != 0) + 1
+    brk = brk[mask[brk] & mask[brk - 1] == 1]
+    s = np.sort(np.concatenate([s, brk]))
+    e = np.sort(np.concatenate([e, brk]))
+    if len(s) == 0:
+        return(s, e, np.zeros(0))
+
+    ##Bridge_short_gaps_within_chromosomes
+    join = ((s[1:] - e[:-1]) <= gap) & (cid[s[1:]] == cid[e[:-1] - 1])
+    s = s[np.concatenate([[True], ~join])]
+    e = e[np.concatenate([~join, [True]])]
+
+    keep = (e - s) >= minfrags
+    s, e = s[keep], e[keep]
+    cs = np.concatenate([[0.0], np.cumsum(score)])
+    return(s, e, cs[e] - cs[s])
+
+def nuller(score, cid, gap=1, minfrags=2, permutations=20, seed=0):
+    '''Sorted summed scores of runs in tracks with permuted fragment scores.'''
+
+    rng = np.random.default_rng(seed)
+    null = [runs(rng.permutation(score), cid, gap, minfrags)[2] for i in range(permutations)]
+    return(np.sort(np.concatenate(null)))
+
+def pvalues(area, null, tail=0.01):
+    '''
+    -log10 p of summed scores against the permutation null; beyond its
+    top 'tail' fraction, from an exponential fit to the null tail.
+    '''
+
+    n = len(null)
+    if n == 0:
+        return(np.full(len(area), np.inf))
+    above = n - np.searchsorted(null, area, side='left')
+    logp = -np.log10((above + 1) / (n + 1.0))
+
+    ##Exponential_tail_of_the_null
+    u = null[min(int(n * (1 - tail)), n - 1)]
+    exc = null[null > u] - u
+    if len(exc) > 1 and exc.mean() > 0:
+        p0 = len(exc) / float(n)
+        ext = -math.log10(p0) + (area - u) / exc.mean() / math.log(10)
+        logp = np.where(area > u, np.maximum(logp, ext), logp)
+    return(logp)
+
+def qvalues(logp):
+    '''-log10 Benjamini-Hochberg q from -log10 p.'''
+
+    m = len(logp)
+    if m == 0:
+        return(logp)
+    order = np.argsort(-logp)
+    rank = np.arange(1, m + 1)
+    logq = logp[order] - np.log10(m / rank)
+    ##Cumulative_minimum_of_q_from_the_largest_p
+    logq = np.maximum.accumulate(logq[::-1])[::-1]
+    out = np.empty(m)
+    out[order] = np.clip(logq, 0, None)
+    return(out)
+
+def caller(track, coverage=False, qvalue=0.05, gap=1, minfrags=2, permutations=20, seed=0):
+    '''Broad peaks of one track as '*.broadPeak'-columns.'''
+
+    chroms, cid, start, end, score = loader(track, coverage)
+    s, e, area = runs(score, cid, gap, minfrags)
+    null = nuller(score, cid, gap, minfrags, permutations, seed)
+    logp = pvalues(area, null)
+    logq = qvalues(logp)
+
+    keep = logq >= -math.log10(qvalue)
+    s, e, area, logp, logq = s[keep], e[keep], area[keep], logp[keep], logq[keep]
+    return(pd.DataFrame({
+        'chr': np.asarray(chroms, dtype=object)[cid[s]],
+        'start': np.floor(start[s]).astype(np.int64),
+        'end': np.ceil(end[e - 1]).astype(np.int64),
+        'score': np.minimum(10 * logq, 1000).astype(np.int64),
+        'strand': '.',
+        'fc': np.round(np.power(2.0, area / (e - s)), 5),
+        'neglog10pval': np.round(logp, 5),
+        'neglog10qval': np.round(logq, 5)
+        }))
+
+def writer(df, name):
+    '''Write '<name>_peaks.broadPeak' (MACS2 column layout).'''
+
+    out = name + '_peaks.broadPeak'
+    df.insert(3, 'name', [os.path.basename(name) + '_peak_' + str(i + 1) for i in range(len(df))])
+    df.to_csv(out, sep='\t', header=False, index=False)
+    return(out)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sys.stdout.write('\n>Call broad peaks\n\t' + args.track + '\n')
+    df = caller(
+        args.track, args.coverage, args.qvalue, args.gap, args.minfrags,
+        args.permutations, args.seed
+        )
+    out = writer(df, args.name)
+    sys.stdout.write('\tPeaks:\t' + str(len(df)) + '\n\t' + out + '\n')
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+#!/usr/local/bin/python3
+'''
+#Cluster_union_of_reproducible_peaks_on_quantile_normalized_signal:
+python3 damMer_cluster.py -p */*_peaks/25.reproPeak -t */*_tracks/*.quant.norm.bedgraph -o Dichaete_comKclus_FDR25
+'''
+
+import argparse
+import os
+import sys
+import re
+import numpy as np
+import pandas as pd
+import damMer_io
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+##Colours_as_'cols3'_in_'cluster_peaks.Rmd'
+cols3 = (
+    "237,73,56", "173,198,7", "244,193,13", \
+    "51,49,54", "104,123,192", "231,111,153", \
+    "237,144,56", "42,179,72", "16,104,129", \
+    "65,19,203"
+    )
+chunk = 65536
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Mini-batch k-means clustering of merged peaks."
+        )
+
+    parser.add_argument(
+        "-p", "--peaks",
+        nargs = '*',
+        type = str,
+        required = True,
+        help = "List of '*.reproPeak'-files (e.g., one per factor)."
+        )
+    parser.add_argument(
+        "-t", "--tracks",
+        nargs = '*',
+        type = str,
+        required = True,
+        help = "List of '*.quant.norm.bedgraph'-files (i.e., samples)."
+        )
+    parser.add_argument(
+        "-o", "--out",
+        type = str,
+        required = True,
+        help = "Prefix for output files."
+        )
+    parser.add_argument(
+        "-k", "--clusters",
+        nargs = '*',
+        type = int,
+        default = list(range(4, 11)),
+        help = "Numbers of clusters to evaluate (default: 4 - 10)."
+        )
+    parser.add_argument(
+        "-s", "--seed",
+        type = int,
+        default = 0,
+        help = "Random seed."
+        )
+    parser.add_argument(
+        "-b", "--batch",
+        type = int,
+        default = 4096,
+        help = "Mini-batch size."
+        )
+    parser.add_argument(
+        "-e", "--epochs",
+        type = int,
+        default = 20,
+        help = "Passes over the signal matrix per k-means run."
+        )
+    parser.add_argument(
+        "-m", "--silsample",
+        type = int,
+        default = 10000,
+        help = "Peaks sampled for average silhouette widths."
+        )
+    parser.add_argument(
+        "-u", "--unlog",
+        action = 'store_true',
+        help = "Transform log2-scores into unlogged state before aggregation."
+        )
+    parser.add_argument(
+        "-n", "--threads",
+        type = int,
+        default = 8,
+        help = "Number of k evaluated in parallel."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def merger(df):
+    '''
+    Merge overlapping & book-ended peaks across all peak sets
+    (cf. 'merger()' with '-c 4 -o distinct' & 'cluster()' in 'cluster_peaks.Rmd').
+    '''
+
+    df = df.sort_values(by=['chr', 'start'], kind='mergesort').reset_index(drop=True)
+
+    ##Running_maximum_of_peak_ends_per_chromosome
+    ##-------------------------------------------
+    runEnd = df.groupby('chr', sort=False, observed=True)['end'].cummax()
+    prevEnd = runEnd.groupby(df['chr'], sort=False, observed=True).shift(1)
+    new = prevEnd.isna() | (df['start'] > prevEnd)
+    grp = new.cumsum().to_numpy() - 1
+
+    merged = (
+        df
+        .assign(grp = grp)
+        .groupby('grp', sort=True)
+        .agg(chr = ('chr', 'first'), start = ('start', 'min'), end = ('end', 'max'))
+        )
+    sign = (
+        df[['sign']]
+        .assign(grp = grp)
+        .drop_duplicates()
+        .sort_values(by=['grp', 'sign'])
+        .groupby('grp', sort=True)['sign']
+        .agg(','.join)
+        )
+    merged['sign'] = sign
+
+    ##Numeric_id_per_distinct_peak_set_combination
+    ##--------------------------------------------
+    lookup = {s: i + 1 for i, s in enumerate(pd.unique(merged['sign']))}
+    merged['clus'] = merged['sign'].map(lookup).astype(np.int64)
+    return(merged.reset_index(drop=True))
+
+def aggregator(peaks, track, unlog=False):
+    '''
+    Fragment-weighted signal per peak
+    (cf. 'aggregator()': sum(score*overlap)/(end-start)).
+    '''
+
+    df = damMer_io.bedgraph(track)
+    if unlog:
+        df['score'] = np.exp2(df['score'])
+    res = np.full(len(peaks), np.nan, dtype=np.float32)
+
+    pkIdx = peaks.groupby('chr', sort=False, observed=True).indices
+    for chrom, grp in df.groupby('chr', sort=False, observed=True):
+        if chrom not in pkIdx:
+            continue
+        grp = grp.sort_values(by='start', kind='mergesort')
+        starts = grp['start'].to_numpy()
+        ends = grp['end'].to_numpy()
+        scores = grp['score'].to_numpy()
+        width = (ends - starts).astype(np.float64)
+        sig = np.concatenate([[0.0], np.cumsum(width * scores)])
+        cov = np.concatenate([[0.0], np.cumsum(width)])
+
+        rows = pkIdx[chrom]
+        s = peaks['start'].to_numpy()[rows]
+        e = peaks['end'].to_numpy()[rows]
+
+        def cumulate(x):
+            k = np.searchsorted(starts, x, side='right') - 1
+            kc = np.maximum(k, 0)
+            part = np.clip(x - starts[kc], 0, ends[kc] - starts[kc])
+            part = np.where(k >= 0, part, 0).astype(np.float64)
+            return(sig[kc] + part * scores[kc], cov[kc] + part)
+
+        sLo, cLo = cumulate(s)
+        sHi, cHi = cumulate(e)
+        res[rows] = np.where(cHi > cLo, (sHi - sLo) / (e - s), np.nan)
+
+    return(res)
+
+def populater(peaks, tracks, out, unlog=False):
+    '''Fill out-of-core peak x sample matrix track by track.'''
+
+    mat = np.lib.format.open_memmap(
+        out,
+        mode = 'w+',
+        dtype = np.float32,
+        shape = (len(peaks), len(tracks))
+        )
+    for j, t in enumerate(tracks):
+        sys.stdout.write('\t' + os.path.basename(t) + '\n')
+        mat[:, j] = aggregator(peaks, t, unlog)
+    mat.flush()
+    del mat
+
+def scaler(inp, out):
+    '''
+    Z-scores per sample for complete rows (cf. 'stats::na.omit() %>% base::scale()').
+    Two chunked passes over the memory-mapped matrix.
+    '''
+
+    mat = np.load(inp, mmap_mode='r')
+    n, m = mat.shape
+
+    keep = np.zeros(n, dtype=bool)
+    tot = np.zeros(m, dtype=np.float64)
+    sq = np.zeros(m, dtype=np.float64)
+    for i in range(0, n, chunk):
+        blk = np.asarray(mat[i:i + chunk], dtype=np.float64)
+        ok = ~np.isnan(blk).any(axis=1)
+        keep[i:i + chunk] = ok
+        tot += blk[ok].sum(axis=0)
+        sq += (blk[ok] ** 2).sum(axis=0)
+
+    cnt = int(keep.sum())
+    if cnt < 2:
+        sys.exit('\nLess than two peaks with signal in all samples.\n')
+    mean = tot / cnt
+    sd = np.sqrt(np.maximum(sq - cnt * mean ** 2, 0) / (cnt - 1))
+    sd[sd == 0] = 1.0
+
+    rows = np.flatnonzero(keep)
+    zs = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=(cnt, m))
+    for i in range(0, cnt, chunk):
+        blk = np.asarray(mat[rows[i:i + chunk]], dtype=np.float64)
+        zs[i:i + chunk] = (blk - mean) / sd
+    zs.flush()
+    del zs
+    return(rows)
+
+def kmeaner(zsFile, k, seed, batch, epochs):
+    '''Mini-batch k-means via 'partial_fit' over shuffled mini-batches.'''
+
+    zs = np.load(zsFile, mmap_mode='r')
+    n = zs.shape[0]
+    rng = np.random.default_rng(seed)
+    km = MiniBatchKMeans(
+        n_clusters = k,
+        batch_size = batch,
+        random_state = seed,
+        n_init = 3
+        )
+
+    starts = np.arange(0, n, batch)
+    for ep in range(epochs):
+        for i in rng.permutation(starts):
+            blk = np.asarray(zs[i:i + batch])
+            if len(blk) < k:
+                continue
+            km.partial_fit(blk)
+    return(km)
+
+def labeler(zsFile, km):
+    '''Cluster labels & distances to all centres, chunkwise.'''
+
+    zs = np.load(zsFile, mmap_mode='r')
+    n = zs.shape[0]
+    lab = np.zeros(n, dtype=np.int64)
+    sil = np.zeros(n, dtype=np.float64)
+    for i in range(0, n, chunk):
+        blk = np.asarray(zs[i:i + chunk], dtype=np.float64)
+        d = np.sqrt(((blk[:, None, :] - km.cluster_centers_[None, :, :]) ** 2).sum(axis=2))
+        own = d.argmin(axis=1)
+        a = d[np.arange(len(blk)), own]
+        d[np.arange(len(blk)), own] = np.inf
+        b = d.min(axis=1)
+        lab[i:i + chunk] = own
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sil[i:i + chunk] = np.where(
+                np.maximum(a, b) > 0,
+                (b - a) / np.maximum(a, b),
+                0.0
+                )
+    return(lab, sil)
+
+def selecter(zsFile, k, seed, batch, epochs, silsample):
+    '''Fit one k & score it by inertia and average silhouette width.'''
+
+    km = kmeaner(zsFile, k, seed, batch, epochs)
+    lab, _ = labeler(zsFile, km)
+    zs = np.load(zsFile, mmap_mode='r')
+    n = zs.shape[0]
+
+    rng = np.random.default_rng(seed)
+    sub = np.sort(rng.choice(n, size=min(n, silsample), replace=False))
+    if len(np.unique(lab[sub])) > 1:
+        meanSil = silhouette_score(np.asarray(zs[sub]), lab[sub])
+    else:
+        meanSil = np.nan
+
+    inertia = 0.0
+    for i in range(0, n, chunk):
+        blk = np.asarray(zs[i:i + chunk], dtype=np.float64)
+        inertia += ((blk - km.cluster_centers_[lab[i:i + chunk]]) ** 2).sum()
+
+    return(k, inertia, meanSil)
+
+def namer(track):
+    '''Sample name from '*.bedgraph'-filename.'''
+    return(re.sub('(\.gatc)?(\.quant\.norm)?\.bedgraph(\.gz)?$', '', os.path.basename(track)))
+
+def bedder(res, out):
+    '''Write colour-coded '*.reproPeak.bed' as in 'cluster_peaks.Rmd'.'''
+
+    name = os.path.basename(out)
+    bed = (
+        res
+        .assign(chr = lambda x: 'chr' + x['chr'].astype(str))
+        .assign(name = lambda x: x['kclus'].astype(str) + '_' + x['sign'])
+        .assign(score = '0')
+        .assign(strand = '*')
+        .assign(thickStart = lambda x: x['start'])
+        .assign(thickEnd = lambda x: x['end'])
+        .assign(color = lambda x: [cols3[(c - 1) % len(cols3)] for c in x['kclus']])
+        .loc[:, ['chr', 'start', 'end', 'name', 'score', 'strand', \
+            'thickStart', 'thickEnd', 'color']]
+        .sort_values(by=['chr', 'start', 'end'])
+        )
+    with open(out + '.reproPeak.bed', 'w') as curFile:
+        curFile.write(
+            'track name="' + name + '"\t' + \
+            'description="' + name + '"\t' + \
+            'visibility=2\titemRgb="On"\n'
+            )
+        bed.to_csv(curFile, sep='\t', header=False, index=False)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    ##Read_&_merge_all_peak_sets
+    ##--------------------------
+    sys.stdout.write("\n>Read in & merge '*.reproPeak'-files\n")
+    pre = damMer_io.concat(
+        [damMer_io.peaks(p, cols=['chr', 'start', 'end', 'sign'], empty='warn') for p in args.peaks]
+        )
+    peaks = merger(pre)
+    sys.stdout.write(
+        '\tPeaks:\t' + str(len(pre)) + '\n' + \
+        '\tMerged:\t' + str(len(peaks)) + '\n' + \
+        '\tCombinations:\t' + str(peaks['clus'].max()) + '\n'
+        )
+
+    ##Build_peak_x_sample_matrix
+    ##--------------------------
+    sys.stdout.write('\n>Aggregate signal per peak\n')
+    samples = [namer(t) for t in args.tracks]
+    sigFile = args.out + '.signal.npy'
+    populater(peaks, args.tracks, sigFile, args.unlog)
+
+    ##Normalize_into_z-scores
+    ##-----------------------
+    sys.stdout.write('\n>Normalize into z-scores\n')
+    zsFile = args.out + '.zscores.npy'
+    rows = scaler(sigFile, zsFile)
+    sys.stdout.write('\tComplete peaks:\t' + str(len(rows)) + '\n')
+
+    ##Model_selection_across_k_in_parallel
+    ##------------------------------------
+    sys.stdout.write('\n>Evaluate numbers of clusters\n')
+    ks = sorted(set(k for k in args.clusters if 1 < k < len(rows)))
+    if not ks:
+        sys.exit('\nNo valid number of clusters.\n')
+    with ProcessPoolExecutor(max_workers=args.threads) as pool:
+        futs = [
+            pool.submit(
+                selecter, zsFile, k, args.seed, \
+                args.batch, args.epochs, args.silsample
+                ) \
+            for k in ks
+            ]
+        runs = pd.DataFrame(
+            [f.result() for f in futs],
+            columns = ['clusChos', 'inertia', 'meanSil']
+            )
+    runs.to_csv(args.out + '.runs.tsv', sep='\t', index=False)
+    for r in runs.itertuples():
+        sys.stdout.write(
+            '\tk=' + str(r.clusChos) + \
+            '\tinertia=' + str(round(r.inertia, 2)) + \
+            '\tmeanSil=' + str(round(r.meanSil, 4)) + '\n'
+            )
+    clusChos = int(runs.loc[runs['meanSil'].idxmax(), 'clusChos'])
+    sys.stdout.write('\tChosen:\t' + str(clusChos) + '\n')
+
+    ##Final_clustering
+    ##----------------
+    sys.stdout.write('\n>Cluster peaks\n')
+    km = kmeaner(zsFile, clusChos, args.seed, args.batch, args.epochs)
+    lab, sil = labeler(zsFile, km)
+
+    ##Write_out_'resKclus'-like_table_&_bed-file
+    ##------------------------------------------
+    sys.stdout.write('\n>Write out results\n')
+    sig = np.load(sigFile, mmap_mode='r')
+    res = peaks.iloc[rows].reset_index(drop=True)
+    res.insert(
+        0,
+        'id',
+        res['chr'].astype(str) + '_' + res['start'].astype(str) + '_' + \
+        res['end'].astype(str) + '_' + res['sign'] + '_' + res['clus'].astype(str)
+        )
+    res['kclus'] = lab + 1
+    for j, s in enumerate(samples):
+        res[s] = np.asarray(sig[rows, j])
+    res['sil_width'] = sil
+    res = res.sort_values(by=['kclus', 'sil_width'], kind='mergesort')
+
+    fn = args.out + '_clus' + str(clusChos) + '_seed' + str(args.seed)
+    res.to_csv(fn + '.resKclus.tsv', sep='\t', index=False)
+    pd.DataFrame(km.cluster_centers_, columns=samples).to_csv(
+        fn + '.centers.tsv', sep='\t', index=False
+        )
+    bedder(res, fn)
+    sys.stdout.write(
+        '\t' + fn + '.resKclus.tsv\n' + \
+        '\t' + fn + '.centers.tsv\n' + \
+        '\t' + fn + '.reproPeak.bed\n'
+        )
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/local/bin/python3
+'''
+#Run_stages_of_several_projects_in_one_process:
+sub = damMer_submit.Submitter(damMer_context.sbatchArgs, inflight=16)
+ctxA = damMer_context.Context('/path/to/projectA', 'me@uni.ac.uk', sub=sub)
+ctxB = damMer_context.Context('/path/to/projectB', 'me@uni.ac.uk', sub=sub)
+with concurrent.futures.ThreadPoolExecutor() as pool:
+    futs = [pool.submit(damMer_tracks.quantNorm, c, c.dir + '/Cph_tracks', qnause, True) for c in (ctxA, ctxB)]
+'''
+
+import os
+import re
+import shlex
+import logging
+import threading
+import damMer_metrics
+import damMer_submit
+import damMer_retry
+
+sbatchArgs = ['--partition=IACT', '-m', 'cyclic:fcyclic']
+tmpl = """\
+#!/bin/bash
+#!
+#! Name of the job:
+#SBATCH -J {name}
+#SBATCH --mail-type=END
+#SBATCH -m cyclic:fcyclic
+#SBATCH -N 1
+#SBATCH -n 8
+#SBATCH -p IACT
+#SBATCH --mail-user={mail}
+
+JOBID=$SLURM_JOB_ID
+
+echo -e "JobID: $JOBID\\n======"
+echo "Time: `date`"
+echo "Running on master node: `hostname`"
+echo "Current directory: `pwd`"
+echo -e "\\nExecuting command:\\n==================\\n{SBATCH_CMD}\\n"
+
+eval {SBATCH_CMD}
+"""
+tmplScratch = """\
+#!/bin/bash
+#!
+#! Name of the job:
+#SBATCH -J {name}
+#SBATCH --mail-type=END
+#SBATCH -m cyclic:fcyclic
+#SBATCH -N 1
+#SBATCH -n 8
+#SBATCH -p IACT
+#SBATCH --mail-user={mail}
+
+JOBID=$SLURM_JOB_ID
+DEST=`pwd`
+
+##Node-local_scratch_(removed_on_exit)
+SCRATCH=`mktemp -d "{scratch}/damMer.$JOBID.XXXXXX"` || exit 1
+trap 'rm -rf "$SCRATCH"' EXIT
+
+echo -e "JobID: $JOBID\\n======"
+echo "Time: `date`"
+echo "Running on master node: `hostname`"
+echo "Current directory: $DEST"
+echo "Scratch directory: $SCRATCH"
+echo -e "\\nExecuting command:\\n==================\\n{SBATCH_CMD}\\n"
+
+##Stage_inputs
+cp -p {stage} "$SCRATCH"/ || exit 1
+cd "$SCRATCH"
+ls -A > .staged
+
+eval {SBATCH_CMD} > .job.log 2>&1
+STATUS=$?
+
+##Copy_new_files_back_atomically_(rename_within_destination)
+for f in * .[!.]*; do
+    [ -e "$f" ] || continue
+    if [ "$f" = .staged ] || [ "$f" = .job.log ] || grep -qxF "$f" .staged; then
+        continue
+    fi
+    cp -rp "$f" "$DEST/.$f.part" && mv -f "$DEST/.$f.part" "$DEST/$f" || STATUS=1
+done
+
+##Log_only_after_all_products_are_in_place
+cd "$DEST"
+cat "$SCRATCH/.job.log"
+exit $STATUS
+"""
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+class Context(object):
+    '''
+    State of one project: directory, slurm-script counter, mail address,
+    scratch, log & its metrics recorder, submitter, supervisor & an optional
+    submission broker ('damMer_broker.py'). Stages of
+    'damMer.py', 'damMer_tracks.py' & 'damMer_peaks.py' take a context
+    and explicit paths instead of changing the working directory, so
+    several projects & stages can run in threads of one process. A
+    submitter may be shared to bound 'sbatch'-calls across projects.
+    '''
+
+    def __init__(self, dir, mail='', scratch=None, sub=None, rec=None, ledger=None, retries=2, broker=None):
+        self.dir = os.path.abspath(dir)
+        self.mail = mail
+        self.scratch = scratch
+        self.rec = rec if rec else damMer_metrics.Recorder()
+        self.sub = sub if sub else damMer_submit.Submitter(sbatchArgs)
+        self.broker = broker
+        self.sup = damMer_retry.Supervisor(self.sub, ledger, retries, onSubmit=self.rec.job, broker=broker)
+        self.shItr = 1
+        self.lock = threading.Lock()
+        ##Project_log_(handlers_added_by_'damMer.py')
+        self.log = logging.getLogger('damMer:' + self.dir)
+        self.log.propagate = False
+        self.logname = None
+
+    def script(self, cmd, dir=None, stage=None):
+        '''
+        Write the slurm-script of a command into 'dir' (default: project dir).
+        With 'scratch', 'stage'd inputs are copied to node-local scratch,
+        the command runs there & new files are copied back.
+        '''
+
+        ##Python_scripts_(run_via_'sys.executable')_are_named_after_the_script
+        toks = cmd.split(" ")
+        if re.compile('^python[\d.]*$').search(os.path.basename(toks[0])) and len(toks) > 1:
+            toks = toks[1:]
+        cmdName = re.compile('\..*').sub('', os.path.basename(toks[0]))
+        with self.lock:
+            itr = self.shItr
+            self.shItr += 1
+        fileName = os.path.join(dir if dir else self.dir, str(itr) + "_" + cmdName + ".sh")
+        with open(fileName, 'w') as shOUT:
+            if self.scratch and stage:
+                shOUT.write(tmplScratch.format(
+                    name=cmdName, SBATCH_CMD=cmd, mail=self.mail, scratch=self.scratch,
+                    stage=' '.join(shlex.quote(f) for f in stage)
+                    ))
+            else:
+                shOUT.write(tmpl.format(name=cmdName, SBATCH_CMD=cmd, mail=self.mail))
+        return(fileName)
+
+    def submit(self, cmdSH, dpdIDs='', after=None, extra=None, cwd=None):
+        '''
+        Submit a slurm-script from 'cwd' (default: its directory) without blocking.
+        dpdIDs should have format: 'afterok:<jobID1>:<jobID2>:etc.'
+        Returns a future of the jobID ('ctx.sub.collect()' waits for it).
+        '''
+
+        return(self.sup.submit(cmdSH, dpdIDs, after, extra, cwd if cwd else os.path.dirname(cmdSH)))
@@ -0,0 +1,268 @@
+#!/usr/local/bin/python3
+'''
+#Show_or_clear_the_cached_tool_&_index_resolution:
+python3 damMer_env.py
+python3 damMer_env.py --clear
+'''
+
+import argparse
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import subprocess
+
+cacheDefault = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'damMer', 'env.json'
+    )
+suffices = ['.1.bt2', '.2.bt2', '.3.bt2', '.4.bt2', '.rev.1.bt2', '.rev.2.bt2']
+policies = ['auto', 'chosen', 'detected', 'ask']
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Cached resolution of tools, versions & bowtie2-indices."
+        )
+
+    parser.add_argument(
+        "-E", "--envcache",
+        type = str,
+        default = cacheDefault,
+        help = "Cache of resolved tools & indices."
+        )
+    parser.add_argument(
+        "--clear",
+        action = "store_true",
+        help = "Remove all cached entries."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def stamp(path):
+    '''mtime & size identifying the current state of a file.'''
+    st = os.stat(path)
+    return([st.st_mtime_ns, st.st_size])
+
+def version(path):
+    '''First line reported by '<tool> --version' (empty if none).'''
+
+    try:
+        prc = subprocess.run(
+            [path, '--version'],
+            stdin = subprocess.DEVNULL,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.STDOUT,
+            timeout = 30
+            )
+    except (OSError, subprocess.TimeoutExpired):
+        return('')
+    lines = [l for l in prc.stdout.decode('utf-8', 'replace').splitlines() if l.strip()]
+    return(lines[0].strip() if lines else '')
+
+class Resolver(object):
+    '''
+    Resolve tools & validate indices once; later launches reuse the cached
+    result as long as the resolved file is unchanged (mtime & size).
+    Conflicts between chosen & detected tools follow a policy instead of
+    blocking on stdin: 'auto' asks once on a terminal & uses the chosen
+    path otherwise.
+    '''
+
+    def __init__(self, cache=cacheDefault, policy='auto'):
+        self.cache = cache
+        self.policy = policy
+        self.log = logging.getLogger('damMer')
+        self.log.addHandler(logging.NullHandler())
+        self.data = None
+
+    def configure(self, cache=None, policy=None):
+        '''Set cache file & conflict policy.'''
+
+        if cache:
+            self.cache = cache
+            self.data = None
+        if policy:
+            self.policy = policy
+
+    def load(self):
+        if self.data is None:
+            try:
+                with open(self.cache, 'r') as inFile:
+                    self.data = json.load(inFile)
+            except (OSError, ValueError):
+                self.data = dict()
+            self.data.setdefault('tools', dict())
+            self.data.setdefault('indices', dict())
+        return(self.data)
+
+    def save(self):
+        '''Write the cache atomically; an unwritable cache is skipped.'''
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache)), exist_ok=True)
+            tmp = self.cache + '.' + str(os.getpid())
+            with open(tmp, 'w') as outFile:
+                json.dump(self.data, outFile, indent=1, sort_keys=True)
+            os.replace(tmp, self.cache)
+        except OSError as e:
+            self.log.warning('Cache not written: ' + self.cache + ' (' + str(e) + ')')
+
+    def effective(self):
+        '''Policy in effect: 'auto' & 'ask' without terminal resolve to 'ask' or 'chosen'.'''
+
+        if self.policy == 'auto' or self.policy == 'ask':
+            return('ask' if sys.stdin.isatty() else 'chosen')
+        return(self.policy)
+
+    def decide(self, tool, tcho, tdet):
+        '''Chosen vs. detected installation according to the policy.'''
+
+        policy = self.effective()
+        if self.policy == 'ask' and policy == 'chosen':
+            self.log.warning('No terminal to ask; using chosen ' + tcho)
+
+        if policy == 'chosen':
+            return(tcho)
+        if policy == 'detected':
+            return(tdet)
+
+        while True:
+            desc = input('Use: [1 - ' + tcho + '] or [2 - ' + tdet + ']?\n')
+            if desc == "1" or desc == tcho:
+                return(tcho)
+            elif desc == "2" or desc == tdet:
+                return(tdet)
+            else:
+                sys.stdout.write('\nNot a valid choice.\n')
+
+    def tool(self, toolPath, getVersion=False):
+        '''Checking paths of used tools (cf. 'checkt()').'''
+
+        tool = os.path.basename(toolPath)
+        self.log.info('Checking: ' + tool)
+        sys.stdout.write('\t' + tool + '\n')
+
+        ##Cached_resolution
+        ##-----------------
+        data = self.load()
+        ##Choices_are_cached_per_policy_(e.g.,_an_answer_does_not_override_'chosen')
+        key = os.path.abspath(toolPath) + '|' + os.environ.get('PATH', '') + '|' + self.effective()
+        hit = data['tools'].get(key)
+        if hit:
+            try:
+                if stamp(hit['use']) == hit['stamp'] and (hit['version'] is not None or not getVersion):
+                    self.log.info(tool + ' used (cached): ' + hit['use'] + \
+                        ((' [' + hit['version'] + ']') if hit['version'] else ''))
+                    return(hit['use'])
+            except OSError:
+                pass
+
+        ##Resolve
+        ##-------
+        tcho = toolPath if os.path.exists(toolPath) else ""
+        tdet = shutil.which(tool) or ""
+
+        if tcho == "" and tdet == "":
+            ##Neither_chosen_nor_detected_dir_exists
+            self.log.error('Not found: ' + toolPath)
+            self.log.error('Not found: ' + tool)
+            sys.exit('Error: Not found: ' + tool + \
+                '\nUse python3 damMer.py --help.\n')
+        elif tcho == tdet or tdet == "":
+            ##Chosen_&_detected_similar_or_only_chosen
+            tuse = tcho
+        elif tcho == "":
+            ##Detected_but_not_chosen_dir_exist
+            self.log.warning('"' + toolPath + '" not default installation: "' + tdet + '"')
+            sys.stdout.write(toolPath + '" not default installation: "' + tdet + '"\n')
+            tuse = tdet
+        else:
+            ##Chosen_&_detected_dirs_exist_but_are_not_similar
+            self.log.warning('"' + tcho + '" not default installation: "' + tdet + '"')
+            sys.stdout.write(tcho + '" not default installation: "' + tdet + '"\n')
+            tuse = self.decide(tool, tcho, tdet)
+            sys.stdout.write(tool + ' used: ' + tuse + '\n')
+
+        ver = version(tuse) if getVersion else None
+        self.log.info(tool + ' used: ' + tuse + ((' [' + ver + ']') if ver else ''))
+        data['tools'][key] = {
+            'use': tuse,
+            'stamp': stamp(tuse),
+            'version': ver,
+            'checked': time.time()
+            }
+        self.save()
+        return(tuse)
+
+    def index(self, indices, species=None):
+        '''Check path and validity of bowtie2-indices (cf. 'checki()').'''
+
+        self.log.info('Checking: ' + indices)
+        sys.stdout.write('\t' + indices + '\n')
+
+        ##Unchanged_index_directory:_no_file_added_or_removed
+        ##---------------------------------------------------
+        data = self.load()
+        key = os.path.abspath(indices)
+        dirName = os.path.dirname(key)
+        hit = data['indices'].get(key)
+        try:
+            if hit and stamp(dirName) == hit['stamp']:
+                self.log.info(os.path.basename(indices) + '-indices validated (cached).')
+                return
+        except OSError:
+            pass
+
+        for s in suffices:
+            index = indices + s
+            if not os.path.isfile(index):
+                self.log.error('Index missing: ' + index)
+                sys.exit('Error: Index missing: ' + index + '\n')
+
+        self.log.info(os.path.basename(indices) + '-indices validated.')
+        data['indices'][key] = {
+            'species': species,
+            'stamp': stamp(dirName),
+            'checked': time.time()
+            }
+        self.save()
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if args.clear:
+        if os.path.exists(args.envcache):
+            os.remove(args.envcache)
+        sys.stdout.write('Removed:\t' + args.envcache + '\n')
+        return
+
+    res = Resolver(args.envcache)
+    data = res.load()
+    sys.stdout.write('\n>Tools\n')
+    for k, v in sorted(data['tools'].items()):
+        keys = k.split('|')
+        sys.stdout.write('\t' + keys[0] + '\t' + v['use'] + \
+            ('\t' + v['version'] if v.get('version') else '') + \
+            ('\t(' + keys[-1] + ')' if len(keys) > 2 else '') + '\n')
+    sys.stdout.write('\n>Indices\n')
+    for k, v in sorted(data['indices'].items()):
+        sys.stdout.write('\t' + k + '\t' + str(v.get('species')) + '\n')
+
+if __name__ == '__main__':
+    main()
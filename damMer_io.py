@@ -0,0 +1,220 @@
+#!/usr/local/bin/python3
+'''
+#GATC-fragment_track_(categorical_chromosomes_without_'chr'):
+df = damMer_io.bedgraph('Cph_tracks/Cph.gatc.bedgraph')
+#Chunks_of_a_large_track:
+for blk in damMer_io.bedgraph('Cph_tracks/Cph.gatc.bedgraph.gz', chunksize=2000000): ...
+#Peaks_of_'*.broadPeak'-,_'*.regionPeak'-_&_'*.mergePeak'-files:
+df = damMer_io.peaks('Cph_peaks/Cph-vs-Dam_peaks.broadPeak')
+df = damMer_io.peaks('Cph_peaks/37.5.regionPeak', cols=['chr', 'start', 'end', 'pkID'])
+#Parse_times_&_memory_of_files:
+python3 damMer_io.py Cph_tracks/*.bedgraph Cph_peaks/*.broadPeak
+'''
+
+import argparse
+import os
+import sys
+import re
+import time
+import importlib.util
+import numpy as np
+import pandas as pd
+import damMer_bgzf
+
+##Multithreaded_parsing_if_'pyarrow'_is_installed_(imported_by_pandas_on_use)
+engine = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+bedgraphCols = ['chr', 'start', 'end', 'score']
+broadPeakCols = ['chr', 'start', 'end', 'pkID', 'dis', 'nd', 'fc', 'neglog10pval', 'neglog10qval']
+types = {
+    'chr': 'category',
+    'start': np.int64,
+    'end': np.int64,
+    'score': np.float64,
+    'pkID': str,
+    'name': str,
+    'sign': str,
+    'dis': np.int64,
+    'nd': str,
+    'fc': np.float64,
+    'neglog10pval': np.float64,
+    'neglog10qval': np.float64,
+    'q': np.float64
+    }
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Shared reader of '*.bedgraph'- & '*Peak'-files: parse times & memory."
+        )
+
+    parser.add_argument(
+        "files",
+        nargs = '+',
+        type = str,
+        help = "List of '*.bedgraph(.gz)'- & '*Peak(.gz)'-files."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def chrName(chrom):
+    '''Chromosome names without 'chr' (cf. 'quantile_norm_bedgraph.pl').'''
+    return(re.sub('^chr', '', str(chrom)))
+
+def chromosomes(chrom):
+    '''
+    Categorical chromosomes without 'chr': names are normalized once per
+    category (not per row); categories are sorted as strings, so sorting
+    by chromosome is lexicographic as before.
+    '''
+
+    cat = pd.Series(chrom).astype('category').cat
+    names = np.array([chrName(c) for c in cat.categories], dtype=object)
+    cats, lut = np.unique(names.astype(str), return_inverse=True)
+    codes = cat.codes.to_numpy()
+    codes = np.where(codes >= 0, lut.reshape(-1)[np.maximum(codes, 0)], -1)
+    return(pd.Categorical.from_codes(codes, categories=cats))
+
+def concat(frames):
+    '''Concatenate frames keeping one categorical 'chr' (union of all chromosomes).'''
+
+    frames = list(frames)
+    df = pd.concat(frames, ignore_index=True)
+    if len(frames):
+        df['chr'] = chromosomes(df['chr'].astype(str).where(df['chr'].notna()))
+    return(df)
+
+def skipper(file):
+    '''Lines to skip: 1 for a leading track line.'''
+
+    with damMer_bgzf.opener(file) as inFile:
+        first = inFile.readline()
+    return(1 if first.startswith('track') else 0)
+
+def emptier(cols, dtypes):
+    '''Empty frame with the column types of a non-empty one.'''
+
+    df = pd.DataFrame({c: pd.Series(dtype=object if dtypes[c] is str else dtypes[c]) for c in cols})
+    df['chr'] = chromosomes(df['chr'])
+    return(df)
+
+def table(file, cols, dtypes, usecols=None, chunksize=None, empty='exit'):
+    '''
+    Read a tab-separated BED-like file with fixed column types & categorical
+    chromosomes (with or without track line): multithreaded with 'pyarrow'
+    where installed, else with the C parser (memory-mapped if uncompressed).
+    Chunked reading ('chunksize') always uses the C parser.
+    Empty files exit ('exit'), warn ('warn') or return an empty frame (None).
+    '''
+
+    usecols = list(range(len(cols))) if usecols is None else list(usecols)
+    dtypes = {c: dtypes.get(c, str) for c in cols}
+    if os.path.getsize(file) == 0:
+        return(emptied(file, cols, dtypes, empty))
+
+    opts = dict(
+        sep = '\t',
+        header = None,
+        skiprows = skipper(file),
+        usecols = usecols,
+        names = cols,
+        dtype = dtypes
+        )
+    try:
+        if engine == 'pyarrow' and chunksize is None:
+            try:
+                df = pd.read_csv(file, engine='pyarrow', **opts)
+            except (ValueError, TypeError):
+                df = None
+            if df is not None:
+                df['chr'] = chromosomes(df['chr'])
+                return(df)
+        rd = pd.read_csv(
+            file,
+            engine = 'c',
+            memory_map = not file.endswith('.gz'),
+            chunksize = chunksize,
+            **opts
+            )
+    except pd.errors.EmptyDataError:
+        return(emptied(file, cols, dtypes, empty))
+
+    if chunksize is None:
+        rd['chr'] = chromosomes(rd['chr'])
+        return(rd)
+    return(chunker(rd))
+
+def chunker(rd):
+    '''Chunks with chromosome names normalized per chunk.'''
+
+    for blk in rd:
+        blk['chr'] = chromosomes(blk['chr'])
+        yield(blk)
+
+def emptied(file, cols, dtypes, empty):
+    '''Handle an empty file (cf. 'table()').'''
+
+    if empty == 'exit':
+        sys.exit("\nEmpty file:\t" + file + "\n")
+    if empty == 'warn':
+        sys.stderr.write('WARNING: Empty file: ' + file + '\n')
+    return(emptier(cols, dtypes))
+
+def bedgraph(file, chunksize=None):
+    '''
+    '*.bedgraph'-file as 'chr' (categorical), 'start', 'end' & 'score'
+    (float64, as GATC-fragment ends may be half-integers).
+    '''
+
+    return(table(
+        file,
+        bedgraphCols,
+        {'chr': 'category', 'start': np.float64, 'end': np.float64, 'score': np.float64},
+        chunksize = chunksize
+        ))
+
+def peaks(file, cols=broadPeakCols, usecols=None, empty='exit'):
+    '''
+    '*.broadPeak'-, '*.regionPeak'-, '*.mergePeak'- & '*.reproPeak'-files:
+    'cols' name the first columns (or those of 'usecols').
+    '''
+
+    return(table(file, list(cols), types, usecols=usecols, empty=empty))
+
+def sizer(df):
+    '''Memory of a frame in MB.'''
+    return(df.memory_usage(index=True, deep=True).sum() / 1e6)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sys.stdout.write('\n>Read files (' + engine + ')\n')
+    sys.stdout.write('\tfile\trows\tchromosomes\tMB\tseconds\n')
+    for f in args.files:
+        t0 = time.time()
+        if re.compile('\.bedgraph(\.gz)?$').search(f):
+            df = bedgraph(f)
+        else:
+            df = peaks(f, cols=['chr', 'start', 'end'], empty=None)
+        sys.stdout.write('\t' + '\t'.join([
+            os.path.basename(f), str(len(df)), str(len(df['chr'].cat.categories)),
+            '%.1f' % sizer(df), '%.2f' % (time.time() - t0)
+            ]) + '\n')
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
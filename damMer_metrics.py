@@ -0,0 +1,427 @@
+#!/usr/local/bin/python3
+'''
+#Timing_&_resource_metrics_shared_by_all_damMer_scripts.
+#Harvest_slurm_accounting_of_finished_jobs_&_refresh_textfile:
+python3 damMer_metrics.py -j project/damMer.metrics.jsonl -p /var/lib/node_exporter/damMer.prom
+'''
+
+import argparse
+import os
+import sys
+import re
+import json
+import time
+import socket
+import resource
+import subprocess
+import threading
+from contextlib import contextmanager
+
+finStates = (
+    'COMPLETED', 'FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'CANCELLED', \
+    'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE'
+    )
+sacctFmt = (
+    'JobID', 'JobName', 'State', 'Submit', 'Start', 'End', \
+    'ElapsedRaw', 'TotalCPU', 'MaxRSS', 'MaxDiskRead', 'MaxDiskWrite'
+    )
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Harvest slurm accounting for recorded jobs & export metrics."
+        )
+
+    parser.add_argument(
+        "-j", "--jsonl",
+        nargs = '*',
+        type = str,
+        required = True,
+        help = "'*.metrics.jsonl'-files written by the damMer scripts."
+        )
+    parser.add_argument(
+        "-p", "--promfile",
+        type = str,
+        default = None,
+        help = "Prometheus textfile for the node exporter."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def procIO():
+    '''Bytes read & written by the current process so far.'''
+
+    io = {'rchar': 0, 'wchar': 0}
+    try:
+        with open('/proc/self/io', 'r') as inFile:
+            for l in inFile:
+                k, v = l.split(':')
+                io[k.strip()] = int(v)
+    except (OSError, ValueError):
+        pass
+    return(io['rchar'], io['wchar'])
+
+def resetPeak():
+    '''Reset peak RSS of the current process (Linux >= 4.0).'''
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as outFile:
+            outFile.write('5')
+        return(True)
+    except OSError:
+        return(False)
+
+def peakRSS():
+    '''Peak RSS in bytes since last reset (falls back on lifetime maximum).'''
+
+    try:
+        with open('/proc/self/status', 'r') as inFile:
+            for l in inFile:
+                if l.startswith('VmHWM:'):
+                    return(int(l.split()[1]) * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+def cpuTimes():
+    '''User & system time of the current process & its children.'''
+    t = os.times()
+    return(t.user + t.system, t.children_user + t.children_system)
+
+class Recorder(object):
+    '''
+    Collect per-stage & per-job metrics of one script invocation.
+    Records are appended to a '*.metrics.jsonl'-file once configured;
+    an unconfigured recorder only times.
+    '''
+
+    def __init__(self):
+        self.script = os.path.basename(sys.argv[0]) if sys.argv else ''
+        self.project = None
+        self.jsonl = None
+        self.promfile = None
+        self.run = time.strftime("%Y%m%dT%H%M%S", time.localtime()) + \
+            '-' + str(os.getpid())
+        self.records = list()
+        self.lock = threading.Lock()
+
+    def configure(self, script, jsonl, promfile=None, project=None):
+        '''Set output files & labels.'''
+
+        self.script = script
+        self.jsonl = os.path.abspath(jsonl) if jsonl else None
+        self.promfile = promfile
+        self.project = project
+        self.emit({
+            'type': 'run',
+            'host': socket.gethostname(),
+            'argv': sys.argv,
+            'start': time.time()
+            })
+
+    def emit(self, rec):
+        '''Append one record to memory & the '*.metrics.jsonl'-file.'''
+
+        rec = dict(rec, script=self.script, run=self.run, project=self.project)
+        with self.lock:
+            self.records.append(rec)
+            if self.jsonl:
+                with open(self.jsonl, 'a') as outFile:
+                    outFile.write(json.dumps(rec) + '\n')
+        return(rec)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        '''Time a stage of the python workflow.'''
+
+        resetPeak()
+        rd, wr = procIO()
+        cpu, cCpu = cpuTimes()
+        t0 = time.time()
+        tic = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            wall = time.perf_counter() - tic
+            cpu1, cCpu1 = cpuTimes()
+            rd1, wr1 = procIO()
+            self.emit(dict(
+                labels,
+                type = 'stage',
+                stage = name,
+                status = status,
+                start = t0,
+                wall_s = wall,
+                cpu_s = cpu1 - cpu,
+                children_cpu_s = cCpu1 - cCpu,
+                max_rss_bytes = peakRSS(),
+                read_bytes = rd1 - rd,
+                written_bytes = wr1 - wr
+                ))
+
+    def job(self, jobID, cmdSH, submit_s, dpdIDs=''):
+        '''Record a submitted slurm job.'''
+
+        self.emit({
+            'type': 'job',
+            'jobID': str(jobID),
+            'name': re.sub('^\d+_|\.sh$', '', os.path.basename(cmdSH)),
+            'sh': os.path.abspath(cmdSH),
+            'dependency': dpdIDs,
+            'submitted': time.time(),
+            'submit_s': submit_s
+            })
+
+    def harvest(self, jobIDs=None):
+        '''Add slurm accounting of finished jobs.'''
+
+        jobs = [r for r in self.records if r['type'] == 'job']
+        if jobIDs is not None:
+            jobIDs = set(str(j) for j in jobIDs)
+            jobs = [r for r in jobs if r['jobID'] in jobIDs]
+        done = set(r['jobID'] for r in self.records if r['type'] == 'jobacct')
+        pend = [r['jobID'] for r in jobs if r['jobID'] not in done]
+
+        for acct in sacct(pend):
+            self.emit(acct)
+
+    def close(self):
+        '''Write the Prometheus textfile for this & earlier runs.'''
+
+        if self.promfile:
+            recs = readRecords([self.jsonl]) if self.jsonl else self.records
+            promWriter(recs, self.promfile)
+
+def toSeconds(s):
+    '''Slurm time '[DD-[HH:]]MM:SS[.mmm]' in seconds.'''
+
+    if not s:
+        return(None)
+    days = 0
+    if '-' in s:
+        d, s = s.split('-', 1)
+        days = int(d)
+    parts = [float(p) for p in s.split(':')]
+    while len(parts) < 3:
+        parts.insert(0, 0.0)
+    return(days * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2])
+
+def toBytes(s):
+    '''Slurm memory '123K|M|G|T' in bytes.'''
+
+    if not s:
+        return(None)
+    m = re.match('^([\d\.]+)([KMGTP]?)$', s.strip())
+    if not m:
+        return(None)
+    fac = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4, 'P': 1024**5}
+    return(int(float(m.group(1)) * fac[m.group(2)]))
+
+def toEpoch(s):
+    '''Slurm timestamp in seconds since epoch.'''
+
+    try:
+        return(time.mktime(time.strptime(s, "%Y-%m-%dT%H:%M:%S")))
+    except (ValueError, TypeError):
+        return(None)
+
+def sacct(jobIDs):
+    '''Accounting of finished jobs, steps aggregated per job.'''
+
+    if not jobIDs:
+        return([])
+    try:
+        out = subprocess.check_output(
+            ['sacct', '-n', '-P', '-j', ','.join(jobIDs), \
+             '--format=' + ','.join(sacctFmt)],
+            stderr = subprocess.DEVNULL
+            ).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return([])
+
+    jobs = dict()
+    for l in out.strip().split('\n'):
+        f = dict(zip(sacctFmt, l.split('|')))
+        if len(f) != len(sacctFmt):
+            continue
+        base = f['JobID'].split('.')[0]
+        cur = jobs.setdefault(base, {
+            'type': 'jobacct',
+            'jobID': base,
+            'max_rss_bytes': 0,
+            'disk_read_bytes': 0,
+            'disk_written_bytes': 0
+            })
+        if f['JobID'] == base:
+            sub = toEpoch(f['Submit'])
+            sta = toEpoch(f['Start'])
+            end = toEpoch(f['End'])
+            cur.update({
+                'state': f['State'].split(' ')[0],
+                'submit': sub,
+                'start': sta,
+                'end': end,
+                'queue_wait_s': sta - sub if sta and sub else None,
+                'run_s': float(f['ElapsedRaw']) if f['ElapsedRaw'] else None,
+                'cpu_s': toSeconds(f['TotalCPU'])
+                })
+        for k, fk in [('max_rss_bytes', 'MaxRSS'), ('disk_read_bytes', 'MaxDiskRead'), \
+                      ('disk_written_bytes', 'MaxDiskWrite')]:
+            v = toBytes(f[fk])
+            if v is not None:
+                cur[k] = max(cur[k], v)
+
+    return([j for j in jobs.values() if j.get('state') in finStates])
+
+def readRecords(files):
+    '''Read records of one or more '*.metrics.jsonl'-files.'''
+
+    recs = list()
+    for fn in files:
+        if not fn or not os.path.isfile(fn):
+            continue
+        with open(fn, 'r') as inFile:
+            for l in inFile:
+                l = l.strip()
+                if l:
+                    recs.append(json.loads(l))
+    return(recs)
+
+def promLabels(**labels):
+    '''Prometheus label set.'''
+
+    return('{' + ','.join(
+        k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' \
+        for k, v in labels.items() if v is not None
+        ) + '}')
+
+def promWriter(recs, out):
+    '''Write gauges of the latest run per script & job aggregates, atomically.'''
+
+    lines = list()
+    def metric(name, help, samples):
+        if not samples:
+            return
+        lines.append('# HELP ' + name + ' ' + help)
+        lines.append('# TYPE ' + name + ' gauge')
+        for lab, val in samples:
+            lines.append(name + lab + ' ' + repr(float(val)))
+
+    ##Stages_of_latest_run_per_script_&_project
+    ##-----------------------------------------
+    latest = dict()
+    for r in recs:
+        if r['type'] == 'run':
+            latest[(r['script'], r.get('project'))] = r['run']
+    stages = [
+        r for r in recs \
+        if r['type'] == 'stage' and latest.get((r['script'], r.get('project'))) == r['run']
+        ]
+    for key, help in [
+            ('wall_s', 'Wall time of python stage in seconds.'),
+            ('cpu_s', 'CPU time of python stage in seconds.'),
+            ('children_cpu_s', 'CPU time of child processes (e.g., sbatch, squeue) in seconds.'),
+            ('max_rss_bytes', 'Peak RSS during python stage in bytes.'),
+            ('read_bytes', 'Bytes read during python stage.'),
+            ('written_bytes', 'Bytes written during python stage.')]:
+        metric(
+            'dammer_stage_' + re.sub('_s$', '_seconds', key),
+            help,
+            [(promLabels(script=r['script'], project=r.get('project'), stage=r['stage'], \
+                folder=r.get('folder')), r[key]) for r in stages]
+            )
+
+    ##Jobs_aggregated_per_script_&_job_name
+    ##-------------------------------------
+    names = {r['jobID']: (r['script'], r.get('project'), r['name']) for r in recs if r['type'] == 'job'}
+    subm = dict()
+    for r in recs:
+        if r['type'] == 'job':
+            s = subm.setdefault(names[r['jobID']], [0, 0.0])
+            s[0] += 1
+            s[1] += r['submit_s']
+    acct = dict()
+    for r in recs:
+        if r['type'] == 'jobacct' and r['jobID'] in names:
+            a = acct.setdefault(names[r['jobID']] + (r['state'],), {
+                'n': 0, 'queue_wait_s': 0.0, 'run_s': 0.0, 'cpu_s': 0.0, \
+                'max_rss_bytes': 0, 'disk_read_bytes': 0, 'disk_written_bytes': 0
+                })
+            a['n'] += 1
+            for k in ['queue_wait_s', 'run_s', 'cpu_s', 'disk_read_bytes', 'disk_written_bytes']:
+                a[k] += r.get(k) or 0
+            a['max_rss_bytes'] = max(a['max_rss_bytes'], r.get('max_rss_bytes') or 0)
+
+    lab = lambda k: promLabels(script=k[0], project=k[1], name=k[2])
+    labS = lambda k: promLabels(script=k[0], project=k[1], name=k[2], state=k[3])
+    metric('dammer_jobs_submitted', 'Submitted slurm jobs.', [(lab(k), v[0]) for k, v in subm.items()])
+    metric('dammer_job_submit_seconds', 'Total time spent in sbatch.', [(lab(k), v[1]) for k, v in subm.items()])
+    metric('dammer_jobs_finished', 'Finished slurm jobs.', [(labS(k), v['n']) for k, v in acct.items()])
+    for key, help in [
+            ('queue_wait_s', 'Total time between submission & start in seconds.'),
+            ('run_s', 'Total runtime of jobs in seconds.'),
+            ('cpu_s', 'Total CPU time of jobs in seconds.'),
+            ('disk_read_bytes', 'Total bytes read by jobs (maximum per step).'),
+            ('disk_written_bytes', 'Total bytes written by jobs (maximum per step).')]:
+        metric(
+            'dammer_job_' + re.sub('_s$', '_seconds', key),
+            help,
+            [(labS(k), v[key]) for k, v in acct.items()]
+            )
+    metric(
+        'dammer_job_max_rss_bytes',
+        'Peak RSS of jobs in bytes.',
+        [(labS(k), v['max_rss_bytes']) for k, v in acct.items()]
+        )
+
+    tmp = out + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w') as outFile:
+        outFile.write('\n'.join(lines) + '\n')
+    os.replace(tmp, out)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sys.stdout.write('\n>Harvest slurm accounting\n')
+    recs = list()
+    for fn in args.jsonl:
+        fRecs = readRecords([fn])
+        done = set(r['jobID'] for r in fRecs if r['type'] == 'jobacct')
+        pend = sorted(set(r['jobID'] for r in fRecs if r['type'] == 'job') - done)
+        new = sacct(pend)
+        with open(fn, 'a') as outFile:
+            for r in new:
+                src = [x for x in fRecs if x['type'] == 'job' and x['jobID'] == r['jobID']][0]
+                r = dict(r, script=src['script'], run=src['run'], project=src.get('project'))
+                outFile.write(json.dumps(r) + '\n')
+                fRecs.append(r)
+        sys.stdout.write(
+            '\t' + fn + '\t' + str(len(new)) + ' of ' + str(len(pend)) + ' pending jobs finished\n'
+            )
+        recs.extend(fRecs)
+
+    if args.promfile:
+        promWriter(recs, args.promfile)
+        sys.stdout.write('\n>Prometheus textfile\n\t' + args.promfile + '\n')
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,719 @@
+#!/usr/local/bin/python3
+'''
+#Quantile_normalize_&_average_'*.gatc.bedgraph'-files_chromosome_by_chromosome:
+python3 damMer_norm.py -m quant *.gatc.bedgraph
+python3 damMer_norm.py -m average -n Cph_tracks *.quant.norm.bedgraph
+#Read_from_&_write_to_a_fragment_x_sample_store_('damMer_store.py'):
+python3 damMer_norm.py -m quant -s Cph_tracks.store
+#Normalize_new_samples_of_a_store_&_update_the_average_from_running_sums:
+python3 damMer_norm.py -m add -n Cph_tracks -s Cph_tracks.store
+#Sharded_over_chromosomes_(rank_reference,_slurm_array,_concatenation):
+python3 damMer_norm.py -m quant -n Cph_tracks -p prepare -k 8 *.gatc.bedgraph
+python3 damMer_norm.py -m quant -p shard -i $SLURM_ARRAY_TASK_ID
+python3 damMer_norm.py -m quant -p concat
+'''
+
+import argparse
+import os
+import sys
+import re
+import shutil
+import json
+import numpy as np
+import pandas as pd
+import damMer_bgzf
+import damMer_io
+import damMer_store
+
+chunk = 1000000
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Streaming quantile normalization & averaging of '*.bedgraph'-files."
+        )
+
+    parser.add_argument(
+        "files",
+        nargs = '*',
+        type = str,
+        help = "List of '*.bedgraph'-files (or samples with '--store')."
+        )
+    parser.add_argument(
+        "-m", "--mode",
+        type = str,
+        required = True,
+        choices = ["quant", "average", "add"],
+        help = "Quantile normalization, averaging or adding new samples to a store."
+        )
+    parser.add_argument(
+        "-n", "--name",
+        type = str,
+        default = None,
+        help = "Name of the averaged track (default: current directory)."
+        )
+    parser.add_argument(
+        "-t", "--tmp",
+        type = str,
+        default = None,
+        help = "Directory for per-chromosome shards (default: '.damMer_norm' in cwd)."
+        )
+    parser.add_argument(
+        "-s", "--store",
+        type = str,
+        default = None,
+        help = "Fragment x sample store to read from & write to (cf. 'damMer_store.py')."
+        )
+    parser.add_argument(
+        "-z", "--bgzip",
+        action = "store_true",
+        help = "Write BGZF-compressed & tabix-indexed '*.bedgraph.gz'-files."
+        )
+    parser.add_argument(
+        "-p", "--phase",
+        type = str,
+        default = "all",
+        choices = ["all", "prepare", "shard", "concat"],
+        help = "Sharded mode ('quant' incl. averaging): reference ('prepare'), " + \
+            "one chromosome shard ('shard') or concatenation ('concat')."
+        )
+    parser.add_argument(
+        "-k", "--shards",
+        type = int,
+        default = 1,
+        help = "Number of chromosome shards ('prepare')."
+        )
+    parser.add_argument(
+        "-i", "--shard",
+        type = int,
+        default = None,
+        help = "Shard to process (default: $SLURM_ARRAY_TASK_ID)."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def shardPath(tmp, sample, chrom, kind):
+    '''Path of one per-chromosome shard.'''
+    return(os.path.join(tmp, str(sample), chrom + '.' + kind))
+
+def splitter(file, tmp, sample):
+    '''
+    Stream one '*.bedgraph'-file into per-chromosome binary shards
+    ('*.coords': start & end; '*.score': float64) & collect all scores.
+    Coordinates are float64 as GATC-fragment ends may be half-integers.
+    Returns chromosome order & number of fragments.
+    '''
+
+    os.makedirs(os.path.join(tmp, str(sample)), exist_ok=True)
+    chroms = list()
+    n = 0
+
+    reader = damMer_io.bedgraph(file, chunksize=chunk)
+    with open(os.path.join(tmp, str(sample), 'all.score'), 'wb') as allOut:
+        for blk in reader:
+            blk['score'].to_numpy().tofile(allOut)
+            n += len(blk)
+            for chrom, grp in blk.groupby('chr', sort=False, observed=True):
+                if chrom not in chroms:
+                    chroms.append(chrom)
+                with open(shardPath(tmp, sample, chrom, 'coords'), 'ab') as cOut:
+                    grp[['start', 'end']].to_numpy().tofile(cOut)
+                with open(shardPath(tmp, sample, chrom, 'score'), 'ab') as sOut:
+                    grp['score'].to_numpy().tofile(sOut)
+
+    return(chroms, n)
+
+def referencer(tmp, samples, ns):
+    '''
+    Genome-wide reference distribution: mean of the sorted scores of all samples.
+    Only one sorted column is held in memory at a time.
+    Returns the cumulative reference (length refN + 1).
+    '''
+
+    refN = max(ns)
+    ref = np.zeros(refN, dtype=np.float64)
+    grid = (np.arange(refN) + 0.5) / refN
+    for s, n in zip(samples, ns):
+        srt = np.sort(np.fromfile(os.path.join(tmp, str(s), 'all.score'), dtype=np.float64))
+        srt.tofile(os.path.join(tmp, str(s), 'sorted.score'))
+        if n == refN:
+            ref += srt
+        else:
+            ref += np.interp(grid, (np.arange(n) + 0.5) / n, srt)
+        os.remove(os.path.join(tmp, str(s), 'all.score'))
+        del srt
+    ref /= len(samples)
+    cumref = np.concatenate([[0.0], np.cumsum(ref)])
+    np.save(os.path.join(tmp, 'cumref.npy'), cumref)
+    return(cumref)
+
+def normalizer(scores, srt, cumref):
+    '''
+    Replace scores by the reference at their genome-wide rank;
+    tied scores get the mean reference over their ranks (cf. 'preprocessCore').
+    '''
+
+    n = len(srt)
+    refN = len(cumref) - 1
+    lo = np.searchsorted(srt, scores, side='left')
+    hi = np.searchsorted(srt, scores, side='right')
+    pos = np.arange(refN + 1)
+    cLo = np.interp(lo * refN / n, pos, cumref)
+    cHi = np.interp(hi * refN / n, pos, cumref)
+    return((cHi - cLo) / ((hi - lo) * refN / n))
+
+def loader(tmp, sample, chrom):
+    '''Coordinates & scores of one sample & chromosome.'''
+
+    cf = shardPath(tmp, sample, chrom, 'coords')
+    if not os.path.isfile(cf):
+        return(None, None)
+    coords = np.fromfile(cf, dtype=np.float64).reshape(-1, 2)
+    scores = np.fromfile(shardPath(tmp, sample, chrom, 'score'), dtype=np.float64)
+    return(coords, scores)
+
+def outOpener(out, bgzip):
+    '''Plain or BGZF-compressed output.'''
+    if bgzip:
+        return(damMer_bgzf.Writer(out + '.gz'))
+    return(open(out, 'w'))
+
+def chunkWriter(outFile, chrom, coords, scores):
+    '''Append one chromosome in bedgraph-format.'''
+
+    keep = ~np.isnan(scores)
+    coords = damMer_store.coordOut(coords[keep])
+    df = pd.DataFrame({
+        'chr': chrom,
+        'start': coords[:, 0],
+        'end': coords[:, 1],
+        'score': scores[keep]
+        })
+    if isinstance(outFile, damMer_bgzf.Writer):
+        outFile.frame(df, float_format='%.6g')
+    else:
+        df.to_csv(outFile, sep='\t', header=False, index=False, float_format='%.6g')
+
+def chromOrder(orders):
+    '''Chromosomes in order of first appearance across files.'''
+
+    chroms = list()
+    for o in orders:
+        for c in o:
+            if c not in chroms:
+                chroms.append(c)
+    return(chroms)
+
+def quantNorm(files, tmp, bgzip=False):
+    '''Quantile normalize all files, one chromosome at a time.'''
+
+    ##Pass_1:_shards_&_genome-wide_reference
+    ##--------------------------------------
+    sys.stdout.write('\n>Split & rank\n')
+    orders = list()
+    ns = list()
+    for i, f in enumerate(files):
+        sys.stdout.write('\t' + f + '\n')
+        o, n = splitter(f, tmp, i)
+        orders.append(o)
+        ns.append(n)
+    cumref = referencer(tmp, range(len(files)), ns)
+
+    ##Pass_2:_normalize_per_chromosome
+    ##--------------------------------
+    sys.stdout.write('\n>Normalize per chromosome\n')
+    outs = [re.sub('\.bedgraph(\.gz)?$', '', f) + '.quant.norm.bedgraph' for f in files]
+    srts = [
+        np.memmap(os.path.join(tmp, str(i), 'sorted.score'), dtype=np.float64, mode='r') \
+        for i in range(len(files))
+        ]
+    handles = [outOpener(o, bgzip) for o in outs]
+    try:
+        for chrom in chromOrder(orders):
+            sys.stdout.write('\t' + chrom + '\n')
+            for i in range(len(files)):
+                coords, scores = loader(tmp, i, chrom)
+                if coords is None:
+                    continue
+                chunkWriter(handles[i], chrom, coords, normalizer(scores, srts[i], cumref))
+    finally:
+        for h in handles:
+            h.close()
+
+    return([o + '.gz' for o in outs] if bgzip else outs)
+
+def averager(coordLs, scoreLs):
+    '''Mean per fragment across samples; fragments aligned by coordinates.'''
+
+    present = [i for i, c in enumerate(coordLs) if c is not None]
+    first = coordLs[present[0]]
+    if all(len(coordLs[i]) == len(first) and np.array_equal(coordLs[i], first) for i in present):
+        mat = np.column_stack([scoreLs[i] for i in present])
+        return(first, np.nanmean(mat, axis=1))
+
+    ##Outer_join_on_fragment_coordinates
+    ##----------------------------------
+    allC, inv = np.unique(
+        np.concatenate([coordLs[i] for i in present]), axis=0, return_inverse=True
+        )
+    inv = inv.reshape(-1)
+    bounds = np.cumsum([0] + [len(coordLs[i]) for i in present])
+    tot = np.zeros(len(allC))
+    cnt = np.zeros(len(allC))
+    for k, i in enumerate(present):
+        idx = inv[bounds[k]:bounds[k + 1]]
+        ok = ~np.isnan(scoreLs[i])
+        np.add.at(tot, idx[ok], scoreLs[i][ok])
+        np.add.at(cnt, idx[ok], 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return(allC, np.where(cnt > 0, tot / cnt, np.nan))
+
+def average(files, tmp, name, bgzip=False):
+    '''Average all files per GATC fragment, one chromosome at a time.'''
+
+    sys.stdout.write('\n>Split\n')
+    orders = list()
+    for i, f in enumerate(files):
+        sys.stdout.write('\t' + f + '\n')
+        o, n = splitter(f, tmp, i)
+        os.remove(os.path.join(tmp, str(i), 'all.score'))
+        orders.append(o)
+
+    sys.stdout.write('\n>Average per chromosome\n')
+    out = name + '.quant.norm.av.bedgraph'
+    with outOpener(out, bgzip) as outFile:
+        for chrom in chromOrder(orders):
+            sys.stdout.write('\t' + chrom + '\n')
+            loaded = [loader(tmp, i, chrom) for i in range(len(files))]
+            coords, mean = averager([l[0] for l in loaded], [l[1] for l in loaded])
+            chunkWriter(outFile, chrom, coords, mean)
+
+    return(out + '.gz' if bgzip else out)
+
+def storeQuant(store, samples, tmp, bgzip=False):
+    '''
+    Quantile normalize store columns; normalized columns are added as
+    '<sample>.quant.norm' & written out as '*.gatc.quant.norm.bedgraph'.
+    '''
+
+    ##Pass_1:_genome-wide_reference_from_typed_columns
+    ##------------------------------------------------
+    sys.stdout.write('\n>Rank store columns\n')
+    ns = list()
+    for i, smp in enumerate(samples):
+        sys.stdout.write('\t' + smp + '\n')
+        os.makedirs(os.path.join(tmp, str(i)), exist_ok=True)
+        n = 0
+        with open(os.path.join(tmp, str(i), 'all.score'), 'wb') as allOut:
+            for chrom in store.chroms:
+                vals = np.asarray(store.column(smp, chrom), dtype=np.float64)
+                vals = vals[~np.isnan(vals)]
+                vals.tofile(allOut)
+                n += len(vals)
+        ns.append(n)
+    cumref = referencer(tmp, range(len(samples)), ns)
+    np.save(os.path.join(store.path, 'reference.npy'), cumref)
+
+    ##Pass_2:_normalize_per_chromosome
+    ##--------------------------------
+    sys.stdout.write('\n>Normalize per chromosome\n')
+    outs = [smp + '.gatc.quant.norm.bedgraph' for smp in samples]
+    srts = [
+        np.memmap(os.path.join(tmp, str(i), 'sorted.score'), dtype=np.float64, mode='r') \
+        for i in range(len(samples))
+        ]
+    handles = [outOpener(o, bgzip) for o in outs]
+    try:
+        for chrom in store.chroms:
+            sys.stdout.write('\t' + chrom + '\n')
+            coords = np.asarray(store.coords(chrom))
+            for i, smp in enumerate(samples):
+                vals = np.asarray(store.column(smp, chrom), dtype=np.float64)
+                ok = ~np.isnan(vals)
+                norm = np.full(len(vals), np.nan)
+                norm[ok] = normalizer(vals[ok], srts[i], cumref)
+                store.put(smp + '.quant.norm', chrom, norm.astype(np.float32))
+                chunkWriter(handles[i], chrom, coords, norm)
+    finally:
+        for h in handles:
+            h.close()
+    store.register([smp + '.quant.norm' for smp in samples])
+
+    return([o + '.gz' for o in outs] if bgzip else outs)
+
+def sumWriter(store, name, chrom, mat):
+    '''
+    Running sum & count of normalized columns per fragment (unregistered
+    columns '<name>.quant.norm.av.sum' & '.n'; cf. 'storeAdd()').
+    '''
+
+    tot = np.nansum(mat, axis=1)
+    cnt = (~np.isnan(mat)).sum(axis=1)
+    store.put(name + '.quant.norm.av.sum', chrom, tot.astype(np.float32))
+    store.put(name + '.quant.norm.av.n', chrom, cnt.astype(np.float32))
+    return(tot, cnt)
+
+def sumRegister(store, name, samples):
+    '''Record the samples contained in the running sums of 'name'.'''
+
+    store.meta.setdefault('sums', dict())[name] = list(samples)
+    damMer_store.metaWriter(store.path, store.meta)
+
+def storeAverage(store, samples, name, bgzip=False):
+    '''Average store columns per GATC fragment, one chromosome at a time.'''
+
+    sys.stdout.write('\n>Average per chromosome\n')
+    out = name + '.quant.norm.av.bedgraph'
+    with outOpener(out, bgzip) as outFile:
+        for chrom in store.chroms:
+            sys.stdout.write('\t' + chrom + '\n')
+            mat = store.matrix(chrom, samples).astype(np.float64)
+            with np.errstate(invalid='ignore'):
+                tot, cnt = sumWriter(store, name, chrom, mat)
+                mean = np.where(cnt > 0, tot / np.maximum(cnt, 1), np.nan)
+            store.put(name + '.quant.norm.av', chrom, mean.astype(np.float32))
+            chunkWriter(outFile, chrom, np.asarray(store.coords(chrom)), mean)
+    store.register([name + '.quant.norm.av'])
+    sumRegister(store, name, samples)
+
+    return(out + '.gz' if bgzip else out)
+
+def storeAdd(store, samples, tmp, name, bgzip=False):
+    '''
+    Add samples to a normalized store: new samples are normalized against
+    the stored genome-wide reference & added to the running sums of the
+    average, so the cost does not depend on the samples already present.
+    '''
+
+    refP = os.path.join(store.path, 'reference.npy')
+    if not os.path.isfile(refP):
+        sys.exit("\nNo reference in store (run '--mode quant' first):\t" + store.path + "\n")
+    cumref = np.load(refP)
+
+    ##Running_sums_of_stores_averaged_before_(built_once)
+    ##---------------------------------------------------
+    if name not in store.meta.get('sums', dict()):
+        sys.stdout.write('\n>Build running sums\n')
+        prev = [s for s in store.samples if s.endswith('.quant.norm')]
+        for chrom in store.chroms:
+            sumWriter(store, name, chrom, store.matrix(chrom, prev).astype(np.float64))
+        sumRegister(store, name, prev)
+
+    ##Genome-wide_ranks_of_the_new_samples_only
+    ##-----------------------------------------
+    sys.stdout.write('\n>Rank new store columns\n')
+    for i, smp in enumerate(samples):
+        sys.stdout.write('\t' + smp + '\n')
+        os.makedirs(os.path.join(tmp, str(i)), exist_ok=True)
+        vals = np.concatenate([
+            np.asarray(store.column(smp, chrom), dtype=np.float64) for chrom in store.chroms
+            ])
+        np.sort(vals[~np.isnan(vals)]).tofile(os.path.join(tmp, str(i), 'sorted.score'))
+        del vals
+    srts = [
+        np.memmap(os.path.join(tmp, str(i), 'sorted.score'), dtype=np.float64, mode='r') \
+        for i in range(len(samples))
+        ]
+
+    ##Normalize_&_update_sums_per_chromosome
+    ##--------------------------------------
+    sys.stdout.write('\n>Normalize & update average per chromosome\n')
+    outs = [smp + '.gatc.quant.norm.bedgraph' for smp in samples]
+    av = name + '.quant.norm.av.bedgraph'
+    handles = [outOpener(o, bgzip) for o in outs + [av]]
+    try:
+        for chrom in store.chroms:
+            sys.stdout.write('\t' + chrom + '\n')
+            coords = np.asarray(store.coords(chrom))
+            tot = np.asarray(store.column(name + '.quant.norm.av.sum', chrom), dtype=np.float64)
+            cnt = np.asarray(store.column(name + '.quant.norm.av.n', chrom), dtype=np.float64)
+            for i, smp in enumerate(samples):
+                vals = np.asarray(store.column(smp, chrom), dtype=np.float64)
+                ok = ~np.isnan(vals)
+                norm = np.full(len(vals), np.nan)
+                norm[ok] = normalizer(vals[ok], srts[i], cumref)
+                store.put(smp + '.quant.norm', chrom, norm.astype(np.float32))
+                chunkWriter(handles[i], chrom, coords, norm)
+                tot[ok] += norm[ok].astype(np.float32)
+                cnt[ok] += 1
+            store.put(name + '.quant.norm.av.sum', chrom, tot.astype(np.float32))
+            store.put(name + '.quant.norm.av.n', chrom, cnt.astype(np.float32))
+            with np.errstate(invalid='ignore'):
+                mean = np.where(cnt > 0, tot / np.maximum(cnt, 1), np.nan)
+            store.put(name + '.quant.norm.av', chrom, mean.astype(np.float32))
+            chunkWriter(handles[-1], chrom, coords, mean)
+    finally:
+        for h in handles:
+            h.close()
+    store.register([smp + '.quant.norm' for smp in samples] + [name + '.quant.norm.av'])
+    sumRegister(store, name, store.meta['sums'][name] + [smp + '.quant.norm' for smp in samples])
+
+    outs = outs + [av]
+    return([o + '.gz' for o in outs] if bgzip else outs)
+
+##Sharded_mode:_prepare_->_slurm_array_over_chromosome_shards_->_concat
+##---------------------------------------------------------------------
+
+def manifestPath(tmp):
+    return(os.path.join(tmp, 'manifest.json'))
+
+def partPath(tmp, chrom, part):
+    '''Path of one per-chromosome output part ('av' for the average).'''
+    return(os.path.join(tmp, 'parts', chrom, str(part) + '.bedgraph'))
+
+def assigner(sizes, shards):
+    '''Chromosomes onto shards, largest first onto the least loaded shard.'''
+
+    assign = [list() for s in range(shards)]
+    load = [0] * shards
+    for chrom in sorted(sizes, key=lambda c: -sizes[c]):
+        s = load.index(min(load))
+        assign[s].append(chrom)
+        load[s] += sizes[chrom]
+    return(assign)
+
+def preparer(files, tmp, name, shards, bgzip=False, store=None):
+    '''
+    First pass of the sharded mode: genome-wide reference only (shards of
+    the files or typed store columns), chromosome assignment & manifest.
+    '''
+
+    sys.stdout.write('\n>Split & rank\n')
+    ns = list()
+    sizes = dict()
+    if store:
+        for i, smp in enumerate(files):
+            sys.stdout.write('\t' + smp + '\n')
+            os.makedirs(os.path.join(tmp, str(i)), exist_ok=True)
+            n = 0
+            with open(os.path.join(tmp, str(i), 'all.score'), 'wb') as allOut:
+                for chrom in store.chroms:
+                    vals = np.asarray(store.column(smp, chrom), dtype=np.float64)
+                    vals = vals[~np.isnan(vals)]
+                    vals.tofile(allOut)
+                    n += len(vals)
+            ns.append(n)
+            ##Columns_created_here:_array_tasks_only_write_their_chromosomes
+            store.add(smp + '.quant.norm')
+        store.add(name + '.quant.norm.av')
+        store.add(name + '.quant.norm.av.sum')
+        store.add(name + '.quant.norm.av.n')
+        chroms = store.chroms
+        sizes = {c: store.size(c) for c in chroms}
+        outs = [os.path.abspath(smp + '.gatc.quant.norm.bedgraph') for smp in files]
+    else:
+        orders = list()
+        for i, f in enumerate(files):
+            sys.stdout.write('\t' + f + '\n')
+            o, n = splitter(f, tmp, i)
+            orders.append(o)
+            ns.append(n)
+            for c in o:
+                sizes[c] = sizes.get(c, 0) + \
+                    os.path.getsize(shardPath(tmp, i, c, 'score')) // 8
+        chroms = chromOrder(orders)
+        outs = [
+            os.path.abspath(re.sub('\.bedgraph(\.gz)?$', '', f) + '.quant.norm.bedgraph') \
+            for f in files
+            ]
+    cumref = referencer(tmp, range(len(files)), ns)
+    if store:
+        np.save(os.path.join(store.path, 'reference.npy'), cumref)
+
+    assign = assigner(sizes, shards)
+    manifest = {
+        'files': files,
+        'outs': outs,
+        'average': os.path.abspath(name + '.quant.norm.av.bedgraph'),
+        'name': name,
+        'store': os.path.abspath(store.path) if store else None,
+        'chroms': chroms,
+        'assign': assign,
+        'bgzip': bgzip
+        }
+    with open(manifestPath(tmp), 'w') as outFile:
+        json.dump(manifest, outFile, indent=1)
+
+    sys.stdout.write('\n>Shards\n')
+    for s, a in enumerate(assign):
+        sys.stdout.write('\t' + str(s) + '\t' + ','.join(a) + '\n')
+    return(manifest)
+
+def sharder(tmp, shard):
+    '''
+    One array task: normalize & average the chromosomes of one shard
+    against the genome-wide reference; parts are written per chromosome.
+    '''
+
+    with open(manifestPath(tmp), 'r') as inFile:
+        manifest = json.load(inFile)
+    if shard >= len(manifest['assign']):
+        sys.exit("\nNo shard:\t" + str(shard) + "\n")
+    files = manifest['files']
+    name = manifest['name']
+    store = damMer_store.Store(manifest['store']) if manifest['store'] else None
+
+    cumref = np.load(os.path.join(tmp, 'cumref.npy'))
+    srts = [
+        np.memmap(os.path.join(tmp, str(i), 'sorted.score'), dtype=np.float64, mode='r') \
+        for i in range(len(files))
+        ]
+
+    sys.stdout.write('\n>Normalize & average shard ' + str(shard) + '\n')
+    for chrom in manifest['assign'][shard]:
+        sys.stdout.write('\t' + chrom + '\n')
+        os.makedirs(os.path.dirname(partPath(tmp, chrom, 'av')), exist_ok=True)
+        coordLs = list()
+        normLs = list()
+        for i in range(len(files)):
+            if store:
+                coords = np.asarray(store.coords(chrom))
+                vals = np.asarray(store.column(files[i], chrom), dtype=np.float64)
+                ok = ~np.isnan(vals)
+                norm = np.full(len(vals), np.nan)
+                norm[ok] = normalizer(vals[ok], srts[i], cumref)
+                store.put(files[i] + '.quant.norm', chrom, norm.astype(np.float32))
+                ##Average_of_the_stored_float32_columns_(cf._'storeAverage()')
+                normLs.append(norm.astype(np.float32).astype(np.float64))
+            else:
+                coords, scores = loader(tmp, i, chrom)
+                norm = None if coords is None else normalizer(scores, srts[i], cumref)
+                normLs.append(norm)
+            coordLs.append(coords)
+            if coords is not None:
+                with open(partPath(tmp, chrom, i), 'w') as outFile:
+                    chunkWriter(outFile, chrom, coords, norm)
+
+        coords, mean = averager(coordLs, normLs)
+        if store:
+            store.put(name + '.quant.norm.av', chrom, mean.astype(np.float32))
+            sumWriter(store, name, chrom, np.column_stack(normLs))
+        with open(partPath(tmp, chrom, 'av'), 'w') as outFile:
+            chunkWriter(outFile, chrom, coords, mean)
+
+def concater(tmp):
+    '''Concatenate all parts in chromosome order; BGZF-compress if requested.'''
+
+    with open(manifestPath(tmp), 'r') as inFile:
+        manifest = json.load(inFile)
+    missing = [c for c in manifest['chroms'] if not os.path.isfile(partPath(tmp, c, 'av'))]
+    if missing:
+        sys.exit("\nShards missing for:\t" + ' '.join(missing) + "\n")
+
+    sys.stdout.write('\n>Concatenate\n')
+    outs = list()
+    parts = list(range(len(manifest['outs']))) + ['av']
+    for part, out in zip(parts, manifest['outs'] + [manifest['average']]):
+        with open(out, 'wb') as outFile:
+            for chrom in manifest['chroms']:
+                if os.path.isfile(partPath(tmp, chrom, part)):
+                    with open(partPath(tmp, chrom, part), 'rb') as inFile:
+                        shutil.copyfileobj(inFile, outFile)
+        if manifest['bgzip']:
+            out = damMer_bgzf.compress(out)
+        sys.stdout.write('\t' + out + '\n')
+        outs.append(out)
+
+    if manifest['store']:
+        store = damMer_store.Store(manifest['store'])
+        store.register([smp + '.quant.norm' for smp in manifest['files']] + \
+            [manifest['name'] + '.quant.norm.av'])
+        sumRegister(store, manifest['name'], [smp + '.quant.norm' for smp in manifest['files']])
+    return(outs)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    tmp = args.tmp if args.tmp else os.path.join(os.getcwd(), '.damMer_norm')
+    name = args.name if args.name else os.path.basename(os.getcwd())
+
+    ##Sharded_mode:_'tmp'_persists_between_the_phases
+    ##-----------------------------------------------
+    if args.phase != "all":
+        if args.mode != "quant":
+            sys.exit("\nSharded phases require '--mode quant'.\n")
+        if args.phase == "prepare":
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            store = damMer_store.Store(args.store) if args.store else None
+            if store:
+                files = args.files if args.files else \
+                    [s for s in store.samples if not re.search('\.quant\.norm', s)]
+                miss = [s for s in files if s not in store.samples]
+                if miss or not files:
+                    sys.exit("\nNot in store:\t" + ' '.join(miss) + "\n")
+            elif not args.files:
+                sys.exit("\nNo '*.bedgraph'-files.\n")
+            else:
+                files = args.files
+            preparer(files, tmp, name, max(1, args.shards), args.bgzip, store)
+        elif args.phase == "shard":
+            shard = args.shard if args.shard is not None else \
+                int(os.environ.get('SLURM_ARRAY_TASK_ID', 0))
+            sharder(tmp, shard)
+        else:
+            outs = concater(tmp)
+            shutil.rmtree(tmp, ignore_errors=True)
+        sys.stdout.write('\nAll done.\n')
+        return
+
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        if args.store:
+            ##Samples_from_the_store:_raw_for_'quant',_normalized_for_'average'
+            store = damMer_store.Store(args.store)
+            norm = [s for s in store.samples if s.endswith('.quant.norm')]
+            if args.files:
+                samples = args.files
+            elif args.mode == "quant":
+                samples = [s for s in store.samples if not re.search('\.quant\.norm', s)]
+            elif args.mode == "add":
+                samples = [
+                    s for s in store.samples if not re.search('\.quant\.norm', s) \
+                    and s + '.quant.norm' not in store.samples
+                    ]
+                if not samples:
+                    sys.exit("\nNo new samples in store.\n")
+            else:
+                samples = norm
+            miss = [s for s in samples if s not in store.samples]
+            if miss or not samples:
+                sys.exit("\nNot in store:\t" + ' '.join(miss) + "\n")
+            if args.mode == "quant":
+                outs = storeQuant(store, samples, tmp, args.bgzip)
+            elif args.mode == "add":
+                outs = storeAdd(store, samples, tmp, name, args.bgzip)
+            else:
+                outs = [storeAverage(store, samples, name, args.bgzip)]
+        elif args.mode == "add":
+            sys.exit("\n'--mode add' requires '--store'.\n")
+        elif not args.files:
+            sys.exit("\nNo '*.bedgraph'-files.\n")
+        elif args.mode == "quant":
+            outs = quantNorm(args.files, tmp, args.bgzip)
+        else:
+            outs = [average(args.files, tmp, name, args.bgzip)]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    sys.stdout.write('\n>Output\n')
+    for o in outs:
+        sys.stdout.write('\t' + o + '\n')
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#!/usr/local/bin/python3
+'''
+#Index_all_'*.broadPeak'-files_of_a_peak_folder:
+python3 damMer_peakindex.py -x Cph_peaks/Cph_peaks.peakidx.npz -b Cph_peaks/*.broadPeak
+#Add_new_'*.broadPeak'-files:
+python3 damMer_peakindex.py -x Cph_peaks/Cph_peaks.peakidx.npz -a Cph_peaks/Cph4-vs-Dam2_peaks.broadPeak
+#Merged_&_reproducible_peaks_for_any_FDR_&_replicate_fraction:
+python3 damMer_peakindex.py -x Cph_peaks/Cph_peaks.peakidx.npz -q 37.5 -f 0.3 -n Cph
+#Saturation_curve_(peak_counts_vs._FDR):
+python3 damMer_peakindex.py -x Cph_peaks/Cph_peaks.peakidx.npz -s Cph_peaks.saturation.tsv
+'''
+
+import argparse
+import os
+import sys
+import re
+import time
+import numpy as np
+import pandas as pd
+import damMer_bgzf
+import damMer_io
+
+FDRs=(
+    2000, 1900, 1800, 1700, 1600, 1500, 1400, 1300, \
+    1200, 1100, 1000, 900, 800, 700, 600, 500, \
+    475, 450, 425, 400, 375, 350, 325, 300, \
+    275, 250, 225, 200, 175, 150, 125, 100, \
+    75, 50, 25, 10, 5, 3, 2, 1, 0
+    )
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Persistent peak index: merged & reproducible peaks for any FDR."
+        )
+
+    parser.add_argument(
+        "-x", "--index",
+        type = str,
+        required = True,
+        help = "Peak index ('*.peakidx.npz')."
+        )
+    parser.add_argument(
+        "-b", "--broadpeaks",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "List of '*.broadPeak'-files to (re-)build the index from."
+        )
+    parser.add_argument(
+        "-a", "--add",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "List of new '*.broadPeak'-files to add to an existing index."
+        )
+    parser.add_argument(
+        "-q", "--fdr",
+        nargs = '*',
+        type = float,
+        default = [],
+        help = "Thresholds (-log10 q-value) to write '*.mergePeak'- & '*.reproPeak'-files for."
+        )
+    parser.add_argument(
+        "-f", "--fraction",
+        type = float,
+        default = 0.5,
+        help = "Fraction of samples a merged peak has to exceed to be reproducible."
+        )
+    parser.add_argument(
+        "-n", "--name",
+        type = str,
+        default = None,
+        help = "Name column of '*.reproPeak'-files (default: index name)."
+        )
+    parser.add_argument(
+        "-s", "--saturation",
+        type = str,
+        default = None,
+        help = "TSV-file for peak counts vs. FDR ('-' for stdout)."
+        )
+    parser.add_argument(
+        "-z", "--bgzip",
+        action = "store_true",
+        help = "Write BGZF-compressed & tabix-indexed '*.mergePeak.gz'-/'*.reproPeak.gz'-files."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def peakReader(files, first=0):
+    '''
+    Peaks of '*.broadPeak'-files, sorted by chromosome (lexicographic as
+    in 'sorter()') & start; samples are numbered from 'first'.
+    '''
+
+    frames = list()
+    for i, f in enumerate(files):
+        df = damMer_io.peaks(
+            f, cols=['chr', 'start', 'end', 'q'], usecols=[0, 1, 2, 8], empty=None
+            )
+        df['sample'] = first + i
+        frames.append(df)
+    df = damMer_io.concat(frames)
+    return(df.sort_values(['chr', 'start'], kind='stable', ignore_index=True))
+
+def saver(path, arrays):
+    '''Write the index atomically.'''
+
+    tmp = path + '.' + str(os.getpid())
+    with open(tmp, 'wb') as outFile:
+        np.savez(outFile, **arrays)
+    os.replace(tmp, path)
+    return(PeakIndex(path))
+
+def builder(files, path):
+    '''
+    Index peaks of all '*.broadPeak'-files: chromosome, start, end,
+    -log10 q-value & sample per peak, sorted by chromosome & start.
+    '''
+
+    df = peakReader(files)
+    chr = df['chr'].cat.remove_unused_categories()
+    return(saver(path, {
+        'chroms': chr.cat.categories.to_numpy(dtype=str),
+        'samples': np.array([os.path.basename(f) for f in files], dtype=str),
+        'chrom': chr.cat.codes.to_numpy(dtype=np.int32),
+        'start': df['start'].to_numpy(dtype=np.int64),
+        'end': df['end'].to_numpy(dtype=np.int64),
+        'q': df['q'].to_numpy(dtype=np.float64),
+        'sample': df['sample'].to_numpy(dtype=np.int32)
+        }))
+
+def adder(files, path):
+    '''
+    Add '*.broadPeak'-files to an existing index: only the new peaks are
+    sorted & inserted into the sorted arrays (files already indexed are
+    skipped).
+    '''
+
+    idx = PeakIndex(path)
+    new = [f for f in files if os.path.basename(f) not in set(idx.samples)]
+    if not new:
+        return(idx)
+    df = peakReader(new, first=len(idx.samples))
+
+    ##Chromosome_codes_of_the_union_(lexicographic)
+    chroms = np.union1d(idx.chroms, df['chr'].to_numpy(dtype=str))
+    remap = np.searchsorted(chroms, idx.chroms).astype(np.int32)
+    oldC = remap[idx.chrom] if len(idx.chrom) else idx.chrom
+    newC = np.searchsorted(chroms, df['chr'].to_numpy(dtype=str)).astype(np.int32)
+    newS = df['start'].to_numpy(dtype=np.int64)
+
+    ##Insert_after_equal_keys:_order_as_if_indexed_together
+    off = np.int64(1) << 40
+    pos = np.searchsorted(oldC.astype(np.int64) * off + idx.start, newC.astype(np.int64) * off + newS, side='right')
+    return(saver(path, {
+        'chroms': chroms.astype(str),
+        'samples': np.concatenate([idx.samples, [os.path.basename(f) for f in new]]).astype(str),
+        'chrom': np.insert(oldC, pos, newC),
+        'start': np.insert(idx.start, pos, newS),
+        'end': np.insert(idx.end, pos, df['end'].to_numpy(dtype=np.int64)),
+        'q': np.insert(idx.q, pos, df['q'].to_numpy(dtype=np.float64)),
+        'sample': np.insert(idx.sample, pos, df['sample'].to_numpy(dtype=np.int32))
+        }))
+
+class PeakIndex(object):
+    '''
+    Peaks of one folder as sorted arrays. Merging overlapping (& book-ended)
+    peaks above a threshold is a single pass over the coordinate-sorted
+    arrays (cf. 'bedtools merge -c 4 -o count_distinct' in 'merger()').
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with np.load(path) as npz:
+                for k in ['chroms', 'samples', 'chrom', 'start', 'end', 'q', 'sample']:
+                    setattr(self, k, npz[k])
+        except OSError:
+            sys.exit("\nNo peak index:\t" + path + "\n")
+
+    def __len__(self):
+        return(len(self.start))
+
+    def merge(self, fdr):
+        '''
+        Merged peaks with -log10 q-value >= fdr.
+        Returns chromosome codes, starts, ends & number of distinct samples.
+        '''
+
+        keep = self.q >= fdr
+        chrom = self.chrom[keep]
+        start = self.start[keep]
+        end = self.end[keep]
+        if not len(start):
+            return(chrom, start, end, np.zeros(0, dtype=np.int64))
+
+        ##Chromosome_offsets:_one_running_maximum_across_the_genome
+        off = chrom.astype(np.int64) << 40
+        run = np.maximum.accumulate(off + end)
+        new = np.ones(len(start), dtype=bool)
+        new[1:] = (off + start)[1:] > run[:-1]
+        first = np.flatnonzero(new)
+        cl = np.cumsum(new) - 1
+
+        ##Distinct_samples_per_merged_peak
+        seen = np.zeros((len(first), max(len(self.samples), 1)), dtype=bool)
+        seen[cl, self.sample[keep]] = True
+        count = seen.sum(axis=1)
+        return(chrom[first], start[first], np.maximum.reduceat(end, first), count)
+
+    def merged(self, fdr, fraction=0.5, name=None):
+        '''
+        '*.mergePeak'- & '*.reproPeak'-tables for any threshold & fraction
+        (cf. 'merger()': reproducible if more than fraction x samples).
+        '''
+
+        aFS = len(self.samples)
+        chrom, start, end, count = self.merge(fdr)
+        rep = np.round((count / aFS) * 100, decimals=2)
+        mergDF = pd.DataFrame({
+            'chr': self.chroms[chrom],
+            'start': start,
+            'end': end,
+            'rep': rep,
+            'score': "0",
+            'strand': ".",
+            'thickStart': start,
+            'thickEnd': end,
+            'rgb': np.where(count > int(aFS / 2), "48,8,177", "213,24,14")
+            })
+        name = name if name else re.sub('\.peakidx\.npz$', '', os.path.basename(self.path))
+        rpoDF = (
+            mergDF
+            .loc[mergDF['rep'] > fraction * 100]
+            .iloc[:, np.r_[0:3]]
+            .assign(name = lambda x: str(name))
+            )
+        return(mergDF, rpoDF)
+
+    def saturation(self, fdrs=FDRs, fraction=0.5):
+        '''Peaks, merged & reproducible peaks per threshold.'''
+
+        aFS = len(self.samples)
+        rows = list()
+        for fdr in fdrs:
+            chrom, start, end, count = self.merge(fdr)
+            rows.append({
+                'fdr': fdr,
+                'peaks': int((self.q >= fdr).sum()),
+                'merged': len(start),
+                'repro': int((np.round((count / aFS) * 100, decimals=2) > fraction * 100).sum())
+                })
+        return(pd.DataFrame(rows, columns=['fdr', 'peaks', 'merged', 'repro']))
+
+def writer(fdr, df, out, bgzip=False):
+    '''Write peaks with track line (cf. 'damMer_peaks.writer()').'''
+
+    track = 'track name="' + str(fdr) + \
+        '" description="' + str(fdr) + \
+        '" visibility=2 itemRgb="On"\n'
+    if bgzip:
+        with damMer_bgzf.Writer(out + '.gz') as curFile:
+            curFile.header(track)
+            curFile.frame(df)
+        return(out + '.gz')
+    with open(out, 'w') as curFile:
+        curFile.write(track)
+        df.to_csv(curFile, sep='\t', header=False, index=False)
+    return(out)
+
+def fdrName(fdr):
+    '''Threshold as in the grid filenames (e.g., '50' instead of '50.0').'''
+    return(str(int(fdr)) if float(fdr).is_integer() else str(fdr))
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if args.broadpeaks:
+        sys.stdout.write('\n>Build peak index\n\t' + args.index + '\n')
+        idx = builder(args.broadpeaks, args.index)
+    elif args.add:
+        sys.stdout.write('\n>Add to peak index\n\t' + args.index + '\n')
+        idx = adder(args.add, args.index)
+    else:
+        idx = PeakIndex(args.index)
+    sys.stdout.write('\tSamples:\t' + str(len(idx.samples)) + '\n')
+    sys.stdout.write('\tPeaks:\t' + str(len(idx)) + '\n')
+
+    if args.fdr:
+        sys.stdout.write('\n>Query\n')
+    for fdr in args.fdr:
+        tic = time.perf_counter()
+        mergDF, rpoDF = idx.merged(fdr, args.fraction, args.name)
+        toc = time.perf_counter() - tic
+        mP = writer(fdr, mergDF, fdrName(fdr) + '.mergePeak', args.bgzip)
+        rpoP = writer(fdr, rpoDF, fdrName(fdr) + '.reproPeak', args.bgzip)
+        sys.stdout.write('\t' + mP + '\t' + str(len(mergDF)) + '\n')
+        sys.stdout.write('\t' + rpoP + '\t' + str(len(rpoDF)) + \
+            '\t(' + str(round(toc * 1000, 1)) + ' ms)\n')
+
+    if args.saturation:
+        sat = idx.saturation(FDRs, args.fraction)
+        if args.saturation == '-':
+            sat.to_csv(sys.stdout, sep='\t', index=False)
+        else:
+            sat.to_csv(args.saturation, sep='\t', index=False)
+            sys.stdout.write('\n>Saturation\n\t' + args.saturation + '\n')
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -7,19 +7,18 @@ import re
 import shlex
 import time
 import shutil
+import errno
 import subprocess
 import pandas as pd
 import numpy as np
 import pybedtools
+import damMer_metrics
+import damMer_bgzf
+import damMer_io
+import damMer_peakindex
 from difflib import SequenceMatcher
 
-FDRs=(
-    2000, 1900, 1800, 1700, 1600, 1500, 1400, 1300, \
-    1200, 1100, 1000, 900, 800, 700, 600, 500, \
-    475, 450, 425, 400, 375, 350, 325, 300, \
-    275, 250, 225, 200, 175, 150, 125, 100, \
-    75, 50, 25, 10, 5, 3, 2, 1, 0
-    )
+FDRs = damMer_peakindex.FDRs
 
 ##-----------------##
 ##----Arguments----##
@@ -42,6 +41,28 @@ def parse_args():
         required = True,
         help = "Directory for output."
         )
+    parser.add_argument(
+        "-z", "--bgzip",
+        action = "store_true",
+        help = "Write BGZF-compressed & tabix-indexed '*.mergePeak.gz'-/'*.reproPeak.gz'-files."
+        )
+    parser.add_argument(
+        "-A", "--add",
+        action = "store_true",
+        help = "Add new '--repos' to existing peak folders via the peak index."
+        )
+    parser.add_argument(
+        "-M", "--metrics",
+        type = str,
+        default = None,
+        help = "'*.metrics.jsonl'-file for timing & resource metrics."
+        )
+    parser.add_argument(
+        "-P", "--promfile",
+        type = str,
+        default = None,
+        help = "Prometheus textfile for the node exporter."
+        )
 
     arguments = parser.parse_args()
     return arguments
@@ -88,12 +109,15 @@ def evalDir(path):
         if exception.errno != errno.EEXIST:
             raise
 
-def createDir(ori,out,suf,files):
-    '''Create dir & copy '*.broadPeak'-files.'''
+def createDir(ori,out,suf,files,add=False):
+    '''Create dir & copy '*.broadPeak'-files (with 'add' only files not yet present).'''
 
-    dirName = evalDir(os.path.join(ori, str(out + suf)))
+    dirName = os.path.join(ori, str(out + suf))
+    evalDir(dirName)
     sys.stdout.write("\n>Copy '*.broadPeak'-files to " + dirName + '\n')
     for f in files:
+        if add and os.path.isfile(os.path.join(dirName, os.path.basename(f))):
+            continue
         sys.stdout.write('\t' + os.path.basename(f) + '\n')
         shutil.copy2(f, dirName)
 
@@ -106,7 +130,7 @@ def renamer(curDIR):
     ##-------------------
     try:
         sls = [ \
-            f for f in os.listdir() \
+            f for f in os.listdir(curDIR) \
             if re.compile('^slurm-.*\.out').search(f) \
             ]
     except IndexError:
@@ -128,70 +152,32 @@ def renamer(curDIR):
 
     ##Identify_'*.broadPeak'-file
     ##---------------------------
-    bP = os.path.abspath(
+    bP = os.path.join(
+        curDIR,
         [\
-            f for f in os.listdir() \
+            f for f in os.listdir(curDIR) \
             if re.compile('^(?=(.*-vs-)).*\.broadPeak$').search(f)\
         ][0]\
     )
     ##Identify_DamOnly_'*.broadPeak'-file
     ##-----------------------------------
-    bPDN = os.path.abspath(
+    bPDN = os.path.join(
+        curDIR,
         [\
-            f for f in os.listdir() \
+            f for f in os.listdir(curDIR) \
             if re.compile('^(?!(.*-vs-)).*\.broadPeak$').search(f)\
         ][0]
     )
     return(bP,bPDN)
 
-def reader(file, cols = [
-        'chr',
-        'start',
-        'end',
-        'pkID',
-        'dis',
-        'nd',
-        'fc',
-        'neglog10pval',
-        'neglog10qval'
-        ]
-    ):
-
-    types = {
-        'chr': str,
-        'start': int,
-        'end': int,
-        'pkID': str,
-        'dis': int,
-        'nd': str,
-        'fc': float,
-        'neglog10pval': float,
-        'neglog10qval': float
-        }
-
-    types={k:types[k] for k in cols if k in types.keys()}
-
-    try:
-        df = pd.read_csv(
-            file,
-            names = cols,
-            header = None,
-            dtype = types,
-            delim_whitespace = True
-            )
-    except pd.io.common.EmptyDataError:
-        sys.exit("\nEmpty file:\t" + file + "\n")
-
-    return(df)
-
-def populater(ori,dir):
+def populater(dir):
+    '''Populate '*.regionPeak' files of all FDRs with the peaks of each '*.broadPeak' file.'''
 
-    os.chdir(dir)
-    bPs = [f for f in os.listdir() if re.compile('^.*\.broadPeak').search(f)]
+    bPs = [f for f in os.listdir(dir) if re.compile('^.*\.broadPeak').search(f)]
 
     for el in bPs:
         sys.stdout.write("\t" + el + "\n")
-        df = reader(el)
+        df = damMer_io.peaks(os.path.join(dir, el))
         nam = re.sub('^(.*)\/(.*?)\.(.*)$', r'\2', el)
         for FDR in FDRs:
             rP = dir + "/" + str(FDR) + ".regionPeak"
@@ -203,13 +189,6 @@ def populater(ori,dir):
                 .assign(sample = lambda x: nam)
                 .copy()
                 )
-            newDF['chr'].replace(
-                to_replace='^chr(.*)',
-                value=r'\1',
-                regex=True,
-                inplace=True
-                )
-
             try:
                 with open(rP, 'a') as curFile:
                     newDF.to_csv(
@@ -229,8 +208,6 @@ def populater(ori,dir):
                 print("\tError message: {0}".format(e))
                 sys.exit()
 
-    os.chdir(ori)
-
 def colorize(row, cut):
     '''Helper function for color assignment.'''
     if row["pkID"] > cut:
@@ -238,8 +215,19 @@ def colorize(row, cut):
     else:
         return("213,24,14")
 
-def writer(fdr,df,out,track):
-    '''Write out current *.bed file.'''
+def writer(fdr,df,out,track,bgzip=False):
+    '''Write out current *.bed file (BGZF-compressed & indexed with 'bgzip').'''
+
+    if bgzip:
+        with damMer_bgzf.Writer(out + '.gz') as curFile:
+            if track:
+                curFile.header(
+                    'track name="' + str(fdr) + \
+                    '" description="' + str(fdr) + \
+                    '" visibility=2 itemRgb="On"\n'
+                )
+            curFile.frame(df)
+        return
 
     try:
         with open(out, 'w') as curFile:
@@ -266,17 +254,15 @@ def writer(fdr,df,out,track):
         print("\tError message: {0}".format(e))
         sys.exit()
 
-def sorter(ori,dir):
+def sorter(dir):
     '''Sort populated *.regionPeak files.'''
 
-    os.chdir(dir)
-
     for FDR in FDRs:
         rP = dir + "/" + str(FDR) + ".regionPeak"
         sys.stdout.write('\t' + str(FDR) + '.regionPeak\n')
 
         if os.path.getsize(rP) > 0:
-            df = reader(rP, cols=['chr', 'start', 'end', 'pkID'])
+            df = damMer_io.peaks(rP, cols=['chr', 'start', 'end', 'pkID'])
         else:
             sys.stdout.write('\tEmpty:\t' + rP + '\n')
             continue
@@ -291,14 +277,23 @@ def sorter(ori,dir):
 
         writer(FDR,df,rP,False)
 
-    os.chdir(ori)
+def indexer(dir,id,bgzip=False):
+    '''Write '*.mergePeak'- & '*.reproPeak'-files of all FDRs from the peak index.'''
 
-def merger(ori,dir,id):
-    '''Merge overlapping peaks in '*.regionPeak' files.'''
+    idx = damMer_peakindex.PeakIndex(dir + "/" + os.path.basename(dir) + ".peakidx.npz")
+    for FDR in FDRs:
+        sys.stdout.write('\t' + str(FDR) + '.mergePeak\n')
+        mergDF, rpoDF = idx.merged(FDR, 0.5, id)
+        if not len(mergDF):
+            sys.stdout.write('\tEmpty:\t' + str(FDR) + '\n')
+            continue
+        writer(FDR,mergDF,dir + "/" + str(FDR) + ".mergePeak",True,bgzip)
+        writer(FDR,rpoDF,dir + "/" + str(FDR) + ".reproPeak",True,bgzip)
 
-    os.chdir(dir)
+def merger(dir,id,bgzip=False):
+    '''Merge overlapping peaks in '*.regionPeak' files.'''
 
-    aFS = len([f for f in os.listdir() if re.compile('^.*\.broadPeak').search(f)])
+    aFS = len([f for f in os.listdir(dir) if re.compile('^.*\.broadPeak').search(f)])
 
     for FDR in FDRs:
         rP = dir + "/" + str(FDR) + ".regionPeak"
@@ -307,7 +302,7 @@ def merger(ori,dir,id):
         sys.stdout.write('\t' + str(FDR) + '.regionPeak\n')
 
         if os.path.getsize(rP) > 0:
-            df = reader(rP, cols=['chr', 'start', 'end', 'pkID'])
+            df = damMer_io.peaks(rP, cols=['chr', 'start', 'end', 'pkID'])
         else:
             sys.stdout.write('\tEmpty:\t' + rP + '\n')
             continue
@@ -342,7 +337,7 @@ def merger(ori,dir,id):
             .iloc[:, np.r_[0:3,4:10]]
             )
 
-        writer(FDR,mergDF,mP,True)
+        writer(FDR,mergDF,mP,True,bgzip)
 
         ##''*.reproPeak'-file
         ##-------------------
@@ -353,9 +348,7 @@ def merger(ori,dir,id):
             .assign(name = lambda x: str(id))
             )
 
-        writer(FDR,rpoDF,rpoP,True)
-
-    os.chdir(ori)
+        writer(FDR,rpoDF,rpoP,True,bgzip)
 
 ##---------------------##
 ##----Main_workflow----##
@@ -364,32 +357,38 @@ def merger(ori,dir,id):
 def main():
     args = parse_args()
     oriDIR = os.getcwd()
+    rec = damMer_metrics.Recorder()
+
+    ##Initiate_metrics
+    ##----------------
+    if args.metrics == None:
+        args.metrics = os.path.join(oriDIR, args.out + ".metrics.jsonl")
+    rec.configure('damMer_peaks.py', args.metrics, args.promfile, args.out)
 
     ##Check_presence_of_both_'.*\.broadPeak'-files_in_all_dirs
     ##--------------------------------------------------------
     ##Note:Alternative_is_to_search_for_slurm-file_by_jobIDs
-    sys.stdout.write("\n>Checking presence of '*.broadPeak'-files\n")
-    checkSl(args.repos, '^(?=(.*-vs-)).*\.broadPeak$')
-    sys.stdout.write("\n>Checking presence of DamOnly-'*.broadPeak'-files\n")
-    checkSl(args.repos, '^(?!(.*-vs-)).*\.broadPeak$')
+    with rec.stage('waitBroadPeak'):
+        sys.stdout.write("\n>Checking presence of '*.broadPeak'-files\n")
+        checkSl(args.repos, '^(?=(.*-vs-)).*\.broadPeak$')
+        sys.stdout.write("\n>Checking presence of DamOnly-'*.broadPeak'-files\n")
+        checkSl(args.repos, '^(?!(.*-vs-)).*\.broadPeak$')
 
     ##Rename_slurm_files
     ##------------------
-    sys.stdout.write("\n>Rename files\n")
-    BPs = list()
-    damOBPs = list()
-    for el in args.repos:
+    with rec.stage('rename'):
+        sys.stdout.write("\n>Rename files\n")
+        BPs = list()
+        damOBPs = list()
+        for el in args.repos:
 
-        absDIR = os.path.abspath(el)
-        os.chdir(absDIR)
-        sys.stdout.write('\t' + absDIR + '\n')
+            absDIR = os.path.abspath(el)
+            sys.stdout.write('\t' + absDIR + '\n')
 
-        BP,damOBP = renamer(absDIR)
+            BP,damOBP = renamer(absDIR)
 
-        BPs.append(BP)
-        damOBPs.append(damOBP)
-
-        os.chdir(oriDIR)
+            BPs.append(BP)
+            damOBPs.append(damOBP)
 
     ##Deduplicate_damONs
     ##------------------
@@ -405,29 +404,64 @@ def main():
 
     ##Create_dirs_&_copy_bedgraph-files
     ##---------------------------------
-    damOBPDIR = createDir(oriDIR,args.out,"_DamOnly_peaks",subDONs)
-    BPDIR = createDir(oriDIR,args.out,"_peaks", BPs)
+    with rec.stage('copyBroadPeak'):
+        damOBPDIR = createDir(oriDIR,args.out,"_DamOnly_peaks",subDONs,args.add)
+        BPDIR = createDir(oriDIR,args.out,"_peaks", BPs,args.add)
+
+    ##Index_peaks_for_queries_of_any_FDR_&_replicate_fraction
+    ##--------------------------------------------------------
+    sys.stdout.write("\n>Index '*.broadPeak'-files\n")
+    for dir in [BPDIR,damOBPDIR]:
+        with rec.stage('index', folder=os.path.basename(dir)):
+            idxP = os.path.join(dir, os.path.basename(dir) + ".peakidx.npz")
+            bPs = sorted(
+                [os.path.join(dir, f) for f in os.listdir(dir) if re.compile('^.*\.broadPeak').search(f)]
+                )
+            ##Only_new_peaks_are_sorted_&_inserted
+            if args.add and os.path.isfile(idxP):
+                idx = damMer_peakindex.adder(bPs, idxP)
+            else:
+                idx = damMer_peakindex.builder(bPs, idxP)
+            idx.saturation().to_csv(re.sub('\.peakidx\.npz$', '.saturation.tsv', idxP), sep='\t', index=False)
+            sys.stdout.write('\t' + idxP + '\n')
+
+    ##Merged_peaks_from_the_extended_index
+    ##------------------------------------
+    if args.add:
+        for dir in [BPDIR,damOBPDIR]:
+            sys.stdout.write("\n>Merge peaks from index:\t" + os.path.basename(dir) + "\n")
+            with rec.stage('merge', folder=os.path.basename(dir)):
+                indexer(dir,args.out,args.bgzip)
+        rec.close()
+        sys.stdout.write('\nAll done.\n')
+        return
 
     ##Populate_'FDR.regionPeak'-files
     ##-------------------------------
     sys.stdout.write("\n>Read in '*.broadPeak'-files\n")
-    populater(oriDIR,BPDIR)
+    with rec.stage('populate', folder=os.path.basename(BPDIR)):
+        populater(BPDIR)
     sys.stdout.write("\n>Read in DamOnly '*.broadPeak'-files\n")
-    populater(oriDIR,damOBPDIR)
+    with rec.stage('populate', folder=os.path.basename(damOBPDIR)):
+        populater(damOBPDIR)
 
     ##Sort_'{FDR}.regionPeak'-files
     ##-----------------------------
     sys.stdout.write("\n>Sort '*.regionPeak'-files.\n")
-    sorter(oriDIR,BPDIR)
+    with rec.stage('sort', folder=os.path.basename(BPDIR)):
+        sorter(BPDIR)
     sys.stdout.write("\n>Sort DamOnly '*.regionPeak'-files\n")
-    sorter(oriDIR,damOBPDIR)
+    with rec.stage('sort', folder=os.path.basename(damOBPDIR)):
+        sorter(damOBPDIR)
 
     ##Merge_'{FDR}.regionPeak'-files
     ##------------------------------
     sys.stdout.write("\n>Merge '*.regionPeak'-files.\n")
-    merger(oriDIR,BPDIR,args.out)
+    with rec.stage('merge', folder=os.path.basename(BPDIR)):
+        merger(BPDIR,args.out,args.bgzip)
     sys.stdout.write("\n>Merge DamOnly '*.regionPeak'-files\n")
-    merger(oriDIR,damOBPDIR,args.out)
+    with rec.stage('merge', folder=os.path.basename(damOBPDIR)):
+        merger(damOBPDIR,args.out,args.bgzip)
 
     ##Remove_'{FDR}.regionPeak'-files
     ##-------------------------------
@@ -437,6 +471,7 @@ def main():
             rP = dir + "/" + str(FDR) + ".regionPeak"
             os.remove(rP)
 
+    rec.close()
     sys.stdout.write('\nAll done.\n')
 
 if __name__ == '__main__':
@@ -0,0 +1,304 @@
+#!/usr/local/bin/python3
+'''
+#Plan_jobs,_core-hours,_memory,_scratch_&_storage_of_all_pairwise_comparisons:
+python3 damMer_plan.py -e exp_*.fastq.gz -c dam_*.fastq.gz -l dm6.chrom.sizes -g Ensembl_BDGP6.GATC.mod.gff
+#Within_'damMer.py'_(pairs_of_'--pairing',_nothing_submitted):
+python3 damMer.py -D design.tsv -x matched -d dm6 -l dm6.chrom.sizes --plan -S 20
+'''
+
+import argparse
+import os
+import sys
+import math
+import zlib
+
+##Genome_sizes_&_GATC-sites_per_bp_without_'--chrSize'_/_'--gatcfrag'
+genomes = {'dm6': 143726002, 'mm10': 2730871774}
+gatcPerBp = 1 / 256.0
+
+##Throughput_&_size_model_(adjust_to_the_local_cluster)
+rates = {
+    'overhead': 60.0,                   #Scheduling_&_start-up_per_job_(s)
+    'cores': 8,                         #'#SBATCH_-n_8'_of_the_job_template
+    'copyBps': 2.0e8,                   #Copy_on_the_shared_filesystem_(bytes/s)
+    'alignReads': 1.5e4,                #bowtie2_reads/s_per_core
+    'sortBytes': 768 * 1024**2,         #samtools_sort_buffer
+    'indexBytesPerBp': 1.2,             #bowtie2-index_in_memory
+    'bamBytesPerRead': 28.0,            #'*.bam'-file_per_read
+    'tmpBytesPerRead': 120.0,           #Intermediate_'*.sam'/'*.bam'_per_read
+    'binFrags': 2.0e6,                  #GATC-fragment_binning_(fragments/s)
+    'macsReads': 1.2e5,                 #MACS2_reads/s
+    'macsBytesPerRead': 90.0,           #MACS2_memory_per_read
+    'bedgraphBytesPerFrag': 34.0,       #'*.bedgraph'-file_per_fragment
+    'bigwigBytesPerFrag': 12.0,         #'*.bw'-file_per_fragment
+    'normFrags': 4.0e6,                 #Normalization_&_averaging_(fragments_x_samples/s)
+    'normBytesPerFrag': 24.0,           #Memory_per_fragment_&_sample
+    'bwFrags': 1.5e6                    #bedGraphToBigWig_(fragments/s)
+    }
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Dry-run estimate of jobs, core-hours, memory, scratch, storage & critical path."
+        )
+
+    parser.add_argument(
+        "-e", "--experiment",
+        nargs = '+',
+        type = str,
+        required = True,
+        help = "List of experimental '*.fastq.gz'-files."
+        )
+    parser.add_argument(
+        "-c", "--control",
+        nargs = '+',
+        type = str,
+        required = True,
+        help = "List of control '*.fastq.gz'-files."
+        )
+    parser.add_argument(
+        "-d", "--defaults",
+        type = str,
+        default = "dm6",
+        choices = sorted(genomes),
+        help = "Genome size without '--chrSize'."
+        )
+    parser.add_argument(
+        "-l", "--chrSize",
+        type = str,
+        default = None,
+        help = "List of chromosome sizes."
+        )
+    parser.add_argument(
+        "-g", "--gatcfrag",
+        type = str,
+        default = None,
+        help = "'*.GATC.gff'-file (GATC-fragment count)."
+        )
+    parser.add_argument(
+        "-S", "--slots",
+        type = int,
+        default = 0,
+        help = "Concurrently running jobs (0: unlimited)."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def readEstimate(fastq, sample=4 * 1024**2):
+    '''Number of reads of a ('*.gz'-compressed) fastq-file from its first 'sample' bytes.'''
+
+    size = os.path.getsize(fastq)
+    with open(fastq, 'rb') as inFile:
+        raw = inFile.read(sample)
+    if not raw:
+        return(0)
+
+    ##Decompress_all_gzip-members_of_the_sample
+    if raw[:2] == b'\x1f\x8b':
+        out = b''
+        rest = raw
+        while rest[:2] == b'\x1f\x8b':
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                out += d.decompress(rest)
+            except zlib.error:
+                break
+            rest = d.unused_data
+    else:
+        out = raw
+
+    reads = out.count(b'\n') / 4.0
+    return(int(round(reads * size / float(len(raw)))))
+
+def genomeSize(chrSize=None, defaults='dm6'):
+    '''Genome size from a chromosome sizes file or the species defaults.'''
+
+    if chrSize:
+        with open(chrSize, 'r') as inFile:
+            return(sum(int(l.split()[1]) for l in inFile if l.strip()))
+    return(genomes.get(defaults, genomes['dm6']))
+
+def fragCount(gff=None, genome=None):
+    '''GATC-fragments (sites minus one per chromosome) of a '*.GATC.gff'-file or per bp.'''
+
+    if gff and os.path.isfile(gff):
+        sites = 0
+        chroms = set()
+        with open(gff, 'r') as inFile:
+            for l in inFile:
+                if l.startswith('#') or not l.strip():
+                    continue
+                sites += 1
+                chroms.add(l.split('\t', 1)[0])
+        return(max(sites - len(chroms), 0))
+    return(int(genome * gatcPerBp))
+
+def job(name, n, wall, mem, scratch=0, storage=0, cores=None):
+    '''One row of the plan: 'n' jobs of a kind with per-job wall time (s), memory, scratch & storage (bytes).'''
+
+    cores = cores if cores else rates['cores']
+    return({
+        'job': name,
+        'n': n,
+        'cores': cores,
+        'wall': wall,
+        'coreHours': n * cores * wall / 3600.0,
+        'mem': mem,
+        'scratch': scratch,
+        'storage': n * storage
+        })
+
+def planner(pairs, reads, sizes, genome, frags):
+    '''
+    Jobs of 'damMer.py' & 'damMer_tracks.py' for the given pairs.
+    'reads' & 'sizes' map '*.fastq.gz'-files to reads & bytes.
+    Per kind the most expensive job gives wall time, memory & scratch.
+    '''
+
+    r = rates
+    dams = sorted(set(d for e, d in pairs))
+    pairReads = [reads[e] + reads[d] for e, d in pairs]
+    pairBytes = [sizes[e] + sizes[d] for e, d in pairs]
+    maxReads = max(pairReads)
+    bG = frags * r['bedgraphBytesPerFrag']
+
+    rows = list()
+    rows.append(job('copy', len(pairs),
+        r['overhead'] + max(pairBytes) / r['copyBps'],
+        64 * 1024**2,
+        storage = sum(pairBytes) / float(len(pairs))
+        ))
+    rows.append(job('damidseq', len(pairs),
+        r['overhead'] + maxReads / (r['alignReads'] * r['cores']) + 2 * frags / r['binFrags'],
+        r['sortBytes'] + genome * r['indexBytesPerBp'],
+        scratch = max(pairBytes) + maxReads * r['tmpBytesPerRead'],
+        storage = sum(pairReads) / float(len(pairs)) * r['bamBytesPerRead'] + 3 * bG
+        ))
+    rows.append(job('macs2', 2 * len(pairs),
+        r['overhead'] + maxReads / r['macsReads'],
+        256 * 1024**2 + maxReads * r['macsBytesPerRead'],
+        scratch = maxReads * r['bamBytesPerRead'],
+        storage = 512 * 1024
+        ))
+    ##Two_track_folders:_all_pairs_&_distinct_Dam-only_samples
+    for name, n in [('quantNorm', len(pairs)), ('quantNormDamOnly', len(dams))]:
+        rows.append(job(name, 1,
+            r['overhead'] + n * frags / r['normFrags'],
+            n * frags * r['normBytesPerFrag'],
+            storage = 2 * n * bG
+            ))
+    for name, n in [('average', len(pairs)), ('averageDamOnly', len(dams))]:
+        rows.append(job(name, 1,
+            r['overhead'] + n * frags / r['normFrags'],
+            frags * r['normBytesPerFrag'] * 2,
+            storage = bG
+            ))
+    rows.append(job('bigwig', len(pairs) + len(dams) + 2,
+        r['overhead'] + frags / r['bwFrags'],
+        frags * r['normBytesPerFrag'],
+        storage = frags * r['bigwigBytesPerFrag']
+        ))
+    return(rows)
+
+def critical(rows, slots=0):
+    '''
+    Critical path: copy -> damidseq -> max(macs2, normalization -> average -> bigwig).
+    With 'slots', parallel jobs of a kind run in waves.
+    '''
+
+    byName = {row['job']: row for row in rows}
+    def span(name):
+        row = byName[name]
+        waves = int(math.ceil(row['n'] / float(slots))) if slots else 1
+        return(waves * row['wall'])
+
+    tracks = max(
+        span('quantNorm') + span('average'),
+        span('quantNormDamOnly') + span('averageDamOnly')
+        ) + span('bigwig')
+    path = ['copy', 'damidseq']
+    if span('macs2') > tracks:
+        path += ['macs2']
+    else:
+        path += ['quantNorm', 'average', 'bigwig']
+    return(path, span('copy') + span('damidseq') + max(span('macs2'), tracks))
+
+def duration(s):
+    '''Seconds as 'H:MM:SS'.'''
+
+    s = int(round(s))
+    return('%d:%02d:%02d' % (s // 3600, s % 3600 // 60, s % 60))
+
+def human(b):
+    '''Bytes as 'K|M|G|T'.'''
+
+    for unit in ['', 'K', 'M', 'G', 'T']:
+        if abs(b) < 1024 or unit == 'T':
+            return(('%.0f' if unit == '' else '%.1f') % b + unit)
+        b /= 1024.0
+
+def reporter(pairs, reads, genome, frags, rows, slots=0, out=sys.stdout):
+    '''Write the plan.'''
+
+    exps = sorted(set(e for e, d in pairs))
+    dams = sorted(set(d for e, d in pairs))
+    out.write('\n>Plan:\t' + str(len(pairs)) + ' comparisons (' + \
+        str(len(exps)) + ' experiments, ' + str(len(dams)) + ' controls)\n')
+    out.write('\tGenome size:\t' + str(genome) + '\n')
+    out.write('\tGATC-fragments:\t' + str(frags) + '\n')
+    for f in exps + dams:
+        out.write('\t' + os.path.basename(f) + ':\t' + '%.1fM' % (reads[f] / 1e6) + ' reads\n')
+
+    out.write('\n>Jobs\n')
+    out.write('\tjob\tn\tcores\twall/job\tcore-h\tmem/job\tscratch/job\tstorage\n')
+    for row in rows:
+        out.write('\t' + '\t'.join([
+            row['job'], str(row['n']), str(row['cores']), duration(row['wall']),
+            '%.1f' % row['coreHours'], human(row['mem']), human(row['scratch']), human(row['storage'])
+            ]) + '\n')
+    out.write('\t' + '\t'.join([
+        'total', str(sum(row['n'] for row in rows)), '-', '-',
+        '%.1f' % sum(row['coreHours'] for row in rows),
+        human(max(row['mem'] for row in rows)),
+        human(max(row['scratch'] for row in rows)),
+        human(sum(row['storage'] for row in rows))
+        ]) + '\n')
+
+    path, wall = critical(rows, slots)
+    out.write('\n>Critical path' + (' (' + str(slots) + ' slots)' if slots else '') + '\n')
+    out.write('\t' + ' -> '.join(path) + ':\t' + duration(wall) + '\n')
+
+def plan(pairs, chrSize=None, gatcfrag=None, defaults='dm6', slots=0, out=sys.stdout):
+    '''Estimate & report a screen; returns the rows of the plan.'''
+
+    files = sorted(set(f for p in pairs for f in p))
+    sizes = {f: os.path.getsize(f) for f in files}
+    reads = {f: readEstimate(f) for f in files}
+    genome = genomeSize(chrSize, defaults)
+    frags = fragCount(gatcfrag, genome)
+    rows = planner(pairs, reads, sizes, genome, frags)
+    reporter(pairs, reads, genome, frags, rows, slots, out)
+    return(rows)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    pairs = [(e, d) for e in args.experiment for d in args.control]
+    plan(pairs, args.chrSize, args.gatcfrag, args.defaults, args.slots)
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/local/bin/python3
+'''
+#Build_profile_matrices_around_peak_centres_for_all_averaged_tracks:
+python3 damMer_profiles.py -p *_peaks/5.mergePeak -t *_tracks/*.bedgraph -o profiles
+'''
+
+import argparse
+import os
+import sys
+import re
+import numpy as np
+import damMer_io
+from concurrent.futures import ProcessPoolExecutor
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Peak x bin intensity matrices around peak centres."
+        )
+
+    parser.add_argument(
+        "-p", "--peaks",
+        type = str,
+        required = True,
+        help = "'*.mergePeak'- or '*.reproPeak'-file."
+        )
+    parser.add_argument(
+        "-t", "--tracks",
+        nargs = '*',
+        type = str,
+        required = True,
+        help = "List of '*.bedgraph'-files (e.g., from '*_tracks')."
+        )
+    parser.add_argument(
+        "-o", "--out",
+        type = str,
+        required = True,
+        help = "Prefix of the '*.profile.npz'-output."
+        )
+    parser.add_argument(
+        "-x", "--flank",
+        type = int,
+        default = 2500,
+        help = "Distance in bp up- & downstream of peak centres."
+        )
+    parser.add_argument(
+        "-b", "--bin",
+        type = int,
+        default = 10,
+        help = "Bin size in bp."
+        )
+    parser.add_argument(
+        "-n", "--threads",
+        type = int,
+        default = 8,
+        help = "Number of tracks processed in parallel."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def centerer(peaks, flank, bin):
+    '''Left bin edges around peak centres (cf. 'IRanges::resize(fix="center")').'''
+
+    cen = peaks['start'].to_numpy() + (peaks['end'].to_numpy() - peaks['start'].to_numpy()) // 2
+    steps = np.arange(-flank, flank, bin, dtype=np.int64)
+    return(cen[:, None] + steps[None, :], steps)
+
+def integrator(starts, ends, scores):
+    '''
+    Prefix sums of signal & coverage at interval boundaries.
+    Intervals need to be sorted & non-overlapping.
+    '''
+
+    width = (ends - starts).astype(np.float64)
+    sig = np.concatenate([[0.0], np.cumsum(width * scores)])
+    cov = np.concatenate([[0.0], np.cumsum(width)])
+    return(sig, cov)
+
+def cumulate(x, starts, ends, scores, sig, cov):
+    '''Signal & coverage integrated from chromosome start up to 'x'.'''
+
+    k = np.searchsorted(starts, x, side='right') - 1
+    kc = np.maximum(k, 0)
+    part = np.clip(x - starts[kc], 0, ends[kc] - starts[kc]).astype(np.float64)
+    part = np.where(k >= 0, part, 0.0)
+    return(
+        sig[kc] + part * scores[kc],
+        cov[kc] + part
+        )
+
+def profiler(track, peaks, edges, bin):
+    '''Mean signal per peak & bin of one track (cf. 'extract_matrix()').'''
+
+    df = damMer_io.bedgraph(track)
+    mat = np.full(edges.shape, np.nan, dtype=np.float32)
+
+    ##One_sorted_sweep_per_chromosome
+    ##-------------------------------
+    pkIdx = peaks.groupby('chr', sort=False, observed=True).indices
+    for chrom, grp in df.groupby('chr', sort=False, observed=True):
+        if chrom not in pkIdx:
+            continue
+        grp = grp.sort_values(by='start', kind='mergesort')
+        starts = grp['start'].to_numpy()
+        ends = grp['end'].to_numpy()
+        scores = grp['score'].to_numpy()
+        sig, cov = integrator(starts, ends, scores)
+
+        rows = pkIdx[chrom]
+        lo = edges[rows]
+        sLo, cLo = cumulate(lo, starts, ends, scores, sig, cov)
+        sHi, cHi = cumulate(lo + bin, starts, ends, scores, sig, cov)
+
+        covd = cHi - cLo
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mat[rows] = np.where(covd > 0, (sHi - sLo) / covd, np.nan)
+
+    return(mat)
+
+def namer(track):
+    '''Track name from '*.bedgraph'-filename.'''
+    return(re.sub('\.bedgraph(\.gz)?$', '', os.path.basename(track)))
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    ##Center_peaks_&_build_bins
+    ##-------------------------
+    sys.stdout.write('\n>Center peaks\n')
+    peaks = damMer_io.peaks(args.peaks, cols=['chr', 'start', 'end'])
+    edges, steps = centerer(peaks, args.flank, args.bin)
+    sys.stdout.write(
+        '\tPeaks:\t' + str(len(peaks)) + '\n' + \
+        '\tBins:\t' + str(len(steps)) + '\n'
+        )
+
+    ##Build_matrices_in_parallel_across_tracks
+    ##----------------------------------------
+    sys.stdout.write('\n>Build intensity matrices\n')
+    mats = dict()
+    with ProcessPoolExecutor(max_workers=args.threads) as pool:
+        futs = {
+            namer(t): pool.submit(profiler, t, peaks, edges, args.bin) \
+            for t in args.tracks
+            }
+        for name, fut in futs.items():
+            mats[name] = fut.result()
+            sys.stdout.write('\t' + name + '\n')
+
+    ##Save_matrices
+    ##-------------
+    out = args.out + '.profile.npz'
+    sys.stdout.write('\n>Save matrices\n\t' + out + '\n')
+    np.savez_compressed(
+        out,
+        chr = peaks['chr'].to_numpy().astype(str),
+        start = peaks['start'].to_numpy(),
+        end = peaks['end'].to_numpy(),
+        steps = steps,
+        tracks = np.array(list(mats.keys())),
+        **{'track_' + str(i): m for i, m in enumerate(mats.values())}
+        )
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+#!/usr/local/bin/python3
+'''
+#Replicate_QC_of_all_normalized_tracks_of_a_folder:
+python3 damMer_qc.py -f Cph_tracks/*.quant.norm.bedgraph -o Cph_tracks/Cph_tracks
+#From_the_fragment_x_sample_store:
+python3 damMer_qc.py -s Cph_tracks/Cph_tracks.store -o Cph_tracks/Cph_tracks
+'''
+
+import argparse
+import os
+import sys
+import re
+import shutil
+import numpy as np
+import damMer_norm
+import damMer_store
+
+##Outlier_thresholds
+zCut = 3.0                      #Robust_z_of_the_median_correlation
+minCor = 0.3                    #Median_correlation_to_all_other_samples
+minCov = 0.5                    #Fraction_of_the_median_GATC-coverage
+minMAD = 0.05                   #Floor_of_the_MAD_of_median_correlations_(tight_replicates)
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Pairwise correlation, signal-to-noise & GATC-coverage of normalized tracks."
+        )
+
+    parser.add_argument(
+        "-f", "--files",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "List of '*.quant.norm.bedgraph(.gz)'-files."
+        )
+    parser.add_argument(
+        "-s", "--store",
+        type = str,
+        default = None,
+        help = "Store directory: all '<sample>.quant.norm' columns instead of '--files'."
+        )
+    parser.add_argument(
+        "-o", "--out",
+        type = str,
+        default = None,
+        help = "Prefix of the '*.qc.tsv'-reports (default: current directory name)."
+        )
+    parser.add_argument(
+        "-z", "--zscore",
+        type = float,
+        default = zCut,
+        help = "Robust z-score of the median correlation below which samples are outliers."
+        )
+    parser.add_argument(
+        "-r", "--mincor",
+        type = float,
+        default = minCor,
+        help = "Median correlation below which samples are outliers."
+        )
+    parser.add_argument(
+        "-c", "--mincov",
+        type = float,
+        default = minCov,
+        help = "Fraction of the median GATC-coverage below which samples are outliers."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def sampleName(name):
+    '''Sample name from '*.quant.norm.bedgraph'-filename or '<sample>.quant.norm'-column.'''
+    return(re.sub('(\.gatc)?\.quant\.norm(\.bedgraph(\.gz)?)?$', '', os.path.basename(name)))
+
+def storeMatrices(store, columns):
+    '''Fragment x sample matrix per chromosome from store columns.'''
+
+    for chrom in store.chroms:
+        yield(chrom, store.matrix(chrom, columns).astype(np.float64))
+
+def fileMatrices(files, tmp):
+    '''
+    Fragment x sample matrix per chromosome from '*.bedgraph'-files:
+    files are split into per-chromosome shards ('damMer_norm.splitter')
+    & aligned by fragment coordinates (NaN where a file lacks a fragment).
+    '''
+
+    orders = list()
+    for i, f in enumerate(files):
+        o, n = damMer_norm.splitter(f, tmp, i)
+        os.remove(os.path.join(tmp, str(i), 'all.score'))
+        orders.append(o)
+
+    for chrom in damMer_norm.chromOrder(orders):
+        loaded = [damMer_norm.loader(tmp, i, chrom) for i in range(len(files))]
+        present = [i for i, l in enumerate(loaded) if l[0] is not None]
+        allC, inv = np.unique(
+            np.concatenate([loaded[i][0] for i in present]), axis=0, return_inverse=True
+            )
+        inv = inv.reshape(-1)
+        mat = np.full((len(allC), len(files)), np.nan)
+        pos = 0
+        for i in present:
+            n = len(loaded[i][0])
+            mat[inv[pos:pos + n], i] = loaded[i][1]
+            pos += n
+        yield(chrom, mat)
+
+def collector(matrices, k):
+    '''
+    One pass over the per-chromosome matrices: sums & cross products over
+    fragments scored in all samples, fragment & coverage counts.
+    '''
+
+    acc = {
+        'n': 0,
+        'sum': np.zeros(k),
+        'xtx': np.zeros((k, k)),
+        'frags': 0,
+        'covered': np.zeros(k)
+        }
+    for chrom, mat in matrices:
+        ok = np.isfinite(mat)
+        acc['frags'] += len(mat)
+        acc['covered'] += (ok & (mat != 0)).sum(axis=0)
+        full = mat[ok.all(axis=1)]
+        acc['n'] += len(full)
+        acc['sum'] += full.sum(axis=0)
+        acc['xtx'] += full.T @ full
+    return(acc)
+
+def covariance(acc):
+    '''Covariance matrix from the accumulated sums.'''
+
+    n = acc['n']
+    if n < 2:
+        return(np.full(acc['xtx'].shape, np.nan))
+    mean = acc['sum'] / n
+    return(acc['xtx'] / n - np.outer(mean, mean))
+
+def correlation(cov):
+    '''Pearson correlation matrix from the covariance matrix.'''
+
+    sd = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return(np.clip(cov / np.outer(sd, sd), -1, 1))
+
+def snr(cov, i):
+    '''
+    Signal-to-noise of sample 'i': r^2 / (1 - r^2) with 'r' the correlation
+    to the mean of all other samples (shared vs. sample-specific variance).
+    '''
+
+    others = [j for j in range(len(cov)) if j != i]
+    if not others:
+        return(np.nan)
+    cim = cov[i, others].mean()
+    vm = cov[np.ix_(others, others)].mean()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r2 = min(cim ** 2 / (cov[i, i] * vm), 1.0)
+        return(r2 / (1 - r2) if r2 < 1 else np.inf)
+
+def robust(x):
+    '''Median & scaled median absolute deviation.'''
+
+    med = np.median(x)
+    return(med, 1.4826 * np.median(np.abs(x - med)))
+
+def qc(names, matrices, zscore=zCut, mincor=minCor, mincov=minCov):
+    '''
+    Replicate QC of normalized tracks: per sample GATC-coverage (fraction
+    of fragments with a non-zero score), signal-to-noise against the mean
+    of all other samples & median correlation to all other samples.
+    Outliers have a median correlation with a robust z-score below
+    '-zscore' (MAD at least 'minMAD') or below 'mincor' (three or more
+    samples), or a coverage below 'mincov' times the median coverage.
+    Returns per-sample rows & the correlation matrix.
+    '''
+
+    k = len(names)
+    acc = collector(matrices, k)
+    cov = covariance(acc)
+    cor = correlation(cov)
+
+    rows = list()
+    for i, name in enumerate(names):
+        others = np.delete(cor[i], i)
+        rows.append({
+            'sample': name,
+            'fragments': int(acc['frags']),
+            'scored': int(acc['n']),
+            'coverage': acc['covered'][i] / acc['frags'] if acc['frags'] else 0.0,
+            'snr': snr(cov, i),
+            'medCor': np.nanmedian(others) if np.isfinite(others).any() else np.nan,
+            'corZ': np.nan,
+            'flags': list()
+            })
+
+    ##Outliers
+    ##--------
+    covMed = np.median([r['coverage'] for r in rows])
+    for r in rows:
+        if r['coverage'] < mincov * covMed:
+            r['flags'].append('coverage')
+    mc = np.array([r['medCor'] for r in rows])
+    if k > 2 and np.isfinite(mc).any():
+        med, mad = robust(mc[np.isfinite(mc)])
+        for r in rows:
+            if not np.isfinite(r['medCor']):
+                r['flags'].append('correlation')
+                continue
+            r['corZ'] = (r['medCor'] - med) / max(mad, minMAD)
+            if r['medCor'] < mincor or r['corZ'] < -zscore:
+                r['flags'].append('correlation')
+    return(rows, cor)
+
+def fmt(x):
+    '''Number or 'NA'.'''
+    return('NA' if not np.isfinite(x) else '%.4g' % x)
+
+def reporter(rows, cor, out, stream=sys.stdout):
+    '''Write '<out>.qc.tsv' & '<out>.qc.cor.tsv' & a compact summary.'''
+
+    cols = ['coverage', 'snr', 'medCor', 'corZ']
+    with open(out + '.qc.tsv', 'w') as outFile:
+        outFile.write('\t'.join(['sample', 'fragments', 'scored'] + cols + ['flag']) + '\n')
+        for r in rows:
+            outFile.write('\t'.join(
+                [r['sample'], str(r['fragments']), str(r['scored'])] + [fmt(r[c]) for c in cols] + \
+                [','.join(r['flags']) if r['flags'] else 'ok']
+                ) + '\n')
+    names = [r['sample'] for r in rows]
+    with open(out + '.qc.cor.tsv', 'w') as outFile:
+        outFile.write('\t'.join(['sample'] + names) + '\n')
+        for name, c in zip(names, cor):
+            outFile.write('\t'.join([name] + [fmt(x) for x in c]) + '\n')
+
+    stream.write('\tsample\tcoverage\tsnr\tmedCor\tflag\n')
+    for r in rows:
+        stream.write('\t' + '\t'.join([
+            r['sample'], '%.3f' % r['coverage'], fmt(r['snr']), fmt(r['medCor']),
+            ','.join(r['flags']) if r['flags'] else 'ok'
+            ]) + '\n')
+    stream.write('\tReport:\t' + out + '.qc.tsv\n')
+
+def tracksQC(files=None, store=None, out='qc', zscore=zCut, mincor=minCor, mincov=minCov):
+    '''
+    QC of normalized tracks: all '<sample>.quant.norm' columns of 'store'
+    or the given '*.quant.norm.bedgraph(.gz)'-files; writes the reports.
+    Returns the per-sample rows & the tracks (store columns or files).
+    '''
+
+    if store:
+        st = damMer_store.Store(store)
+        tracks = [s for s in st.samples if s.endswith('.quant.norm')]
+    else:
+        tracks = list(files) if files else list()
+    if not tracks:
+        sys.exit("\nNo normalized tracks:\t" + (store if store else out) + "\n")
+
+    tmp = None
+    if store:
+        matrices = storeMatrices(st, tracks)
+    else:
+        tmp = out + '.damMer_qc'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        matrices = fileMatrices(tracks, tmp)
+    try:
+        rows, cor = qc([sampleName(t) for t in tracks], matrices, zscore, mincor, mincov)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+    reporter(rows, cor, out)
+    return(rows, tracks)
+
+def folder(dir, store=None, zscore=zCut, mincor=minCor, mincov=minCov):
+    '''QC of a track folder ('<dir>/<folder>.qc.tsv'); tracks are returned as in 'dir'.'''
+
+    files = None if store else [
+        os.path.join(dir, f) for f in sorted(os.listdir(dir)) \
+        if re.compile('.*quant\.norm\.bedgraph(\.gz)?$').search(f)
+        ]
+    rows, tracks = tracksQC(
+        files, store, os.path.join(dir, os.path.basename(dir)), zscore, mincor, mincov
+        )
+    return(rows, tracks if store else [os.path.basename(t) for t in tracks])
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    out = args.out if args.out else os.path.basename(os.getcwd())
+    if not args.store and not args.files:
+        sys.exit("\nNo '*.quant.norm.bedgraph'-files or '--store'.\n")
+    sys.stdout.write('\n>Replicate QC\n')
+    tracksQC(args.files, args.store, out, args.zscore, args.mincor, args.mincov)
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
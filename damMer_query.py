@@ -0,0 +1,297 @@
+#!/usr/local/bin/python3
+'''
+#Per-sample_&_averaged_signal_of_regions_in_a_track_folder:
+python3 damMer_query.py -d Cph_tracks -r 2L:100000-200000 3R:5000000-5100000
+#Regions_of_a_bed-file_against_a_store_(columns_of_choice):
+python3 damMer_query.py -s Cph_tracks/Cph_tracks.store -r loci.bed -c Cph_tracks.quant.norm.av -o loci.signal.tsv
+#Within_python_(e.g.,_'reticulate'_in_the_annotation_notebooks):
+sig = damMer_query.Signal(folder='Cph_tracks')
+df = sig.query(['2L:100000-200000', 'loci.bed'])
+'''
+
+import argparse
+import os
+import sys
+import re
+import time
+import numpy as np
+import pandas as pd
+import damMer_bgzf
+import damMer_io
+import damMer_store
+
+stats = ['mean', 'max', 'cov']
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Mean, maximum & GATC-coverage of normalized & averaged tracks in regions."
+        )
+
+    parser.add_argument(
+        "-r", "--regions",
+        nargs = '+',
+        type = str,
+        required = True,
+        help = "Regions as 'chr:start-end' or bed-files."
+        )
+    parser.add_argument(
+        "-d", "--folder",
+        type = str,
+        default = None,
+        help = "Track folder of 'damMer_tracks.py': its store, else its '*.quant.norm(.av).bedgraph(.gz)'-files."
+        )
+    parser.add_argument(
+        "-s", "--store",
+        type = str,
+        default = None,
+        help = "Fragment x sample store (cf. 'damMer_store.py')."
+        )
+    parser.add_argument(
+        "-t", "--tracks",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "List of '*.bedgraph(.gz)'-files (BGZF-compressed files are read via their tabix-index)."
+        )
+    parser.add_argument(
+        "-c", "--columns",
+        nargs = '*',
+        type = str,
+        default = None,
+        help = "Store columns (default: all '*.quant.norm' & '*.quant.norm.av' columns, else all)."
+        )
+    parser.add_argument(
+        "-o", "--out",
+        type = str,
+        default = '-',
+        help = "TSV-file of the signal per region ('-' for stdout)."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def regionReader(regions):
+    '''
+    Regions from 'chr:start-end'-strings & bed-files (0-based, half-open)
+    with chromosome names as in the tracks ('chr' removed).
+    '''
+
+    frames = list()
+    for r in regions:
+        m = re.match('^([^:\s]+):([\d,]+)-([\d,]+)$', r)
+        if m and not os.path.isfile(r):
+            frames.append(pd.DataFrame({
+                'chr': [m.group(1)],
+                'start': [int(m.group(2).replace(',', ''))],
+                'end': [int(m.group(3).replace(',', ''))]
+                }))
+        elif os.path.isfile(r):
+            frames.append(damMer_io.peaks(r, cols=['chr', 'start', 'end'], empty=None))
+        else:
+            sys.exit("\nNo region or file:\t" + r + "\n")
+    df = damMer_io.concat(frames)
+    df.insert(3, 'name', df['chr'].astype(str) + ':' + df['start'].astype(str) + '-' + df['end'].astype(str))
+    return(df)
+
+def summarizer(fs, fe, score, starts, ends):
+    '''
+    Overlap-weighted mean, maximum & covered fraction of regions [starts,
+    ends) over sorted, non-overlapping fragments [fs, fe) of one chromosome:
+    overlapping fragments by binary search, sums from prefix sums with the
+    parts of the first & last fragment outside a region subtracted.
+    Fragments without a score (NaN) do not count.
+    '''
+
+    valid = np.isfinite(score)
+    sv = np.where(valid, score, 0.0)
+    w = np.where(valid, fe - fs, 0.0)
+    cw = np.concatenate([[0.0], np.cumsum(w)])
+    cs = np.concatenate([[0.0], np.cumsum(w * sv)])
+
+    i0 = np.searchsorted(fe, starts, side='right')
+    i1 = np.maximum(np.searchsorted(fs, ends, side='left'), i0)
+    has = i1 > i0
+    a = np.minimum(i0, len(fs) - 1)
+    b = np.maximum(i1 - 1, 0)
+
+    wsum = cw[i1] - cw[i0]
+    ssum = cs[i1] - cs[i0]
+    if len(fs):
+        lo = np.where(has & valid[a], np.clip(starts - fs[a], 0, None), 0.0)
+        hi = np.where(has & valid[b], np.clip(fe[b] - ends, 0, None), 0.0)
+        wsum = wsum - lo - hi
+        ssum = ssum - lo * sv[a] - hi * sv[b]
+
+    ##Maxima_of_fragment_ranges_(pairs_of_'reduceat'-indices)
+    mx = np.full(len(starts), np.nan)
+    if has.any():
+        m = np.append(np.where(valid, score, -np.inf), -np.inf)
+        mx[has] = np.maximum.reduceat(m, np.column_stack([i0[has], i1[has]]).ravel())[::2]
+        mx[np.isneginf(mx)] = np.nan
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(wsum > 0, ssum / wsum, np.nan)
+        cov = np.clip(wsum / (ends - starts), 0, 1)
+    return(mean, mx, cov)
+
+class Signal(object):
+    '''
+    Region queries over the tracks of 'damMer_tracks.py': memory-mapped
+    store columns (fragment ranges by binary search on the fragment
+    coordinates), BGZF-compressed '*.bedgraph.gz'-files via their tabix-
+    index or other '*.bedgraph'-files (read once, then indexed).
+    '''
+
+    def __init__(self, tracks=None, store=None, columns=None, folder=None):
+        if folder:
+            st = os.path.join(folder, os.path.basename(os.path.normpath(folder)) + '.store')
+            if os.path.isfile(os.path.join(st, 'meta.json')):
+                store = st
+            else:
+                tracks = [
+                    os.path.join(folder, f) for f in sorted(os.listdir(folder)) \
+                    if re.compile('\.quant\.norm(\.av)?\.bedgraph(\.gz)?$').search(f)
+                    ]
+        self.store = damMer_store.Store(store) if store else None
+        if self.store:
+            self.names = list(columns) if columns else [
+                s for s in self.store.samples if re.search('\.quant\.norm(\.av)?$', s)
+                ] or list(self.store.samples)
+            miss = [c for c in self.names if c not in self.store.samples]
+            if miss:
+                sys.exit("\nNot in store:\t" + ', '.join(miss) + "\n")
+            self.tracks = self.names
+        else:
+            self.tracks = list(tracks) if tracks else list()
+            self.names = [re.sub('\.bedgraph(\.gz)?$', '', os.path.basename(t)) for t in self.tracks]
+        if not self.tracks:
+            sys.exit("\nNo tracks to query.\n")
+        self.cache = dict()
+
+    def indexed(self, track):
+        '''Tabix-index of a BGZF-compressed track (None otherwise).'''
+        if track.endswith('.gz') and os.path.isfile(track + '.tbi'):
+            return(damMer_bgzf.loadIndex(track + '.tbi'))
+        return(None)
+
+    def loaded(self, track):
+        '''Tabix-index or per-chromosome arrays of a track (once per track).'''
+
+        if track not in self.cache:
+            idx = self.indexed(track)
+            if idx is not None:
+                self.cache[track] = ('tabix', idx)
+            else:
+                df = damMer_io.bedgraph(track)
+                chroms = dict()
+                for chrom, grp in df.groupby('chr', sort=False, observed=True):
+                    grp = grp.sort_values('start', kind='mergesort')
+                    chroms[chrom] = (
+                        grp['start'].to_numpy(), grp['end'].to_numpy(), grp['score'].to_numpy()
+                        )
+                self.cache[track] = ('frame', chroms)
+        return(self.cache[track])
+
+    def fragments(self, track, chrom, lo, hi):
+        '''Fragment starts, ends & scores of one track overlapping [lo, hi) on 'chrom'.'''
+
+        empty = (np.zeros(0), np.zeros(0), np.zeros(0))
+        if self.store:
+            if chrom not in self.store.chroms:
+                return(empty)
+            coords = self.store.coords(chrom)
+            a = np.searchsorted(coords[:, 1], lo, side='right')
+            b = np.searchsorted(coords[:, 0], hi, side='left')
+            c = np.asarray(coords[a:b], dtype=np.float64)
+            return(c[:, 0], c[:, 1], np.asarray(self.store.column(track, chrom)[a:b], dtype=np.float64))
+
+        kind, data = self.loaded(track)
+        if kind == 'frame':
+            return(data.get(chrom, empty))
+        name = chrom if chrom in data else 'chr' + chrom
+        recs = list(damMer_bgzf.fetch(track, name, int(lo), int(np.ceil(hi)), data))
+        if not recs:
+            return(empty)
+        ##Parsed_like_'damMer_io.bedgraph()'_(scores_such_as_'NA'_become_NaN)
+        arr = np.column_stack([
+            pd.to_numeric(pd.Series([r[k] for r in recs]), errors='coerce').to_numpy(dtype=np.float64) \
+            for k in (1, 2, 3)
+            ])
+        order = np.argsort(arr[:, 0], kind='mergesort')
+        return(arr[order, 0], arr[order, 1], arr[order, 2])
+
+    def query(self, regions):
+        '''
+        Mean, maximum & covered fraction per region & track
+        ('<track>.mean', '<track>.max', '<track>.cov'); 'regions' are
+        'chr:start-end'-strings, bed-files or a frame ('chr', 'start', 'end').
+        '''
+
+        if isinstance(regions, str):
+            regions = [regions]
+        df = regions.copy() if isinstance(regions, pd.DataFrame) else regionReader(regions)
+        df['chr'] = damMer_io.chromosomes(df['chr'])
+        if 'name' not in df.columns:
+            df.insert(3, 'name', df['chr'].astype(str) + ':' + df['start'].astype(str) + '-' + df['end'].astype(str))
+        df = df.reset_index(drop=True)
+
+        res = {n + '.' + s: np.full(len(df), np.nan) for n in self.names for s in stats}
+        for chrom, rows in df.groupby('chr', sort=False, observed=True).indices.items():
+            starts = df['start'].to_numpy(dtype=np.float64)[rows]
+            ends = df['end'].to_numpy(dtype=np.float64)[rows]
+            for t, n in zip(self.tracks, self.names):
+                fs, fe, score = self.fragments(t, chrom, starts.min(), ends.max())
+                if not len(fs):
+                    res[n + '.cov'][rows] = 0.0
+                    continue
+                mean, mx, cov = summarizer(fs, fe, score, starts, ends)
+                res[n + '.mean'][rows] = mean
+                res[n + '.max'][rows] = mx
+                res[n + '.cov'][rows] = cov
+        return(pd.concat([df, pd.DataFrame(res)], axis=1))
+
+def query(regions, tracks=None, store=None, columns=None, folder=None):
+    '''Signal of regions in one call (cf. 'Signal.query()').'''
+    return(Signal(tracks, store, columns, folder).query(regions))
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if not (args.folder or args.store or args.tracks):
+        sys.exit("\nNo '--folder', '--store' or '--tracks'.\n")
+    log = sys.stderr if args.out == '-' else sys.stdout
+
+    t0 = time.time()
+    sig = Signal(args.tracks, args.store, args.columns, args.folder)
+    df = sig.query(args.regions)
+    df.to_csv(
+        sys.stdout if args.out == '-' else args.out,
+        sep = '\t',
+        index = False,
+        float_format = '%.6g',
+        na_rep = 'NA'
+        )
+    log.write('\n>Query regions\n')
+    log.write('\tRegions:\t' + str(len(df)) + '\n')
+    log.write('\tTracks:\t' + str(len(sig.names)) + '\n')
+    log.write('\tSeconds:\t' + '%.3f' % (time.time() - t0) + '\n')
+    if args.out != '-':
+        log.write('\t' + args.out + '\n')
+
+    log.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
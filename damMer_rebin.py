@@ -0,0 +1,216 @@
+#!/usr/local/bin/python3
+'''
+#500_bp-bins_of_compressed_'*.bgr'-files_(one_'*.bin500.bedgraph'_per_file):
+python3 damMer_rebin.py -f *.bin500.ext150.bgr -b 500 -l dm6.chrom.sizes.mod -c 2L 2R 3L 3R 4 X Y
+#Bin_x_sample_table_of_GATC-fragment_tracks_(cf._'arits_wide'):
+python3 damMer_rebin.py -f Cph_tracks/*.quant.norm.bedgraph -b 500 -o Cph_tracks/Cph_tracks
+#Within_python:
+bs, be, mean, cov = damMer_rebin.rebin(starts, ends, scores, 500, length)
+'''
+
+import argparse
+import os
+import sys
+import re
+import numpy as np
+import pandas as pd
+import damMer_io
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Overlap-weighted means of '*.bedgraph'-intervals in fixed-width bins."
+        )
+
+    parser.add_argument(
+        "-f", "--files",
+        nargs = '+',
+        type = str,
+        required = True,
+        help = "List of '*.bedgraph(.gz)'-/'*.bgr'-files (GATC-fragments or compressed runs)."
+        )
+    parser.add_argument(
+        "-b", "--binsize",
+        type = int,
+        default = 500,
+        help = "Bin width in bp."
+        )
+    parser.add_argument(
+        "-l", "--chrSize",
+        type = str,
+        default = None,
+        help = "List of chromosome sizes (default: last interval end per chromosome)."
+        )
+    parser.add_argument(
+        "-c", "--chroms",
+        nargs = '*',
+        type = str,
+        default = None,
+        help = "Selected chromosomes (default: all)."
+        )
+    parser.add_argument(
+        "-m", "--mincov",
+        type = float,
+        default = 0.0,
+        help = "Fraction of a bin to be covered by intervals, else NA."
+        )
+    parser.add_argument(
+        "-o", "--out",
+        type = str,
+        default = None,
+        help = "Prefix of one bin x sample table ('<out>.bin<binsize>.tsv') instead of one '*.bedgraph' per file."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def sizeReader(chrSize):
+    '''Chromosome lengths from a chromosome sizes file ('chr' removed).'''
+
+    df = damMer_io.peaks(chrSize, cols=['chr', 'end'])
+    return({str(c): int(e) for c, e in zip(df['chr'], df['end'])})
+
+def integral(starts, ends, cs, scores, x):
+    '''
+    Integral of a step function over [0, x) for sorted, non-overlapping
+    intervals: prefix sum of the intervals ending before 'x' plus the
+    part of the interval containing 'x'.
+    '''
+
+    i = np.searchsorted(ends, x, side='right')
+    j = np.minimum(i, len(starts) - 1)
+    part = np.where((i < len(starts)) & (starts[j] < x), (x - starts[j]) * scores[j], 0.0)
+    return(cs[i] + part)
+
+def rebin(starts, ends, scores, binsize=500, length=None):
+    '''
+    Fixed-width bins [k * binsize, (k + 1) * binsize) of one chromosome
+    from 0 to 'length' (default: last interval end; the last bin is cut at
+    'length'). Per bin, the overlap-weighted mean of the interval scores &
+    the covered fraction are differences of two integrals at the bin edges
+    (binary search & prefix sums), so intervals are never expanded into
+    bins. Intervals without a score (NaN) do not count.
+    Returns bin starts, bin ends, means (NaN if uncovered) & coverage.
+    '''
+
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(starts, kind='mergesort')
+    order = order[ends[order] > starts[order]]
+    starts, ends, scores = starts[order], ends[order], scores[order]
+
+    if length is None:
+        length = ends.max() if len(ends) else 0
+    edges = np.append(np.arange(0, length, binsize, dtype=np.float64), float(length))
+    bs, be = edges[:-1], edges[1:]
+    if not len(starts):
+        return(bs, be, np.full(len(bs), np.nan), np.zeros(len(bs)))
+
+    valid = np.isfinite(scores)
+    sv = np.where(valid, scores, 0.0)
+    one = valid.astype(np.float64)
+    w = (ends - starts) * one
+    cs = np.concatenate([[0.0], np.cumsum(w * sv)])
+    cw = np.concatenate([[0.0], np.cumsum(w)])
+
+    ssum = np.diff(integral(starts, ends, cs, sv, edges))
+    wsum = np.diff(integral(starts, ends, cw, one, edges))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(wsum > 0, ssum / wsum, np.nan)
+        cov = np.clip(wsum / (be - bs), 0, 1)
+    return(bs, be, mean, cov)
+
+def chromLengths(frames, sizes=None, chroms=None):
+    '''Chromosomes & bin range per chromosome shared by all tracks.'''
+
+    if sizes:
+        lengths = dict(sizes)
+    else:
+        lengths = dict()
+        for df in frames:
+            for chrom, e in df.groupby('chr', sort=False, observed=True)['end'].max().items():
+                lengths[chrom] = max(lengths.get(chrom, 0), e)
+    if chroms:
+        names = [damMer_io.chrName(c) for c in chroms]
+        miss = [c for c in names if c not in lengths]
+        if miss:
+            sys.exit("\nNo length or intervals:\t" + ', '.join(miss) + "\n")
+        lengths = {c: lengths[c] for c in names}
+    return({c: lengths[c] for c in sorted(lengths)})
+
+def binner(df, lengths, binsize=500, mincov=0.0):
+    '''Bins of one track on all chromosomes of 'lengths' ('chr', 'start', 'end', 'score').'''
+
+    idx = df.groupby('chr', sort=False, observed=True).indices
+    empty = np.zeros(0)
+    frames = list()
+    for chrom, length in lengths.items():
+        rows = idx.get(chrom)
+        if rows is None:
+            bs, be, mean, cov = rebin(empty, empty, empty, binsize, length)
+        else:
+            bs, be, mean, cov = rebin(
+                df['start'].to_numpy()[rows], df['end'].to_numpy()[rows],
+                df['score'].to_numpy()[rows], binsize, length
+                )
+        mean[cov < mincov] = np.nan
+        frames.append(pd.DataFrame({
+            'chr': chrom,
+            'start': bs.astype(np.int64),
+            'end': np.ceil(be).astype(np.int64),
+            'score': mean
+            }))
+    return(pd.concat(frames, ignore_index=True))
+
+def sampleName(file):
+    '''Sample name from '*.bedgraph'-/'*.bgr'-filename.'''
+    return(re.sub('\.(bedgraph|bgr)(\.gz)?$', '', os.path.basename(file)))
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sys.stdout.write('\n>Read tracks\n')
+    frames = list()
+    for f in args.files:
+        sys.stdout.write('\t' + f + '\n')
+        frames.append(damMer_io.bedgraph(f))
+    sizes = sizeReader(args.chrSize) if args.chrSize else None
+    lengths = chromLengths(frames, sizes, args.chroms)
+
+    sys.stdout.write('\n>Rebin into ' + str(args.binsize) + ' bp-bins\n')
+    if args.out:
+        out = args.out + '.bin' + str(args.binsize) + '.tsv'
+        wide = None
+        for f, df in zip(args.files, frames):
+            b = binner(df, lengths, args.binsize, args.mincov)
+            if wide is None:
+                wide = b[['chr', 'start', 'end']].copy()
+            wide[sampleName(f)] = b['score'].to_numpy()
+        wide.to_csv(out, sep='\t', index=False, float_format='%.6g', na_rep='NA')
+        sys.stdout.write('\tBins:\t' + str(len(wide)) + '\n\t' + out + '\n')
+    else:
+        for f, df in zip(args.files, frames):
+            out = re.sub('\.(bedgraph|bgr)(\.gz)?$', '', f) + '.bin' + str(args.binsize) + '.bedgraph'
+            b = binner(df, lengths, args.binsize, args.mincov)
+            b.dropna(subset=['score']).to_csv(
+                out, sep='\t', header=False, index=False, float_format='%.6g'
+                )
+            sys.stdout.write('\t' + out + '\n')
+
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+#!/usr/local/bin/python3
+'''
+#Supervise_submitted_jobs_of_a_project_ledger_(resubmit_failed_jobs):
+python3 damMer_retry.py -l Cph.jobs.jsonl -R 2
+#Within_'damMer.py'_&_'damMer_tracks.py':
+sup = damMer_retry.Supervisor(sub)
+fut = sup.submit('1_cp.sh')
+done, failed = sup.wait(sub.collect([fut]))
+'''
+
+import argparse
+import os
+import sys
+import re
+import json
+import math
+import time
+import subprocess
+import damMer_metrics
+import damMer_submit
+from concurrent.futures import Future
+
+##Slurm_states:_resource_to_escalate_(None:_same_resources;_False:_no_resubmission)
+failStates = {
+    'OUT_OF_MEMORY': 'mem',
+    'FAILED': False,
+    'TIMEOUT': 'time',
+    'DEADLINE': 'time',
+    'NODE_FAIL': None,
+    'BOOT_FAIL': None,
+    'PREEMPTED': None
+    }
+liveStates = ['PENDING', 'RUNNING', 'COMPLETING', 'CONFIGURING', 'REQUEUED', \
+    'RESIZING', 'SUSPENDED', 'STOPPED', 'SIGNALING', 'STAGE_OUT']
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Detect failed slurm jobs & resubmit them with more memory or time."
+        )
+
+    parser.add_argument(
+        "-l", "--ledger",
+        nargs = '+',
+        type = str,
+        required = True,
+        help = "'*.jobs.jsonl'-files of 'damMer.py' & 'damMer_tracks.py'."
+        )
+    parser.add_argument(
+        "-R", "--resubmit",
+        type = int,
+        default = 2,
+        help = "Resubmissions per job (retry budget)."
+        )
+    parser.add_argument(
+        "-x", "--factor",
+        type = float,
+        default = 2.0,
+        help = "Escalation of memory or time per resubmission."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def queued():
+    '''jobIDs registered by slurm (None if 'squeue' fails).'''
+
+    try:
+        chk = subprocess.check_output(['squeue', '-h', '-o', '%i'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+    return(set(chk.decode("utf-8").strip().split()))
+
+def jobStates(jobIDs):
+    '''State, requested memory, time limit & CPUs per job from 'sacct' (empty if unavailable).'''
+
+    if not jobIDs:
+        return(dict())
+    try:
+        out = subprocess.check_output(
+            ['sacct', '-n', '-P', '-X', '-j', ','.join(jobIDs), \
+             '--format=JobID,State,ReqMem,Timelimit,AllocCPUS,ReqCPUS'],
+            stderr = subprocess.DEVNULL
+            ).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return(dict())
+
+    ##Array_tasks_('<jobID>_<task>'):_failed_before_running_before_others
+    rank = lambda st: 2 if st in failStates else 1 if st in liveStates else 0
+    states = dict()
+    for l in out.strip().split('\n'):
+        f = l.split('|')
+        if len(f) != 6:
+            continue
+        jobID = f[0].split('_')[0]
+        st = f[1].split(' ')[0]
+        if jobID not in states or rank(st) > rank(states[jobID]['state']):
+            cpus = [int(c) for c in f[4:6] if c.isdigit() and int(c) > 0]
+            states[jobID] = {'state': st, 'mem': f[2], 'time': f[3], 'cpus': cpus[0] if cpus else 1}
+    return(states)
+
+def escalate(state, acct, factor=2.0):
+    '''
+    Additional 'sbatch'-arguments for a resubmission after 'state'.
+    'ReqMem' per CPU ('c'-suffix) is multiplied by the CPUs of the job, so
+    '--mem' is escalated from the total memory.
+    '''
+
+    what = failStates.get(state)
+    if what == 'mem':
+        req = acct.get('mem', '')
+        mem = damMer_metrics.toBytes(re.sub('[nc]$', '', req))
+        if mem and req.endswith('c'):
+            mem *= acct.get('cpus', 1)
+        if mem:
+            return(['--mem=' + str(int(math.ceil(mem * factor / 1024**2))) + 'M'])
+    elif what == 'time':
+        lim = damMer_metrics.toSeconds(acct.get('time', '')) \
+            if re.match('^[\d\-:]+$', acct.get('time', '')) else None
+        if lim:
+            lim = int(lim * factor)
+            return(['--time=' + str(lim // 86400) + '-' + \
+                time.strftime('%H:%M:%S', time.gmtime(lim % 86400))])
+    return([])
+
+def replaceID(dpdIDs, old, new):
+    '''Replace one jobID in a dependency string.'''
+    return(re.sub('(?<=[:,])' + re.escape(old) + '(?=[:,]|$)', new, dpdIDs))
+
+class Supervisor(object):
+    '''
+    Follow submitted jobs until they completed. Failed jobs (out of memory,
+    timeout, node failure) are resubmitted with escalated memory or time up
+    to a retry budget; dependents are rewired to the resubmitted job.
+    Jobs failing beyond the budget are reported, their dependents cancelled,
+    & all other jobs continue. Submissions are appended to a ledger
+    ('*.jobs.jsonl') so later steps can adopt & supervise earlier jobs.
+    '''
+
+    def __init__(self, sub, ledger=None, retries=2, factor=2.0, poll=5, onSubmit=None, broker=None):
+        self.sub = sub
+        self.onSubmit = onSubmit
+        self.broker = broker
+        self.ledger = ledger
+        self.retries = retries
+        self.factor = factor
+        self.poll = poll
+        self.jobs = dict()
+        self.chain = dict()
+
+    def configure(self, ledger=None, retries=None, factor=None):
+        '''Set ledger & retry budget.'''
+
+        if ledger:
+            self.ledger = ledger
+        if retries is not None:
+            self.retries = retries
+        if factor is not None:
+            self.factor = factor
+
+    def track(self, jobID, cmdSH, cwd, dpdIDs='', extra=None, attempt=0, write=True):
+        '''Register a submitted job.'''
+
+        job = {
+            'jobID': str(jobID),
+            'sh': os.path.abspath(os.path.join(cwd, cmdSH)),
+            'cwd': cwd,
+            'dependency': dpdIDs,
+            'extra': list(extra or []),
+            'attempt': attempt,
+            'state': None
+            }
+        self.jobs[job['jobID']] = job
+        if write and self.ledger:
+            with open(self.ledger, 'a') as outFile:
+                outFile.write(json.dumps(job, sort_keys=True) + '\n')
+        return(job)
+
+    def submit(self, cmdSH, dpdIDs='', after=None, extra=None, cwd=None):
+        '''Submit via 'damMer_submit.Submitter' & track the job; returns a future of the jobID.'''
+
+        cwd = cwd if cwd else os.getcwd()
+        after = list(after) if after else []
+        fut = self.sub.submit(cmdSH, dpdIDs, after, extra, cwd, self.onSubmit, self.broker)
+        out = Future()
+        ##Resolve_only_once_the_job_is_tracked
+        def tracker(f):
+            if f.exception() is not None:
+                out.set_exception(f.exception())
+                return
+            dpd = damMer_submit.dependency(dpdIDs, [a.result() for a in after])
+            self.track(f.result(), cmdSH, cwd, dpd, extra)
+            out.set_result(f.result())
+        fut.add_done_callback(tracker)
+        return(out)
+
+    def adopt(self, ledgers, select=None):
+        '''Track jobs of earlier runs from their ledgers; returns adopted jobIDs.'''
+
+        ids = list()
+        for l in ledgers:
+            if not os.path.isfile(l):
+                continue
+            with open(l, 'r') as inFile:
+                for line in inFile:
+                    try:
+                        job = json.loads(line)
+                    except ValueError:
+                        continue
+                    if select and not select(job):
+                        continue
+                    if 'replaces' in job:
+                        self.chain[job['replaces']] = job['jobID']
+                    self.jobs[job['jobID']] = job
+                    ids.append(job['jobID'])
+        return([j for j in ids if j not in self.chain])
+
+    def current(self, jobID):
+        '''Latest resubmission of a job.'''
+
+        jobID = str(jobID)
+        while jobID in self.chain:
+            jobID = self.chain[jobID]
+        return(jobID)
+
+    def resubmit(self, job, extra, dpdIDs=None, attempt=None):
+        '''Resubmit a job from its directory; None if 'sbatch' refuses.'''
+
+        try:
+            newID = self.sub.submit(
+                job['sh'],
+                job['dependency'] if dpdIDs is None else dpdIDs,
+                extra = extra,
+                cwd = job['cwd'],
+                onSubmit = self.onSubmit,
+                broker = self.broker
+                ).result()
+        except RuntimeError as e:
+            sys.stderr.write('WARNING: ' + str(e) + '\n')
+            return(None)
+
+        ##Keep_log_of_failed_attempt_out_of_'^slurm-.*\.out'
+        log = os.path.join(job['cwd'], 'slurm-' + job['jobID'] + '.out')
+        if os.path.isfile(log):
+            os.rename(log, os.path.join(job['cwd'], 'slurm-' + job['jobID'] + '.failed'))
+
+        new = self.track(newID, job['sh'], job['cwd'],
+            job['dependency'] if dpdIDs is None else dpdIDs, extra,
+            job['attempt'] + 1 if attempt is None else attempt, write=False)
+        new['replaces'] = job['jobID']
+        if self.ledger:
+            with open(self.ledger, 'a') as outFile:
+                outFile.write(json.dumps(new, sort_keys=True) + '\n')
+        self.chain[job['jobID']] = newID
+        return(newID)
+
+    def dependents(self, jobID):
+        '''Tracked jobs depending on 'jobID' (latest resubmissions only).'''
+        return([
+            j for j in self.jobs.values() if j['jobID'] not in self.chain \
+            and re.search('[:,]' + re.escape(jobID) + '([:,]|$)', j['dependency'] or '')
+            ])
+
+    def rewire(self, old, new, states):
+        '''Point dependents of a failed job to its resubmission.'''
+
+        for dep in self.dependents(old):
+            dpd = replaceID(dep['dependency'], old, new)
+            st = states.get(dep['jobID'], {}).get('state')
+            if st == 'CANCELLED':
+                ##Cancelled_on_invalid_dependency:_resubmit_(no_retry_used)
+                newID = self.resubmit(dep, dep['extra'], dpd, dep['attempt'])
+                if newID:
+                    self.rewire(dep['jobID'], newID, jobStates([d['jobID'] for d in self.dependents(dep['jobID'])]))
+                continue
+            try:
+                subprocess.check_call(
+                    ['scontrol', 'update', 'JobId=' + dep['jobID'], 'Dependency=' + dpd],
+                    stdout = subprocess.DEVNULL,
+                    stderr = subprocess.DEVNULL
+                    )
+                dep['dependency'] = dpd
+            except (OSError, subprocess.CalledProcessError):
+                sys.stderr.write('WARNING: Dependency not updated: ' + dep['jobID'] + '\n')
+
+    def abandon(self, jobID):
+        '''Cancel all (transitive) dependents of a permanently failed job.'''
+
+        for dep in self.dependents(jobID):
+            if dep['state'] == 'ABANDONED':
+                continue
+            subprocess.call(['scancel', dep['jobID']], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            dep['state'] = 'ABANDONED'
+            sys.stderr.write('WARNING: Cancelled dependent job: ' + dep['jobID'] + '\n')
+            self.abandon(dep['jobID'])
+
+    def check(self, jobIDs):
+        '''
+        One pass over jobs: resubmit failed ones.
+        Returns finished & failed (original) jobIDs.
+        '''
+
+        que = queued()
+        cur = {j: self.current(j) for j in jobIDs}
+        gone = [c for c in cur.values() if que is None or c not in que]
+        states = jobStates(gone)
+
+        done = list()
+        failed = list()
+        for j, c in cur.items():
+            if que is not None and c in que:
+                continue
+            job = self.jobs.get(c)
+            st = states.get(c, {}).get('state')
+            if job and (job['state'] == 'ABANDONED' or job['state'] in failStates):
+                ##Already_reported
+                failed.append(j)
+            elif st in liveStates:
+                ##'sacct'_lags_behind_'squeue'
+                continue
+            elif st in failStates and job:
+                if failStates[st] is not False and job['attempt'] < self.retries:
+                    extra = [e for e in job['extra'] if not re.match('^--(mem|time)=', e)]
+                    esc = escalate(st, states[c], self.factor)
+                    extra += esc if esc else [e for e in job['extra'] if re.match('^--(mem|time)=', e)]
+                    newID = self.resubmit(job, extra)
+                    if newID:
+                        sys.stdout.write('\tResubmitted ' + c + ' (' + st + ') as ' + newID + \
+                            ((' [' + ' '.join(esc) + ']') if esc else '') + '\n')
+                        self.rewire(c, newID, jobStates([d['jobID'] for d in self.dependents(c)]))
+                        continue
+                job['state'] = st
+                sys.stderr.write('WARNING: Job failed (' + st + '): ' + c + ' ' + job['sh'] + '\n')
+                self.abandon(c)
+                failed.append(j)
+            else:
+                ##Completed,_cancelled_by_user_or_without_accounting
+                if job:
+                    job['state'] = st
+                done.append(j)
+        return(done, failed)
+
+    def wait(self, jobIDs):
+        '''Block until all jobs (incl. resubmissions) are finished; returns done & failed.'''
+
+        jobIDs = [str(j) for j in jobIDs]
+        while True:
+            done, failed = self.check(jobIDs)
+            if len(done) + len(failed) == len(jobIDs):
+                return(done, failed)
+            time.sleep(self.poll)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sub = damMer_submit.Submitter(['--partition=IACT', '-m', 'cyclic:fcyclic'])
+    sup = Supervisor(sub, args.ledger[0], args.resubmit, args.factor)
+    jobIDs = sup.adopt(args.ledger)
+    sys.stdout.write('\n>Supervise ' + str(len(jobIDs)) + ' job(s)\n')
+    done, failed = sup.wait(jobIDs)
+
+    sys.stdout.write('\tFinished:\t' + str(len(done)) + '\n')
+    sys.stdout.write('\tFailed:\t' + str(len(failed)) + '\n')
+    for j in failed:
+        sys.stdout.write('\t\t' + sup.current(j) + '\t' + sup.jobs[sup.current(j)]['sh'] + '\n')
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+#!/usr/local/bin/python3
+'''
+#Ingest_'*.gatc.bedgraph'-files_into_a_GATC-fragment_x_sample_store:
+python3 damMer_store.py -s Cph_tracks.store -g Ensembl_BDGP6.GATC.mod.gff -b *.gatc.bedgraph
+#Export_samples_as_'*.bedgraph':
+python3 damMer_store.py -s Cph_tracks.store -e Cph-vs-Dam Cph-vs-Dam.quant.norm
+'''
+
+import argparse
+import os
+import sys
+import re
+import json
+import numpy as np
+import pandas as pd
+import damMer_bgzf
+import damMer_io
+from concurrent.futures import ProcessPoolExecutor
+
+chunk = 1000000
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Chunked on-disk GATC-fragment x sample matrix (float32)."
+        )
+
+    parser.add_argument(
+        "-s", "--store",
+        type = str,
+        required = True,
+        help = "Store directory (e.g., '<out>_tracks/<out>_tracks.store')."
+        )
+    parser.add_argument(
+        "-g", "--gatcfrag",
+        type = str,
+        default = None,
+        help = "'*.GATC.gff'-file (required to create a new store)."
+        )
+    parser.add_argument(
+        "-b", "--bedgraphs",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "List of '*.bedgraph'-files to ingest."
+        )
+    parser.add_argument(
+        "-e", "--export",
+        nargs = '*',
+        type = str,
+        default = [],
+        help = "Samples to write out as '<sample>.bedgraph'."
+        )
+    parser.add_argument(
+        "-z", "--bgzip",
+        action = "store_true",
+        help = "Export BGZF-compressed & tabix-indexed '*.bedgraph.gz'-files."
+        )
+    parser.add_argument(
+        "-n", "--threads",
+        type = int,
+        default = 4,
+        help = "Number of files ingested in parallel."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def sampleName(file):
+    '''Sample name from '*.bedgraph'-filename.'''
+    return(re.sub('(\.gatc)?\.bedgraph(\.gz)?$', '', os.path.basename(file)))
+
+def gatcReader(gff):
+    '''
+    GATC-fragments as in 'damidseq_pipeline': intervals between the
+    midpoints of adjacent GATC-sites (per chromosome).
+    '''
+
+    df = pd.read_csv(
+        gff,
+        sep = '\t',
+        header = None,
+        comment = '#',
+        usecols = [0, 3, 4],
+        names = ['chr', 'start', 'end'],
+        dtype = {'chr': str, 'start': np.float64, 'end': np.float64}
+        )
+    df['chr'] = damMer_io.chromosomes(df['chr'])
+    df['mid'] = (df['start'] + df['end']) / 2
+
+    frags = dict()
+    for chrom, grp in df.groupby('chr', sort=False, observed=True):
+        mids = np.sort(grp['mid'].to_numpy())
+        if len(mids) < 2:
+            continue
+        frags[chrom] = np.column_stack([mids[:-1], mids[1:]])
+    return(frags)
+
+def creater(path, gff):
+    '''Create an empty store aligned to the GATC-fragments of 'gff'.'''
+
+    sys.stdout.write('\n>Create store\n\t' + path + '\n')
+    os.makedirs(os.path.join(path, 'gatc'), exist_ok=True)
+    os.makedirs(os.path.join(path, 'samples'), exist_ok=True)
+
+    frags = gatcReader(gff)
+    for chrom, coords in frags.items():
+        np.save(os.path.join(path, 'gatc', chrom + '.npy'), coords)
+    meta = {
+        'gff': os.path.abspath(gff),
+        'dtype': 'float32',
+        'chroms': list(frags.keys()),
+        'sizes': {c: int(len(v)) for c, v in frags.items()},
+        'samples': list()
+        }
+    metaWriter(path, meta)
+    return(Store(path))
+
+def metaWriter(path, meta):
+    '''Write 'meta.json' atomically.'''
+
+    tmp = os.path.join(path, 'meta.json.' + str(os.getpid()))
+    with open(tmp, 'w') as outFile:
+        json.dump(meta, outFile, indent=1)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+class Store(object):
+    '''
+    GATC-fragment x sample matrix on disk: one float32 '*.npy'-column per
+    sample & chromosome ('samples/<sample>/<chr>.npy'; NaN if absent),
+    fragment coordinates per chromosome ('gatc/<chr>.npy'). Columns are
+    memory-mapped, so fragment ranges are read without loading a chromosome.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as inFile:
+                self.meta = json.load(inFile)
+        except OSError:
+            sys.exit("\nNo store:\t" + path + "\n")
+
+    @property
+    def chroms(self):
+        return(self.meta['chroms'])
+
+    @property
+    def samples(self):
+        return(self.meta['samples'])
+
+    def size(self, chrom):
+        return(self.meta['sizes'][chrom])
+
+    def coords(self, chrom):
+        '''Fragment start & end (n x 2).'''
+        return(np.load(os.path.join(self.path, 'gatc', chrom + '.npy'), mmap_mode='r'))
+
+    def colPath(self, sample, chrom):
+        return(os.path.join(self.path, 'samples', sample, chrom + '.npy'))
+
+    def column(self, sample, chrom, mode='r'):
+        '''Memory-mapped column of one sample & chromosome.'''
+        return(np.load(self.colPath(sample, chrom), mmap_mode=mode))
+
+    def matrix(self, chrom, samples=None, lo=0, hi=None):
+        '''Fragments [lo, hi) x samples of one chromosome.'''
+
+        samples = self.samples if samples is None else samples
+        return(np.column_stack([self.column(s, chrom)[lo:hi] for s in samples]))
+
+    def add(self, sample):
+        '''Create NaN-filled columns of a (not yet registered) sample.'''
+
+        os.makedirs(os.path.join(self.path, 'samples', sample), exist_ok=True)
+        for chrom in self.chroms:
+            col = np.lib.format.open_memmap(
+                self.colPath(sample, chrom), mode='w+', dtype=np.float32, shape=(self.size(chrom),)
+                )
+            col[:] = np.nan
+            col.flush()
+            del col
+
+    def put(self, sample, chrom, values):
+        '''Write one column.'''
+
+        if not os.path.isfile(self.colPath(sample, chrom)):
+            self.add(sample)
+        col = self.column(sample, chrom, mode='r+')
+        col[:] = values
+        col.flush()
+
+    def register(self, samples):
+        '''Make samples visible in 'meta.json' (in order of registration).'''
+
+        for s in samples:
+            if s not in self.meta['samples']:
+                self.meta['samples'].append(s)
+        metaWriter(self.path, self.meta)
+
+    def export(self, sample, out, bgzip=False):
+        '''Write non-NaN fragments of one sample in bedgraph-format.'''
+
+        if bgzip:
+            outFile = damMer_bgzf.Writer(out + '.gz')
+        else:
+            outFile = open(out, 'w')
+        with outFile:
+            for chrom in self.chroms:
+                vals = np.asarray(self.column(sample, chrom))
+                keep = ~np.isnan(vals)
+                coords = coordOut(np.asarray(self.coords(chrom))[keep])
+                df = pd.DataFrame({
+                    'chr': chrom,
+                    'start': coords[:, 0],
+                    'end': coords[:, 1],
+                    'score': vals[keep]
+                    })
+                if bgzip:
+                    outFile.frame(df, float_format='%.6g')
+                else:
+                    df.to_csv(outFile, sep='\t', header=False, index=False, float_format='%.6g')
+        return(out + '.gz' if bgzip else out)
+
+def coordOut(coords):
+    '''
+    Coordinates as written by 'damidseq_pipeline': integers or, for
+    half-integer fragment ends, text (e.g., '1745.5') so that the
+    float format of scores does not apply.
+    '''
+
+    whole = np.floor(coords)
+    if np.all(coords == whole):
+        return(coords.astype(np.int64))
+    txt = np.char.mod('%d', whole.astype(np.int64))
+    return(np.where(coords != whole, np.char.add(txt, '.5'), txt))
+
+def ingest(path, sample, file):
+    '''
+    Stream one '*.bedgraph'-file into the columns of 'sample'; every
+    interval is assigned to the GATC-fragment containing its midpoint.
+    Returns sample, assigned & unassigned intervals.
+    '''
+
+    store = Store(path)
+    store.add(sample)
+    coords = {c: np.asarray(store.coords(c)) for c in store.chroms}
+    hit = 0
+    miss = 0
+
+    reader = damMer_io.bedgraph(file, chunksize=chunk)
+    for blk in reader:
+        for chrom, grp in blk.groupby('chr', sort=False, observed=True):
+            if chrom not in coords:
+                miss += len(grp)
+                continue
+            c = coords[chrom]
+            mid = (grp['start'].to_numpy() + grp['end'].to_numpy()) / 2
+            idx = np.searchsorted(c[:, 0], mid, side='right') - 1
+            ok = (idx >= 0) & (mid < c[np.maximum(idx, 0), 1])
+            col = store.column(sample, chrom, mode='r+')
+            col[idx[ok]] = grp['score'].to_numpy()[ok]
+            col.flush()
+            del col
+            hit += int(ok.sum())
+            miss += int((~ok).sum())
+
+    return(sample, hit, miss)
+
+def ingester(path, files, threads=4):
+    '''Ingest several '*.bedgraph'-files in parallel & register them.'''
+
+    sys.stdout.write('\n>Ingest into store\n')
+    samples = [sampleName(f) for f in files]
+    with ProcessPoolExecutor(max_workers=threads) as pool:
+        futs = [pool.submit(ingest, path, s, f) for s, f in zip(samples, files)]
+        for fut in futs:
+            s, hit, miss = fut.result()
+            sys.stdout.write('\t' + s + '\t' + str(hit) + ' fragments' + \
+                ('\t(' + str(miss) + ' unassigned)' if miss else '') + '\n')
+    store = Store(path)
+    store.register(samples)
+    return(store)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if os.path.isfile(os.path.join(args.store, 'meta.json')):
+        store = Store(args.store)
+    elif args.gatcfrag:
+        store = creater(args.store, args.gatcfrag)
+    else:
+        sys.exit("\nA new store requires '--gatcfrag'.\n")
+
+    if args.bedgraphs:
+        store = ingester(args.store, args.bedgraphs, args.threads)
+
+    if args.export:
+        sys.stdout.write('\n>Export\n')
+        for s in args.export:
+            if s not in store.samples:
+                sys.exit("\nNot in store:\t" + s + "\n")
+            sys.stdout.write('\t' + store.export(s, s + '.bedgraph', args.bgzip) + '\n')
+
+    sys.stdout.write('\n>Store\n')
+    sys.stdout.write('\tChromosomes:\t' + str(len(store.chroms)) + '\n')
+    sys.stdout.write('\tFragments:\t' + str(sum(store.meta['sizes'].values())) + '\n')
+    sys.stdout.write('\tSamples:\t' + str(len(store.samples)) + '\n')
+    for s in store.samples:
+        sys.stdout.write('\t\t' + s + '\n')
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/local/bin/python3
+'''
+#Submit_slurm-scripts_concurrently:
+python3 damMer_submit.py -n 16 *_damidseq_pipeline_vR.sh
+#Within_'damMer.py'_&_'damMer_tracks.py':
+sub = damMer_submit.Submitter()
+fut = sub.submit('1_cp.sh')
+jobID = sub.collect(sub.submit('2_damidseq_pipeline_vR.sh', after=[fut]))
+'''
+
+import argparse
+import os
+import sys
+import re
+import time
+import random
+import uuid
+import getpass
+import asyncio
+import threading
+from concurrent.futures import Future
+
+transient = re.compile(
+    '(?i)(time[d]? ?out|unable to contact|temporarily unavailable|try again|' + \
+    'connection refused|connection reset|socket|slurm_persist_conn|' + \
+    'communications connection failure|controller.*(busy|not responding))'
+    )
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Concurrent 'sbatch --parsable'-submission with retries."
+        )
+
+    parser.add_argument(
+        "scripts",
+        nargs = '+',
+        type = str,
+        help = "List of slurm-scripts ('*.sh')."
+        )
+    parser.add_argument(
+        "-n", "--inflight",
+        type = int,
+        default = 8,
+        help = "Maximal number of concurrent 'sbatch'-calls."
+        )
+    parser.add_argument(
+        "-d", "--dependency",
+        type = str,
+        default = '',
+        help = "Dependency of all jobs, e.g., 'afterok:<jobID1>:<jobID2>'."
+        )
+    parser.add_argument(
+        "-r", "--retries",
+        type = int,
+        default = 5,
+        help = "Retries of transient controller errors."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+def dependency(dpdIDs, jobIDs, type='afterok'):
+    '''Combine a dependency string with the IDs of awaited jobs.'''
+
+    if not jobIDs:
+        return(dpdIDs)
+    dpd = type + ':' + ':'.join(str(j) for j in jobIDs)
+    return(dpdIDs + ',' + dpd if dpdIDs else dpd)
+
+class Submitter(object):
+    '''
+    Keep a bounded number of 'sbatch --parsable'-calls in flight on an
+    asyncio event loop in a background thread. 'submit()' returns at once
+    with a future of the jobID; transient controller errors are retried
+    with exponential backoff.
+    '''
+
+    def __init__(self, sbatchArgs=(), inflight=8, retries=5, backoff=1.0, onSubmit=None):
+        self.sbatchArgs = list(sbatchArgs)
+        self.retries = retries
+        self.backoff = backoff
+        self.onSubmit = onSubmit
+        self.loop = None
+        self.sem = None
+        self.inflight = inflight
+        self.lock = threading.Lock()
+
+    def configure(self, inflight=None, retries=None, backoff=None):
+        '''Set limits before the first submission.'''
+
+        if inflight is not None:
+            self.inflight = inflight
+        if retries is not None:
+            self.retries = retries
+        if backoff is not None:
+            self.backoff = backoff
+
+    def _start(self):
+        '''Start the event loop thread on first use (from any thread).'''
+
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                async def semaphore():
+                    return(asyncio.Semaphore(self.inflight))
+                self.sem = asyncio.run_coroutine_threadsafe(semaphore(), loop).result()
+                self.loop = loop
+
+    def submit(self, cmdSH, dpdIDs='', after=None, extra=None, cwd=None, onSubmit=None, broker=None):
+        '''
+        Submit 'cmdSH' from 'cwd' (default: the current working directory).
+        dpdIDs should have format: 'afterok:<jobID1>:<jobID2>:etc.';
+        'after' may list futures of jobs to depend on ('afterok');
+        'extra' are 'sbatch'-arguments of this job only (e.g., '--array=0-7');
+        'onSubmit' replaces the hook of the submitter for this job;
+        with a 'damMer_broker.Broker', the job is submitted held & released by it.
+        '''
+
+        self._start()
+        return(asyncio.run_coroutine_threadsafe(
+            self._submit(cmdSH, dpdIDs, list(after) if after else [], \
+                cwd if cwd else os.getcwd(), list(extra or []), onSubmit, broker),
+            self.loop
+            ))
+
+    async def _submit(self, cmdSH, dpdIDs, after, cwd, extra=(), onSubmit=None, broker=None):
+        '''Await dependencies, then call 'sbatch' with retries.'''
+
+        if after:
+            ids = await asyncio.gather(*[asyncio.wrap_future(f) for f in after])
+            dpdIDs = dependency(dpdIDs, ids)
+
+        ##Unique_comment_to_find_the_job_if_'sbatch'_fails_after_submission
+        token = 'damMer-' + uuid.uuid4().hex
+        cmd = ['sbatch', '--parsable', '--comment=' + token] + (['--hold'] if broker else [])
+        if dpdIDs:
+            cmd.append('--dependency=' + dpdIDs)
+        cmd += self.sbatchArgs + list(extra) + [cmdSH]
+
+        tic = time.perf_counter()
+        jobID = None
+        for attempt in range(self.retries + 2):
+            ##Timeouts_may_hide_an_accepted_job:_back_off,_then_no_resubmission_if_queued
+            if attempt:
+                await asyncio.sleep(self.backoff * 2**(attempt - 1) * (1 + random.random()))
+                async with self.sem:
+                    jobID = await self._lookup(token)
+                if jobID or attempt > self.retries:
+                    break
+            async with self.sem:
+                try:
+                    prc = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        cwd = cwd,
+                        stdout = asyncio.subprocess.PIPE,
+                        stderr = asyncio.subprocess.PIPE
+                        )
+                    out, err = await prc.communicate()
+                except OSError as e:
+                    raise RuntimeError("'sbatch' failed:\t" + type(e).__name__ + ': ' + str(e))
+
+                out = out.decode('utf-8').strip()
+                err = err.decode('utf-8').strip()
+                if prc.returncode == 0 and out:
+                    jobID = out.splitlines()[-1].split(';')[0]
+                    break
+                if not transient.search(err):
+                    raise RuntimeError("'sbatch' failed for " + cmdSH + ":\t" + err)
+        if not jobID:
+            raise RuntimeError("'sbatch' failed for " + cmdSH + ":\t" + err)
+        submit_s = time.perf_counter() - tic
+
+        if broker:
+            await asyncio.get_running_loop().run_in_executor(None, broker.register, jobID)
+        hook = onSubmit if onSubmit else self.onSubmit
+        if hook:
+            hook(jobID, cmdSH, submit_s, dpdIDs)
+        return(jobID)
+
+    async def _lookup(self, token):
+        '''JobID of a queued job of the user with comment 'token' (None if absent).'''
+
+        try:
+            prc = await asyncio.create_subprocess_exec(
+                'squeue', '-h', '-u', getpass.getuser(), '-o', '%i|%k',
+                stdout = asyncio.subprocess.PIPE,
+                stderr = asyncio.subprocess.DEVNULL
+                )
+            out, err = await prc.communicate()
+        except OSError:
+            return(None)
+        for l in out.decode('utf-8').splitlines():
+            jobID, sep, comment = l.strip().partition('|')
+            if comment == token:
+                return(jobID.split('_')[0])
+        return(None)
+
+    def collect(self, futs):
+        '''Wait for submissions; jobIDs in order or exit on failure.'''
+
+        single = isinstance(futs, Future)
+        ids = list()
+        for f in ([futs] if single else futs):
+            try:
+                ids.append(f.result())
+            except RuntimeError as e:
+                sys.exit("\nERROR: " + str(e) + "\n")
+        return(ids[0] if single else ids)
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    sub = Submitter(inflight=args.inflight, retries=args.retries)
+    futs = [sub.submit(os.path.abspath(s), args.dependency) for s in args.scripts]
+    for s, jobID in zip(args.scripts, sub.collect(futs)):
+        sys.stdout.write(jobID + '\t' + s + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -7,32 +7,17 @@ import re
 import shlex
 import time
 import shutil
+import errno
 import subprocess
+import damMer_env
+import damMer_context
+import damMer_broker
+import damMer_bgzf
+import damMer_store
+import damMer_qc
 from difflib import SequenceMatcher
 
-shItr = 1
-tmpl = """\
-#!/bin/bash
-#!
-#! Name of the job:
-#SBATCH -J {name}
-#SBATCH --mail-type=END
-#SBATCH -m cyclic:fcyclic
-#SBATCH -N 1
-#SBATCH -n 8
-#SBATCH -p IACT
-#SBATCH --mail-user={mail}
-
-JOBID=$SLURM_JOB_ID
-
-echo -e "JobID: $JOBID\\n======"
-echo "Time: `date`"
-echo "Running on master node: `hostname`"
-echo "Current directory: `pwd`"
-echo -e "\\nExecuting command:\\n==================\\n{SBATCH_CMD}\\n"
-
-eval {SBATCH_CMD}
-"""
+env = damMer_env.Resolver()
 
 ##-----------------##
 ##----Arguments----##
@@ -91,6 +76,11 @@ def parse_args():
         default = "/usr/bin/macs2",
         help = "Path to 'MACS2'."
         )
+    parser.add_argument(
+        "-N", "--native",
+        action = "store_true",
+        help = "Call broad peaks on the GATC-fragment tracks via 'damMer_callpeak.py' instead of MACS2."
+        )
     parser.add_argument(
         "-n", "--quantile",
         type = str,
@@ -109,6 +99,102 @@ def parse_args():
         default = "/usr/bin/bedGraphToBigWig",
         help = "Path to 'bedGraphToBigWig'."
     )
+    parser.add_argument(
+        "-S", "--stream",
+        action = "store_true",
+        help = "Normalize & average chromosome by chromosome via 'damMer_norm.py'."
+        )
+    parser.add_argument(
+        "-z", "--bgzip",
+        action = "store_true",
+        help = "BGZF-compressed & tabix-indexed '*.bedgraph.gz'-files (requires '--stream')."
+        )
+    parser.add_argument(
+        "-X", "--store",
+        action = "store_true",
+        help = "Ingest all '*.gatc.bedgraph'-files into a fragment x sample store."
+        )
+    parser.add_argument(
+        "-g", "--gatcfrag",
+        type = str,
+        default = None,
+        help = "'*.GATC.gff'-file for '--store'."
+        )
+    parser.add_argument(
+        "-A", "--add",
+        action = "store_true",
+        help = "Add new '--repos' to existing track folders (requires '--stream' & '--store')."
+        )
+    parser.add_argument(
+        "-k", "--shards",
+        type = int,
+        default = 0,
+        help = "Normalize & average in a slurm array over this many chromosome shards ('--stream')."
+        )
+    parser.add_argument(
+        "-Q", "--qc",
+        type = str,
+        default = "flag",
+        choices = ["off", "flag", "exclude"],
+        help = "Replicate QC of normalized tracks before averaging: flag or exclude outliers."
+        )
+    parser.add_argument(
+        "-j", "--inflight",
+        type = int,
+        default = 8,
+        help = "Maximal number of concurrent 'sbatch'-calls."
+        )
+    parser.add_argument(
+        "-E", "--envcache",
+        type = str,
+        default = damMer_env.cacheDefault,
+        help = "Cache of resolved tools & indices."
+        )
+    parser.add_argument(
+        "-y", "--policy",
+        type = str,
+        default = "auto",
+        choices = damMer_env.policies,
+        help = "Chosen vs. detected tool: 'auto' asks on a terminal only."
+        )
+    parser.add_argument(
+        "-T", "--scratch",
+        type = str,
+        nargs = '?',
+        const = '${TMPDIR:-/tmp}',
+        default = None,
+        help = "Run MACS2 jobs in node-local scratch (default: '$TMPDIR')."
+        )
+    parser.add_argument(
+        "-R", "--resubmit",
+        type = int,
+        default = 2,
+        help = "Resubmissions of failed jobs with escalated memory or time."
+        )
+    parser.add_argument(
+        "-B", "--broker",
+        type = str,
+        default = os.environ.get('DAMMER_BROKER'),
+        help = "Shared submission broker directory (default: '$DAMMER_BROKER')."
+        )
+    parser.add_argument(
+        "-I", "--priority",
+        type = int,
+        default = 0,
+        help = "Priority of the project's jobs in the submission broker."
+        )
+    parser.add_argument(
+        "-M", "--metrics",
+        type = str,
+        default = None,
+        help = "'*.metrics.jsonl'-file for timing & resource metrics."
+        )
+    parser.add_argument(
+        "-P", "--promfile",
+        type = str,
+        default = None,
+        help = "Prometheus textfile for the node exporter."
+        )
 
     arguments = parser.parse_args()
     return arguments
@@ -117,77 +203,9 @@ def parse_args():
 ##----Functions----##
 ##-----------------##
 
-def checkt(toolPath):
-    '''Checking paths of used tools.'''
-    tool = os.path.basename(toolPath)
-    #logging.info('Checking: ' + tool)
-    sys.stdout.write('\tChecking: '+ tool + '\n')
-
-    if os.path.exists(toolPath):
-        tcho = toolPath
-    else:
-        tcho = ""
-
-    if shutil.which(tool):
-        tdet = shutil.which(tool)
-    else:
-        tdet = ""
-
-    if tcho == tdet and tdet != "" and tcho != "":
-        ##Chosen_&_detected_dirs_exist_and_are_similar
-
-        #logging.info(tool + ' checked: ' + tdet)
-        tuse = tdet
-        return tuse
-
-    elif tcho != tdet and tdet != "" and tcho != "":
-        ##Chosen_&_detected_dirs_exist_but_are_not_similar
-
-        #logging.warning('"' + tcho + '" not default installation: "' + tdet + '"')
-        sys.stdout.write(tcho + '" not default installation: "' + tdet + '"\n')
-
-        while True:
-            desc = input('Use: [1 - ' + tcho + '] or [2 - ' + tdet + ']?\n')
-            if desc == "1" or desc == tcho:
-                tuse = tcho
-                break
-            elif desc == "2" or desc == tdet:
-                tuse = tdet
-                break
-            else:
-                sys.stdout.write('\nNot a valid choice.\n')
-                continue
-
-        #logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho != tdet and tdet != "" and tcho == "":
-        ##Detected_but_not_chosen_dir_exist
-        #logging.warning('"' + toolPath + \
-        #   '" not default installation: "' + tdet + '"')
-        sys.stdout.write(toolPath + \
-            '" not default installation: "' + tdet + '"\n')
-
-        #logging.warning('Not found: ' + toolPath)
-        tuse = tdet
-        #logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho != tdet and tdet == "" and tcho != "":
-        ##Chosen_but_not_detected_dir_exist
-        tuse = tcho
-        #logging.info(tool + ' used: ' + tuse)
-        sys.stdout.write(tool + ' used: ' + tuse + '\n')
-        return tuse
-
-    elif tcho =="" and tdet == "":
-        ##Neither_chosen_nor_detected_dir_exists
-        #logging.error('Not found: ' + toolPath)
-        #logging.error('Not found: ' + tool)
-        sys.exit('Error: Not found: ' + tool + \
-            '\nUse python3 bow2map.py --help.\n')
+def checkt(toolPath, getVersion=False):
+    '''Checking paths of used tools (cached & non-interactive, cf. 'damMer_env.py').'''
+    return(env.tool(toolPath, getVersion))
 
 def checkSl(dirLS, regex):
     '''
@@ -219,32 +237,29 @@ def checkSl(dirLS, regex):
                 sys.stdout.write('\tAll files present.\n')
                 break
 
-def checkFin(jobIDs):
-    '''Check all provided jobIDs are no longer registered by slurm.'''
+def checkFin(ctx, jobIDs):
+    '''
+    Wait until all provided jobIDs finished; failed jobs are
+    resubmitted (cf. 'damMer_retry.py'). Returns failed jobIDs.
+    '''
 
     sys.stdout.write('\tWaiting for cluster.\n')
-    rest = True
-    while rest == True:
-        chk = subprocess.check_output(['squeue', '-h', '-o', '%i'])
-        chk = list(chk.decode("utf-8").strip().split())
-        if not set(jobIDs).intersection(chk):
-            rest = False
-            break
-        else:
-            time.sleep(1)
-            continue
-    sys.stdout.write('\tJob(s) finished.\n')
+    done, failed = ctx.sup.wait(jobIDs)
+    if failed:
+        sys.stdout.write('\tJob(s) failed:\t' + ', '.join(ctx.sup.current(j) for j in failed) + '\n')
+    else:
+        sys.stdout.write('\tJob(s) finished.\n')
+    return(failed)
 
-def checkQue(jobIDs):
-    '''Check if jobs are registered by slurm.'''
+def checkQue(ctx, jobIDs):
+    '''Check if jobs are registered by slurm; failed jobs are resubmitted.'''
 
     sys.stdout.write('\tWaiting for cluster.\n')
-    chk = subprocess.check_output(['squeue', '-h', '-o', '%i'])
-    chk = list(chk.decode("utf-8").strip().split())
-    if set(jobIDs).issubset(chk):
-        sys.stdout.write('\tJob(s) running.\n')
+    done, failed = ctx.sup.check(jobIDs)
+    if failed:
+        sys.stdout.write('\tJob(s) failed:\t' + ', '.join(ctx.sup.current(j) for j in failed) + '\n')
     else:
-        sys.exit("\nOne or more job(s) not running.\n")
+        sys.stdout.write('\tJob(s) running.\n')
 
 def evalDir(path):
     try:
@@ -254,53 +269,21 @@ def evalDir(path):
         if exception.errno != errno.EEXIST:
             raise
 
-def createDir(ori,out,suf,files):
-    '''Create dir & copy '*.bedgraph'-files.'''
+def createDir(ori,out,suf,files,add=False):
+    '''Create dir & copy '*.bedgraph'-files (with 'add' only files not yet present).'''
 
-    dirName = evalDir(os.path.join(ori, str(out + suf)))
+    dirName = os.path.join(ori, str(out + suf))
+    evalDir(dirName)
     sys.stdout.write("\n>Copy '*.bedgraph'-files to " + dirName + '\n')
     for f in files:
+        dst = os.path.join(dirName, os.path.basename(f))
+        if add and (os.path.isfile(dst) or os.path.isfile(dst + '.gz')):
+            continue
         sys.stdout.write('\t' + os.path.basename(f) + '\n')
         shutil.copy2(f, dirName)
 
     return(dirName)
 
-def create_sh(cmd,mailAc):
-    '''OBS! 'dir' as in 'damMer.py' changed to 'os.getcwd()'.'''
-
-    global shItr
-    cmdName = re.compile('\..*').sub('', os.path.basename(cmd.split(" ")[0]))
-    #sys.stdout.write('\tcmdName:\t' + cmdName + "\n")
-    fileName = os.getcwd() + "/" + str(shItr) + "_" + cmdName + ".sh"
-    with open(fileName, 'w') as shOUT:
-        shOUT.write(tmpl.format(name=cmdName, SBATCH_CMD=cmd, mail=mailAc))
-    shItr += 1
-    return(fileName)
-
-def submit(cmdSH, dpdIDs=''):
-    '''dpdIDs should have format: 'afterok:<jobID1>:<jobID2>:etc.' '''
-
-    Sub = "sbatch" + \
-        " --dependency=" + dpdIDs + \
-        " --partition=IACT" + \
-        " -m cyclic:fcyclic" + \
-        " " + cmdSH
-    #sys.stdout.write("\tSubmit:\t" + str(Sub) + "\n")
-    try:
-        prc = subprocess.Popen(
-            shlex.split(Sub),
-            shell = False,
-            stderr = subprocess.PIPE,
-            stdout = subprocess.PIPE
-            )
-    except Exception as e:
-        sys.exit("\nERROR: 'devscript_damMer.py' aborted:\t" + type(e).__name__ + "\n")
-
-    jobID = str(prc.communicate()[0].decode("utf-8").split(" ")[3]).rstrip()
-    #sys.stdout.write("\tjobID:\t" + jobID + "\n")
-
-    return(jobID)
-
 def readlines_reverse(filename):
     '''Retrieve individual lines from file end.'''
 
@@ -367,7 +350,7 @@ def renamer(curDIR, ctrlpre, exppre):
     ##Identify_slurm-file
     ##-------------------
     sl = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if re.compile('^slurm-.*\.out', re.IGNORECASE).search(f)
         ][0]
     #sys.stdout.write('\tslurm file:\t' + sl + '\n')
@@ -384,7 +367,7 @@ def renamer(curDIR, ctrlpre, exppre):
     ##Rename_'dam-ext300.bam'-file
     ##----------------------------
     damFile = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if re.search(dam, f, re.IGNORECASE) \
             and re.compile('.*-ext300.bam').search(f) \
         ][0]
@@ -399,7 +382,7 @@ def renamer(curDIR, ctrlpre, exppre):
     ##Rename 'dam-DamOnly.gatc.bedgraph'
     ##----------------------------------
     damOnlyFile = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if re.search(dam, f, re.IGNORECASE) \
             and re.compile('.*-DamOnly.gatc.bedgraph').search(f) \
         ][0]
@@ -414,7 +397,7 @@ def renamer(curDIR, ctrlpre, exppre):
     ##Rename_'exp-ext300.bam'-file
     ##----------------------------
     expFile = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if not re.search(dam,f, re.IGNORECASE) \
             and re.compile('.*-ext300.bam').search(f)
         ][0]
@@ -436,7 +419,7 @@ def renamer(curDIR, ctrlpre, exppre):
     ##Rename_bedgraph-file
     ##--------------------
     bGF = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if re.compile('^.*-vs-.*\.gatc\.bedgraph').search(f)
         ][0]
     #sys.stdout.write('\tbGF:\t' + bGF + '\n')
@@ -454,7 +437,7 @@ def renamer(curDIR, ctrlpre, exppre):
         str(curDIR + '/' + date + '_' + re.sub('(\..*)$', '', sl) + '.log')
         )
     pi = [
-        f for f in os.listdir() \
+        f for f in os.listdir(curDIR) \
         if re.compile('^pipeline.*').search(f)
         ][0]
     #sys.stdout.write('\tpi:\t' + pi + '\n')
@@ -492,64 +475,159 @@ def peakCalling(macs2,genomeSize,ctrl,*trt):
 
     return(pkc)
 
-def quantNorm(ori,dir,quant,mailAc):
+def nativeCalling(caller,ctrl,*trt):
+    '''
+    Broad peaks on the GATC-fragment tracks via 'damMer_callpeak.py':
+    log2 ratios of the pair or the Dam-only coverage (same names as MACS2).
+    '''
+
+    if trt:
+        pkc = sys.executable + \
+            " " + caller + \
+            " --track " + str(trt[0]) + \
+            " --name " + re.sub('\.gatc\.bedgraph$', '', os.path.basename(str(trt[0])))
+    else:
+        pkc = sys.executable + \
+            " " + caller + \
+            " --coverage" + \
+            " --track " + str(ctrl) + \
+            " --name " + re.sub('\.DamOnly\.gatc\.bedgraph$', '', os.path.basename(str(ctrl)))
+
+    return(pkc)
+
+def quantNorm(ctx,dir,quant,stream=False,bgzip=False,store=None,add=False):
     '''
     Perform Quantile normalization on provided set of *.bedgraph files.
     'quantile_norm_bedgraph.pl'-script erases all trailing 'chr'-indicator.
+    With 'stream', 'damMer_norm.py' holds one chromosome at a time in memory
+    & reads typed columns from 'store' if given; with 'add', only new samples
+    of the store are normalized & added to the average.
     '''
 
     sys.stdout.write("\n>Quantile normalization - '*.gatc.bedgraph' files\n")
-    os.chdir(dir)
-    fs = [f for f in os.listdir() if re.compile('.*\.gatc\.bedgraph').search(f)]
-
-    qna = "perl" + \
-        " " + quant + \
-        " " + ' '.join(fs)
-    qnaSH = create_sh(qna,mailAc)
+    fs = [f for f in os.listdir(dir) if re.compile('.*\.gatc\.bedgraph').search(f)]
+
+    if stream:
+        qna = sys.executable + \
+            " " + quant + \
+            (" --mode add --name " + os.path.basename(dir) if add else " --mode quant") + \
+            (" --bgzip" if bgzip else "") + \
+            (" --store " + store if store else " " + ' '.join(fs))
+    else:
+        qna = "perl" + \
+            " " + quant + \
+            " " + ' '.join(fs)
+    qnaSH = ctx.script(qna, dir)
     #sys.stdout.write("\t" + qnaSH + "\n")
-    qnaID = submit(qnaSH)
+    qnaID = ctx.sub.collect(ctx.submit(qnaSH))
 
-    os.chdir(ori)
     return(qnaID)
 
-def average(ori,dir,aver,mailAc):
-    '''Average provided *.bedgraph files per GATC fragment.'''
+def average(ctx,dir,aver,stream=False,bgzip=False,store=None,keep=None):
+    '''
+    Average provided *.bedgraph files per GATC fragment.
+    With 'keep', only these files (or '<sample>.quant.norm' store columns) are averaged.
+    '''
 
     sys.stdout.write("\n>Averaging - '*.quant.norm.bedgraph' files\n")
-    os.chdir(dir)
-    qGFs = [f for f in os.listdir() if re.compile('.*quant\.norm\.bedgraph').search(f)]
-
-    avg = "perl" + \
-        " " + aver + \
-        " " + ' '.join(qGFs)
-    avgSH = create_sh(avg,mailAc)
+    qGFs = [f for f in os.listdir(dir) if re.compile('.*quant\.norm\.bedgraph(\.gz)?$').search(f)]
+    if keep is not None and not (stream and store):
+        qGFs = [f for f in qGFs if f in keep]
+
+    if stream:
+        avg = sys.executable + \
+            " " + aver + \
+            " --mode average" + \
+            " --name " + os.path.basename(dir) + \
+            (" --bgzip" if bgzip else "") + \
+            (" --store " + store if store else "") + \
+            (" " + ' '.join(keep) if store and keep is not None else "") + \
+            ("" if store else " " + ' '.join(qGFs))
+    else:
+        avg = "perl" + \
+            " " + aver + \
+            " " + ' '.join(qGFs)
+    avgSH = ctx.script(avg, dir)
     #sys.stdout.write("\t" + avgSH + "\n")
 
-    avgID = submit(avgSH)
+    avgID = ctx.sub.collect(ctx.submit(avgSH))
 
-    os.chdir(ori)
     return(avgID)
 
-def bwer(ori,dir,chroms,bGTBW,mailAc):
-    '''Convert all '*.quant.norm.*' files into *.bw format.'''
+def sharded(ctx,dir,norm,shards,bgzip=False,store=None):
+    '''
+    Quantile normalization & averaging across nodes: genome-wide rank
+    reference in one job, a slurm array over chromosome shards, then
+    concatenation of the per-chromosome parts.
+    '''
+
+    sys.stdout.write("\n>Sharded normalization & averaging - '*.gatc.bedgraph' files\n")
+    fs = [f for f in os.listdir(dir) if re.compile('.*\.gatc\.bedgraph$').search(f)]
+
+    base = sys.executable + \
+        " " + norm + \
+        " --mode quant" + \
+        " --name " + os.path.basename(dir) + \
+        (" --bgzip" if bgzip else "")
+    prep = base + \
+        " --phase prepare" + \
+        " --shards " + str(shards) + \
+        (" --store " + store if store else " " + ' '.join(fs))
+    shard = base + " --phase shard --shard $SLURM_ARRAY_TASK_ID"
+    cat = base + " --phase concat"
+
+    ##Dependent_jobs_are_cancelled_if_a_previous_phase_fails
+    prepFut = ctx.submit(ctx.script(prep, dir))
+    shardFut = ctx.submit(ctx.script(shard, dir), after=[prepFut],
+        extra=['--array=0-' + str(shards - 1), '--kill-on-invalid-dep=yes'])
+    catFut = ctx.submit(ctx.script(cat, dir), after=[shardFut],
+        extra=['--kill-on-invalid-dep=yes'])
+    jobIDs = ctx.sub.collect([prepFut, shardFut, catFut])
+
+    return(jobIDs)
+
+def qcer(dir,store=None,exclude=False):
+    '''
+    Replicate QC of all normalized tracks ('damMer_qc.py'); report in
+    '<dir>/<folder>.qc.tsv'. With 'exclude', returns the tracks without
+    outliers (None if all pass or all would be excluded).
+    '''
+
+    sys.stdout.write("\n>Replicate QC - '*.quant.norm' tracks\n")
+    rows, tracks = damMer_qc.folder(dir, store)
+    out = [t for t, r in zip(tracks, rows) if r['flags']]
+    if not out or not exclude:
+        return(None)
+    if len(out) == len(tracks):
+        sys.stdout.write('\tAll tracks flagged; averaging all.\n')
+        return(None)
+    for t in out:
+        sys.stdout.write('\tExcluded:\t' + t + '\n')
+    return([t for t in tracks if t not in out])
+
+def bwer(ctx,dir,chroms,bGTBW,files=None):
+    '''Convert all (or the listed) '*.quant.norm.*' files into *.bw format.'''
 
     sys.stdout.write("\n>Convert '*.quant.norm.*'-files into '*.bw'\n")
-    os.chdir(dir)
-    qnGFs = [f for f in os.listdir() if re.compile('.*\.quant\.norm.*').search(f)]
+    qnGFs = [
+        f for f in os.listdir(dir) if re.compile('.*\.quant\.norm.*').search(f) \
+        and not re.compile('\.(tbi|bw)$').search(f) \
+        and (files is None or f in files)
+        ]
 
     jobIDs = list()
     for qnGF in qnGFs:
         bw = bGTBW + \
             " " + qnGF + \
             " " + chroms + \
-            " " + qnGF + ".bw"
-        bwSH = create_sh(bw,mailAc)
+            " " + re.sub('\.gz$', '', qnGF) + ".bw"
+        bwSH = ctx.script(bw, dir)
         #sys.stdout.write("\t" + bwSH + "\n")
 
-        bwID = submit(bwSH)
+        bwID = ctx.submit(bwSH)
         jobIDs.append(bwID)
 
-    os.chdir(ori)
+    jobIDs = ctx.sub.collect(jobIDs)
     return(jobIDs)
 
 ##---------------------##
@@ -560,6 +638,25 @@ def main():
     args = parse_args()
     oriDIR = os.getcwd()
 
+    ##Project_context:_scripts,_submission_&_metrics
+    ##----------------------------------------------
+    ctx = damMer_context.Context(
+        oriDIR, args.feedback, args.scratch,
+        ledger = os.path.join(oriDIR, args.out + ".jobs.jsonl"),
+        retries = args.resubmit,
+        broker = damMer_broker.Broker(args.broker, args.out, args.priority) \
+            if args.broker else None
+        )
+    rec = ctx.rec
+
+    ##Initiate_metrics
+    ##----------------
+    if args.metrics == None:
+        args.metrics = os.path.join(oriDIR, args.out + ".metrics.jsonl")
+    rec.configure('damMer_tracks.py', args.metrics, args.promfile, args.out)
+    ctx.sub.configure(inflight=args.inflight)
+    env.configure(args.envcache, args.policy)
+
     ##Tester----------------------------------------------------------------------------
     # for arg in vars(args):
     #     sys.stdout.write('{arg}:\t{value}\n'.format(arg=arg,value=getattr(args,arg)))
@@ -589,81 +686,149 @@ def main():
         '\tGenomesize:\t' + str(genSize) + '\n'
         )
 
+    if args.bgzip and not args.stream:
+        sys.exit("'--bgzip' requires '--stream'.\n")
+    if args.shards and not args.stream:
+        sys.exit("'--shards' requires '--stream'.\n")
+    if args.store and not args.stream:
+        sys.exit("'--store' requires '--stream'.\n")
+    if args.add and not (args.stream and args.store):
+        sys.exit("'--add' requires '--stream' & '--store'.\n")
+    if args.qc == "exclude" and (args.shards or args.add):
+        sys.exit("'--qc exclude' cannot be used with '--shards' or '--add' (use '--qc flag').\n")
+
+    if args.store and args.gatcfrag == None:
+        inDir = "/mnt/home1/brand/rk565/resources"
+        if args.defaults == "dm6":
+            args.gatcfrag = '/'.join(
+                [inDir, "Ensembl_BDGP6.GATC.mod.gff"]
+            )
+        elif args.defaults == "mm10":
+            args.gatcfrag = '/'.join(
+                [inDir, "bowtie2_GRCm38.ensembl/Mus_musculus.GRCm38.dna.primary_assembly.GATC.gff"]
+            )
+        else:
+            sys.exit('Unsupported species: --defaults=[dm6/mm10].\n')
+
     ##Checking_executables
     ##--------------------
-    sys.stdout.write('\n>Checking executables\n')
-    qnause = checkt(args.quantile)
-    avguse = checkt(args.average)
-    macuse = checkt(args.macs2)
-    bwuse = checkt(args.bgToBw)
+    with rec.stage('checkExecutables'):
+        sys.stdout.write('\n>Checking executables\n')
+        if args.stream:
+            qnause = checkt(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "damMer_norm.py"
+                ))
+            avguse = qnause
+        else:
+            qnause = checkt(args.quantile)
+            avguse = checkt(args.average)
+        if args.native:
+            macuse = checkt(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "damMer_callpeak.py"
+                ))
+        else:
+            macuse = checkt(args.macs2, getVersion=True)
+        bwuse = checkt(args.bgToBw)
+
+    ##Supervise_damidseq_jobs_from_the_ledgers_of_'damMer.py'
+    ##-------------------------------------------------------
+    with rec.stage('superviseDamidseq'):
+        sys.stdout.write("\n>Supervise damidseq jobs\n")
+        repos = [os.path.abspath(r) for r in args.repos]
+        ledgers = set(
+            os.path.join(os.path.dirname(r), os.path.basename(os.path.dirname(r)) + ".jobs.jsonl") \
+                for r in repos
+            )
+        dsqIDs = ctx.sup.adopt(
+            sorted(ledgers),
+            lambda j: os.path.abspath(j['cwd']) in repos and re.search('damidseq', j['sh'])
+            )
+        done, failed = ctx.sup.wait(dsqIDs)
+        for j in failed:
+            drop = os.path.abspath(ctx.sup.jobs[ctx.sup.current(j)]['cwd'])
+            sys.stdout.write('\tDamidseq failed:\t' + drop + '\n')
+            args.repos = [r for r in args.repos if os.path.abspath(r) != drop]
+        if not args.repos:
+            sys.exit('All damidseq jobs failed.\n')
+        sys.stdout.write('\tSupervised:\t' + str(len(dsqIDs)) + ' job(s)\n')
 
     ##Check_presence_of_'slurm-.*\.out'-files
     ##---------------------------------------
     ##Note:Alternative_is_to_check_for_bedgraph-file_presence
     ##Note:Alternative_is_to_search_for_slurm-file_by_jobIDs
-    sys.stdout.write("\n>Checking presence of 'slurm-.*\.out'-files\n")
-    checkSl(args.repos, '^slurm-.*\.out')
+    with rec.stage('waitSlurmFiles'):
+        sys.stdout.write("\n>Checking presence of 'slurm-.*\.out'-files\n")
+        checkSl(args.repos, '^slurm-.*\.out')
 
     ##Check_end_of_job_via_'slurm-*'-files
     ##------------------------------------
     ##Note:alternative_is_to_check_for_last_coord_bedgraph-file/length
-    sys.stdout.write("\n>Check complete 'slurm-.*\.out'-files\n")
-    nov = dict()
-    for fIN in args.repos:
-        sl = [f for f in os.listdir(fIN) if re.compile('^slurm-.*\.out').search(f)][0]
-        nov[os.path.join(fIN,sl)] = False
-
-    sys.stdout.write('\tWaiting for jobs finishing.\n')
-    rast = True
-    while rast == True:
-        for el in [k for k,v in nov.items() if v == False]:
-            nov[el] = screener(el)
-            if not all(value == True for value in nov.values()):
-                #time.sleep(1)
-                continue
-            else:
-                rast = False
-                sys.stdout.write('\tAll jobs finished.\n')
-                break
+    with rec.stage('waitDamidseq'):
+        sys.stdout.write("\n>Check complete 'slurm-.*\.out'-files\n")
+        nov = dict()
+        for fIN in args.repos:
+            sl = [f for f in os.listdir(fIN) if re.compile('^slurm-.*\.out').search(f)][0]
+            nov[os.path.join(fIN,sl)] = False
+
+        sys.stdout.write('\tWaiting for jobs finishing.\n')
+        rast = True
+        while rast == True:
+            for el in [k for k,v in nov.items() if v == False]:
+                nov[el] = screener(el)
+                if not all(value == True for value in nov.values()):
+                    #time.sleep(1)
+                    continue
+                else:
+                    rast = False
+                    sys.stdout.write('\tAll jobs finished.\n')
+                    break
 
     ##Rename_files_in_individual_dirs_&_initiate_peakcalling
     ##------------------------------------------------------
-    sys.stdout.write('\n>Rename files & initiate peak calling\n')
-    bGFs = list()
-    damONs = list()
-    jobIDs = list()
-    for el in args.repos:
-
-        absDIR = os.path.abspath(el)
-        os.chdir(absDIR)
-        sys.stdout.write('\t' + absDIR + '\n')
-
-        nbGF, damOnlyNew, damNew, expNew = renamer(absDIR, args.ctrlpre, args.exppre)
-        bGFs.append(nbGF)
-        damONs.append(damOnlyNew)
-
-        ##Create_peak_calling_commands_&_scripts
-        ##--------------------------------------
-        pcc = peakCalling(macuse,genSize,damNew,expNew)
-        pccSH = create_sh(pcc,args.feedback)
-        pccDO = peakCalling(macuse,genSize,damNew)
-        pccDOSH = create_sh(pccDO,args.feedback)
-
-        ##Submit_peak_calling_scripts
-        ##---------------------------
-        #sys.stdout.write("\tPC_trt-vs-ctrl:\t" + pccSH + "\n")
-        jobID = submit(pccSH)
-        jobIDs.append(jobID)
-        #sys.stdout.write("\tPC_ctrl-alone:\t" + pccDOSH + "\n")
-        jobID = submit(pccDOSH)
-        jobIDs.append(jobID)
-
-        os.chdir(oriDIR)
+    with rec.stage('renameAndPeakCalling'):
+        sys.stdout.write('\n>Rename files & initiate peak calling\n')
+        bGFs = list()
+        damONs = list()
+        jobIDs = list()
+        for el in args.repos:
+
+            absDIR = os.path.abspath(el)
+            sys.stdout.write('\t' + absDIR + '\n')
+
+            nbGF, damOnlyNew, damNew, expNew = renamer(absDIR, args.ctrlpre, args.exppre)
+            bGFs.append(nbGF)
+            damONs.append(damOnlyNew)
+
+            ##Create_peak_calling_commands_&_scripts
+            ##--------------------------------------
+            ##With_'--scratch'_'*.bam'-files_are_staged_&_used_by_name
+            if args.native:
+                pccSH = ctx.script(nativeCalling(macuse,damOnlyNew,nbGF), absDIR)
+                pccDOSH = ctx.script(nativeCalling(macuse,damOnlyNew), absDIR)
+            else:
+                src = os.path.basename if args.scratch else str
+                pcc = peakCalling(macuse,genSize,src(damNew),src(expNew))
+                pccSH = ctx.script(pcc, absDIR, [damNew,expNew])
+                pccDO = peakCalling(macuse,genSize,src(damNew))
+                pccDOSH = ctx.script(pccDO, absDIR, [damNew])
+
+            ##Submit_peak_calling_scripts
+            ##---------------------------
+            #sys.stdout.write("\tPC_trt-vs-ctrl:\t" + pccSH + "\n")
+            jobID = ctx.submit(pccSH)
+            jobIDs.append(jobID)
+            #sys.stdout.write("\tPC_ctrl-alone:\t" + pccDOSH + "\n")
+            jobID = ctx.submit(pccDOSH)
+            jobIDs.append(jobID)
+
+
+        jobIDs = ctx.sub.collect(jobIDs)
 
     #Check_all_peak_calling_jobs_are_queued
     ##-------------------------------------
-    sys.stdout.write("\n>Check peak calling jobs\n")
-    checkQue(jobIDs)
+    with rec.stage('checkQue'):
+        sys.stdout.write("\n>Check peak calling jobs\n")
+        checkQue(ctx, jobIDs)
 
     ##Deduplicate_damONs
     ##------------------
@@ -679,38 +844,90 @@ def main():
 
     ##Create_dirs_&_copy_bedgraph-files
     ##---------------------------------
-    damONDIR = createDir(oriDIR,args.out,"_DamOnly_tracks",subDONs)
-    bGFDIR = createDir(oriDIR,args.out,"_tracks", bGFs)
+    with rec.stage('copyBedgraph'):
+        damONDIR = createDir(oriDIR,args.out,"_DamOnly_tracks",subDONs,args.add)
+        bGFDIR = createDir(oriDIR,args.out,"_tracks", bGFs,args.add)
 
     ##Process_'*.bedgraph'_files
     ##--------------------------
-    ##Quantile_normalize_all_bGFs
-    jobID = quantNorm(oriDIR,bGFDIR,qnause,args.feedback)
-    ##Check_normalization_job_finished
-    checkFin([jobID])
-    ##Average_all_normalized_bGFs
-    jobID = average(oriDIR,bGFDIR,avguse,args.feedback)
-    ##Ensure_all_jobs_are_finished
-    checkFin([jobID])
-    ##Convert_*.bedgraph_files_into_*.bw
-    jobIDs = bwer(oriDIR,bGFDIR,args.chrSize,bwuse,args.feedback)
-    ##Ensure_all_jobs_are_running
-    checkQue(jobIDs)
-
-    ##Process_DamOnly_'*.bedgraph'in_files
-    ##------------------------------------
-    ##Quantile_normalize_all_DamOnlyNew_files
-    jobID = quantNorm(oriDIR,damONDIR,qnause,args.feedback)
-    ##Check_normalization_job_finished
-    checkFin([jobID])
-    ##Average_all_normalized_damONs
-    jobID = average(oriDIR,damONDIR,avguse,args.feedback)
-    ##Ensure_all_jobs_are_running
-    checkFin([jobID])
-    ##Convert_*.bedgraph_files_into_*.bw
-    jobIDs = bwer(oriDIR,damONDIR,args.chrSize,bwuse,args.feedback)
-    ##Ensure_all_jobs_are_running
-    checkQue(jobIDs)
+    for curDIR in [bGFDIR, damONDIR]:
+        fold = os.path.basename(curDIR)
+        store = None
+        news = None
+        ##Ingest_all_bGFs_into_fragment_x_sample_store
+        if args.store:
+            with rec.stage('store', folder=fold):
+                store = os.path.join(curDIR, fold + ".store")
+                if not os.path.isfile(os.path.join(store, 'meta.json')):
+                    damMer_store.creater(store, args.gatcfrag)
+                bGs = [
+                    os.path.join(curDIR, f) for f in sorted(os.listdir(curDIR)) \
+                    if re.compile('.*\.gatc\.bedgraph$').search(f)
+                    ]
+                ##Only_samples_not_yet_in_the_store
+                if args.add:
+                    known = damMer_store.Store(store).samples
+                    bGs = [f for f in bGs if damMer_store.sampleName(f) not in known]
+                    gz = '.gz' if args.bgzip else ''
+                    news = [damMer_store.sampleName(f) + '.gatc.quant.norm.bedgraph' + gz for f in bGs] + \
+                        [fold + '.quant.norm.av.bedgraph' + gz]
+                damMer_store.ingester(store, bGs)
+            if args.add and not bGs:
+                sys.stdout.write('\n>No new samples:\t' + fold + '\n')
+                continue
+        ##Quantile_normalize_all_bGFs
+        if args.add:
+            ##Normalize_new_samples_&_update_average_from_running_sums
+            with rec.stage('add', folder=fold):
+                jobID = quantNorm(ctx,curDIR,qnause,args.stream,args.bgzip,store,add=True)
+                if checkFin(ctx, [jobID]):
+                    continue
+        elif args.shards:
+            ##Normalize_&_average_per_chromosome_shard
+            with rec.stage('sharded', folder=fold):
+                jobIDs = sharded(ctx,curDIR,qnause,args.shards,args.bgzip,store)
+                if checkFin(ctx, jobIDs):
+                    continue
+        else:
+            with rec.stage('quantNorm', folder=fold):
+                jobID = quantNorm(ctx,curDIR,qnause,args.stream,args.bgzip,store)
+                ##Check_normalization_job_finished_(skip_folder_on_failure)
+                if checkFin(ctx, [jobID]):
+                    continue
+        ##Compress_&_index_copied_bGFs
+        if args.bgzip:
+            with rec.stage('bgzip', folder=fold):
+                sys.stdout.write("\n>Compress & index '*.gatc.bedgraph' files\n")
+                for f in os.listdir(curDIR):
+                    if re.compile('.*\.gatc\.bedgraph$').search(f):
+                        sys.stdout.write('\t' + damMer_bgzf.compress(os.path.join(curDIR, f)) + '\n')
+        ##Replicate_QC_of_normalized_bGFs_(exclusion_needs_a_separate_average)
+        keep = None
+        if args.qc != "off":
+            with rec.stage('qc', folder=fold):
+                keep = qcer(curDIR,store if args.stream else None,args.qc == "exclude")
+        ##Average_all_(or_all_kept)_normalized_bGFs
+        if not args.shards and not args.add:
+            with rec.stage('average', folder=fold):
+                jobID = average(ctx,curDIR,avguse,args.stream,args.bgzip,store,keep)
+                ##Ensure_all_jobs_are_finished
+                if checkFin(ctx, [jobID]):
+                    continue
+        ##Convert_*.bedgraph_files_into_*.bw
+        with rec.stage('bigwig', folder=fold):
+            jobIDs = bwer(ctx,curDIR,args.chrSize,bwuse,news)
+            ##Ensure_all_jobs_are_running
+            checkQue(ctx, jobIDs)
+
+    ##Wait_for_the_broker_to_release_all_held_jobs
+    ##--------------------------------------------
+    if ctx.broker:
+        ctx.broker.drain()
+
+    ##Export_metrics_of_finished_jobs
+    ##-------------------------------
+    rec.harvest()
+    rec.close()
 
     sys.stdout.write('\nAll done.\n')
 
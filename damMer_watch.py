@@ -0,0 +1,433 @@
+#!/usr/local/bin/python3
+'''
+#Watch_a_drop_directory_&_process_new_runs_(naming_rule):
+python3 damMer_watch.py -w /data/incoming -o /data/projects -p Cph -c Dam -f me@uni.ac.uk -d "-d dm6"
+#Runs_from_a_sample_sheet_(design_file_of_'damMer.py';_one_run_per_batch):
+python3 damMer_watch.py -w /data/incoming -o /data/projects -p Cph -c Dam -f me@uni.ac.uk -D sheet.tsv
+#Status_of_all_runs:
+python3 damMer_watch.py -w /data/incoming -o /data/projects -p Cph -c Dam --status
+'''
+
+import argparse
+import os
+import sys
+import re
+import json
+import time
+import shlex
+import shutil
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import subprocess
+import damMer
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+##Inotify_events:_file_closed_after_writing_or_moved_into_the_directory
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+##-----------------##
+##----Arguments----##
+##-----------------##
+
+def parse_args():
+    '''Generate parser & define arguments'''
+    parser = argparse.ArgumentParser(
+        description="Watch a drop directory & run 'damMer.py', 'damMer_tracks.py' & 'damMer_peaks.py' on new runs."
+        )
+
+    parser.add_argument(
+        "-w", "--watch",
+        type = str,
+        required = True,
+        help = "Drop directory of new '*.fastq.gz'-files."
+        )
+    parser.add_argument(
+        "-o", "--projects",
+        type = str,
+        required = True,
+        help = "Directory for one project directory per run."
+        )
+    parser.add_argument(
+        "-p", "--exppre",
+        type = str,
+        required = True,
+        help = "Common string in experimental samples."
+        )
+    parser.add_argument(
+        "-c", "--ctrlpre",
+        type = str,
+        required = True,
+        help = "Common string in control Dam-samples."
+        )
+    parser.add_argument(
+        "-D", "--sheet",
+        type = str,
+        default = None,
+        help = "Sample sheet (design file of 'damMer.py'): one run per batch once all its files arrived."
+        )
+    parser.add_argument(
+        "-f", "--feedback",
+        type = str,
+        default = None,
+        help = "Complete mail address to receive slurm feedback."
+        )
+    parser.add_argument(
+        "-n", "--name",
+        type = str,
+        default = "run",
+        help = "Prefix of run names without '--sheet' ('<name>_<date>_<time>')."
+        )
+    parser.add_argument(
+        "-s", "--settle",
+        type = int,
+        default = 900,
+        help = "Seconds without new files before a run starts (without '--sheet')."
+        )
+    parser.add_argument(
+        "-t", "--poll",
+        type = int,
+        default = 60,
+        help = "Seconds between scans (files are complete once unchanged for one scan)."
+        )
+    parser.add_argument(
+        "-d", "--damMer",
+        type = str,
+        default = "",
+        help = "Further arguments of 'damMer.py' (one string)."
+        )
+    parser.add_argument(
+        "-k", "--tracks",
+        type = str,
+        default = "",
+        help = "Further arguments of 'damMer_tracks.py' (one string)."
+        )
+    parser.add_argument(
+        "-x", "--peaks",
+        type = str,
+        default = "",
+        help = "Further arguments of 'damMer_peaks.py' (one string)."
+        )
+    parser.add_argument(
+        "-S", "--status",
+        action = "store_true",
+        help = "Print the status of all runs & exit."
+        )
+    parser.add_argument(
+        "-1", "--once",
+        action = "store_true",
+        help = "Start runs of the files present, wait for them & exit."
+        )
+
+    arguments = parser.parse_args()
+    return arguments
+
+##-----------------##
+##----Functions----##
+##-----------------##
+
+class Watcher(object):
+    '''
+    Completed '*.fastq.gz'-files of a directory: files count as complete
+    once size & modification time are unchanged for at least 'poll' s
+    (scans woken early by inotify do not shorten this).
+    Inotify (Linux, via 'libc') only wakes the scan early; without it,
+    e.g., on network filesystems, the directory is scanned every 'poll' s.
+    '''
+
+    def __init__(self, path, poll=60):
+        self.path = os.path.abspath(path)
+        self.poll = poll
+        self.seen = dict()
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init()
+            if fd >= 0 and libc.inotify_add_watch(
+                    fd, self.path.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        except (OSError, AttributeError, TypeError):
+            self.fd = None
+
+    def wait(self, timeout):
+        '''Sleep until the timeout or a new file event.'''
+
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        r, w, x = select.select([self.fd], [], [], timeout)
+        if r:
+            ##Drain_events_(struct_inotify_event_&_name)
+            buf = os.read(self.fd, 65536)
+            pos = 0
+            while pos + 16 <= len(buf):
+                wd, mask, cookie, n = struct.unpack_from('iIII', buf, pos)
+                pos += 16 + n
+
+    def complete(self):
+        '''Basenames of complete '*.fastq.gz'-files.'''
+
+        done = set()
+        now = dict()
+        t = time.time()
+        for f in os.listdir(self.path):
+            if not re.compile('\.(fastq|fq)\.gz$').search(f) or f.startswith('.'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, f))
+            except OSError:
+                continue
+            ##Size,_modification_time_&_first_scan_they_were_seen_unchanged
+            prev = self.seen.get(f)
+            since = prev[2] if prev and prev[:2] == (st.st_size, st.st_mtime) else t
+            now[f] = (st.st_size, st.st_mtime, since)
+            if t - since >= self.poll:
+                done.add(f)
+        self.seen = now
+        return(done)
+
+def statusPath(projects):
+    return(os.path.join(projects, 'damMer_watch.status.json'))
+
+def statusReader(projects):
+    '''Runs of a projects directory.'''
+
+    try:
+        with open(statusPath(projects), 'r') as inFile:
+            return(json.load(inFile))
+    except (OSError, ValueError):
+        return({'runs': dict()})
+
+def sheetReader(sheet):
+    '''
+    Sample sheet rows ('damMer.designReader()') grouped by batch:
+    {batch: [(exp, ctrl, batch, rep)]} with '-' for missing fields.
+    '''
+
+    rows, annot = damMer.designReader(sheet)
+    groups = dict()
+    for e, c in rows:
+        b, r = annot[e if e is not None else c]
+        groups.setdefault(b if b else 'batch', list()).append(
+            [x if x else '-' for x in (e, c, b, r)]
+            )
+    return(groups)
+
+def grouper(files, exppre, ctrlpre):
+    '''Experiments & controls by naming rule (controls first, as in 'damMer_tracks.py').'''
+
+    ctrls = sorted(f for f in files if re.search(ctrlpre, f, re.IGNORECASE))
+    exps = sorted(f for f in files if f not in ctrls and re.search(exppre, f, re.IGNORECASE))
+    return(exps, ctrls)
+
+class Daemon(object):
+    '''
+    Group completed files of the drop directory into runs, move them into
+    '<projects>/<run>/' & run the three damMer-scripts one after the other
+    (one thread per run). The status of all runs is kept in
+    '<projects>/damMer_watch.status.json'; after a restart, runs interrupted
+    in 'damMer.py' are resumed ('--add'), runs interrupted later are marked
+    failed for manual handling (the later steps are not idempotent).
+    '''
+
+    def __init__(self, args):
+        self.args = args
+        self.projects = os.path.abspath(args.projects)
+        os.makedirs(self.projects, exist_ok=True)
+        self.watcher = Watcher(args.watch, args.poll)
+        self.lock = threading.Lock()
+        self.status = statusReader(self.projects)
+        self.threads = dict()
+        self.last = None
+        self.known = set()
+
+    def update(self, run, **kw):
+        '''Set fields of a run & write the status atomically.'''
+
+        with self.lock:
+            self.status['runs'].setdefault(run, dict()).update(kw, updated=time.strftime('%Y-%m-%d %H:%M:%S'))
+            tmp = statusPath(self.projects) + '.' + str(os.getpid())
+            with open(tmp, 'w') as outFile:
+                json.dump(self.status, outFile, indent=1, sort_keys=True)
+            os.replace(tmp, statusPath(self.projects))
+
+    def ready(self, files):
+        '''New runs from complete files: [(run, experiments, controls, sheet rows)].'''
+
+        args = self.args
+        runs = list()
+        if args.sheet:
+            for batch, rows in sheetReader(args.sheet).items():
+                need = set(os.path.basename(f) for r in rows for f in r[:2] if f not in ['', '-', 'NA'])
+                if batch in self.status['runs'] or not need or not need <= files:
+                    continue
+                exps, ctrls = grouper(need, args.exppre, args.ctrlpre)
+                runs.append((batch, exps, ctrls, rows))
+            return(runs)
+
+        ##Naming_rule:_all_files_once_none_arrived_for_'--settle'_s
+        exps, ctrls = grouper(files, args.exppre, args.ctrlpre)
+        for f in files - set(exps) - set(ctrls) - self.known:
+            sys.stderr.write('WARNING: Neither experiment nor control:\t' + f + '\n')
+        self.known |= files
+        if not exps or not ctrls:
+            return(runs)
+        if self.last is None or time.time() - self.last < args.settle:
+            return(runs)
+        runs.append((args.name + time.strftime('_%Y%m%d_%H%M%S'), exps, ctrls, None))
+        return(runs)
+
+    def launch(self, run, exps, ctrls, rows):
+        '''Move the files of a run into its project directory & start the workflow.'''
+
+        dir = os.path.join(self.projects, run)
+        os.makedirs(dir, exist_ok=True)
+        for f in exps + ctrls:
+            shutil.move(os.path.join(self.watcher.path, f), os.path.join(dir, f))
+        if rows:
+            with open(os.path.join(dir, 'design.tsv'), 'w') as outFile:
+                for r in rows:
+                    outFile.write('\t'.join(
+                        [os.path.join(dir, os.path.basename(r[0])) if r[0] not in ['', '-', 'NA'] else '-',
+                         os.path.join(dir, os.path.basename(r[1])) if r[1] not in ['', '-', 'NA'] else '-'] + \
+                        r[2:4]) + '\n')
+        sys.stdout.write('\n>New run:\t' + run + '\n')
+        for f in exps + ctrls:
+            sys.stdout.write('\t' + f + '\n')
+        self.update(run, dir=dir, experiments=exps, controls=ctrls, design=bool(rows),
+            step='damMer', state='running', started=time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.start(run)
+
+    def start(self, run):
+        t = threading.Thread(target=self.workflow, args=(run,), daemon=True)
+        self.threads[run] = t
+        t.start()
+
+    def commands(self, run, resume=False):
+        '''Command line of each step of a run.'''
+
+        args = self.args
+        r = self.status['runs'][run]
+        dir = r['dir']
+        fb = ['-f', args.feedback]
+        if r['design']:
+            dmr = ['-D', os.path.join(dir, 'design.tsv')]
+        else:
+            dmr = ['-e'] + [os.path.join(dir, f) for f in r['experiments']] + \
+                ['-c'] + [os.path.join(dir, f) for f in r['controls']]
+        dmr += fb + (['--add'] if resume else []) + shlex.split(args.damMer)
+        repos = lambda: sorted(
+            os.path.join(dir, d) for d in os.listdir(dir) \
+            if re.search('-vs-', d) and os.path.isdir(os.path.join(dir, d))
+            )
+        return([
+            ('damMer', lambda: [os.path.join(here, 'damMer.py')] + dmr),
+            ('tracks', lambda: [os.path.join(here, 'damMer_tracks.py'), '-r'] + repos() + \
+                ['-o', run, '-p', args.exppre, '-c', args.ctrlpre] + \
+                fb + shlex.split(args.tracks)),
+            ('peaks', lambda: [os.path.join(here, 'damMer_peaks.py'), '-r'] + repos() + \
+                ['-o', run] + shlex.split(args.peaks))
+            ])
+
+    def workflow(self, run, resume=False):
+        '''Run the steps of a run from its current step; log in '<dir>/<run>.watch.log'.'''
+
+        r = self.status['runs'][run]
+        steps = self.commands(run, resume)
+        names = [s[0] for s in steps]
+        with open(os.path.join(r['dir'], run + '.watch.log'), 'a') as log:
+            for name, cmd in steps[names.index(r['step']):]:
+                self.update(run, step=name, state='running')
+                cmd = [sys.executable] + cmd()
+                log.write('\n>' + ' '.join(shlex.quote(c) for c in cmd) + '\n')
+                log.flush()
+                ret = subprocess.call(cmd, cwd=r['dir'], stdout=log, stderr=subprocess.STDOUT)
+                if ret != 0:
+                    self.update(run, state='failed', code=ret)
+                    sys.stdout.write('\tFailed:\t' + run + ' (' + name + ')\n')
+                    return
+            self.update(run, step='done', state='done', finished=time.strftime('%Y-%m-%d %H:%M:%S'))
+        sys.stdout.write('\tFinished:\t' + run + '\n')
+
+    def scan(self):
+        '''One scan of the drop directory; returns runs started.'''
+
+        files = self.watcher.complete()
+        if files - self.known:
+            self.last = time.time()
+        runs = self.ready(files)
+        for run, exps, ctrls, rows in runs:
+            self.launch(run, exps, ctrls, rows)
+            self.known -= set(exps + ctrls)
+        return(runs)
+
+    def serve(self, once=False):
+        '''Resume interrupted runs, then scan until interrupted (or, with 'once', until idle).'''
+
+        for run, r in self.status['runs'].items():
+            if r.get('state') == 'running' and r.get('step') != 'damMer':
+                self.update(run, state='failed', code='interrupted')
+                sys.stdout.write('\n>Interrupted run (' + r['step'] + '; manual handling):\t' + run + '\n')
+            elif r.get('state') == 'running':
+                sys.stdout.write('\n>Resume run:\t' + run + ' (' + r['step'] + ')\n')
+                t = threading.Thread(target=self.workflow, args=(run, True), daemon=True)
+                self.threads[run] = t
+                t.start()
+        sys.stdout.write('\n>Watching:\t' + self.watcher.path + \
+            (' (inotify)' if self.watcher.fd is not None else ' (polling)') + '\n')
+        if once:
+            self.args.settle = 0
+            self.watcher.complete()
+            time.sleep(self.args.poll)
+            self.scan()
+            for t in list(self.threads.values()):
+                t.join()
+            return
+        while True:
+            self.watcher.wait(self.args.poll)
+            self.scan()
+
+def reporter(status, out=sys.stdout):
+    '''Write the status of all runs.'''
+
+    out.write('\trun\tstate\tstep\tfiles\tstarted\tupdated\n')
+    for run, r in sorted(status['runs'].items()):
+        out.write('\t' + '\t'.join([
+            run, r.get('state', '-'), r.get('step', '-'),
+            str(len(r.get('experiments', [])) + len(r.get('controls', []))),
+            r.get('started', '-'), r.get('updated', '-')
+            ]) + '\n')
+
+##---------------------##
+##----Main_workflow----##
+##---------------------##
+
+def main():
+    args = parse_args()
+
+    if args.status:
+        sys.stdout.write('\n>Runs\n')
+        reporter(statusReader(os.path.abspath(args.projects)))
+        return
+    if not args.feedback:
+        sys.exit("\nMail address for slurm feedback required: '--feedback'.\n")
+
+    daemon = Daemon(args)
+    try:
+        daemon.serve(args.once)
+    except KeyboardInterrupt:
+        sys.stdout.write('\nStopped (runs in \'damMer.py\' are resumed at the next start).\n')
+        return
+
+    sys.stdout.write('\n>Runs\n')
+    reporter(daemon.status)
+    sys.stdout.write('\nAll done.\n')
+
+if __name__ == '__main__':
+    main()
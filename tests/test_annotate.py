@@ -0,0 +1,24 @@
+'''Nearest-TSS annotation of peaks on chromosomes without TSSs.'''
+
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import damMer_annotate
+
+def test_nearest_chromosome_without_tss(tmp_path):
+    pk = tmp_path / 'x.reproPeak'
+    pk.write_text('chr2L\t100\t200\tp1\nchr4\t50\t80\tp2\n')
+    tss = tmp_path / 'tss.bed'
+    tss.write_text('chr2L\t150\t151\tT1\t.\t+\tFBgn1\tg1\tprotein_coding\n')
+
+    tssDF = damMer_annotate.tssReader(str(tss))
+    peaks = damMer_annotate.damMer_io.peaks(str(pk), cols=['chr', 'start', 'end', 'name'])
+    anno = damMer_annotate.annotater(damMer_annotate.indexer(tssDF), tssDF, peaks, 'nearest')
+
+    hit = anno[anno['name'] == 'p1'].iloc[0]
+    miss = anno[anno['name'] == 'p2'].iloc[0]
+    assert (hit['tssID'], hit['distance']) == ('T1', 0)
+    assert (miss['tssChr'], miss['tssStart'], miss['tssEnd'], miss['distance']) == ('.', -1, -1, -1)
+    assert miss['external_gene_name'] == '.'